@@ -7,3 +7,9 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.models  # Import the models to register the signals
+        import api.search  # Keeps the search index in sync
+        import api.notifications  # Registers the notification job handlers
+        import api.documents  # Invalidates cached SweatSheet documents
+        import api.imports  # Registers the bulk import job handler
+        import api.tokens  # Revokes the tokens of deactivated and deleted users
+        import api.profiles  # Writes profile snapshots through on save
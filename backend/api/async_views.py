@@ -0,0 +1,329 @@
+"""Async views, for endpoints that mostly wait.
+
+Served best under ASGI, where one worker interleaves many of these requests;
+under WSGI Django runs each in its own event loop and they behave like
+ordinary views.
+
+Besides the token endpoint there are async variants of the hot reads under
+``/api/async/``: inbox, message list, profile, calendar and SweatSheet
+detail. They answer like their DRF counterparts in ``api.views`` but query
+through the async ORM, so a worker keeps serving other requests while one
+waits on the database. The message list can also wait for new messages
+(``?after=<id>&wait=<seconds>``), holding the request open for up to
+``LONG_POLL_MAX_WAIT`` seconds at the cost of an idle coroutine instead of
+a worker thread. A waiting request watches the conversation's marker in the
+``LONG_POLL_CACHE_ALIAS`` cache, ``conversations:changed:<id>``, which
+posting a message bumps, and only queries the database when it changes or,
+in case the change happened in a process that does not share the cache,
+every ``LONG_POLL_RECHECK`` seconds.
+
+Requests are authenticated from the access token alone; the user's profile
+snapshot (see api.profiles) provides the active flag and role, which are at
+most ``PROFILE_AUTH_SECONDS`` old, so a warm request usually costs no query
+for the user.
+"""
+import asyncio
+import functools
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User, update_last_login
+from django.core.cache import caches
+from django.db.models import Count, OuterRef, Subquery
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from . import documents, hashers, profiles, renderers, trees
+from .models import Calendar, Conversation, Message, MessageRead, SweatSheet
+from .serializers import SweatSheetSerializer
+
+# Same representation as the serializers' DateTimeFields
+_datetime = serializers.DateTimeField().to_representation
+
+CHANGED_PREFIX = 'conversations:changed:'
+
+
+def _changes():
+    return caches[settings.LONG_POLL_CACHE_ALIAS]
+
+
+def conversation_changed(conversation_id, message_id):
+    """Wake the requests waiting on the conversation; call once the message is committed"""
+    _changes().set(f'{CHANGED_PREFIX}{conversation_id}', message_id, timeout=2 * settings.LONG_POLL_MAX_WAIT)
+
+
+def _credentials(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None, JsonResponse({"detail": "JSON parse error"}, status=400)
+        if not isinstance(data, dict):
+            return None, JsonResponse({"detail": "Expected a JSON object"}, status=400)
+    else:
+        data = request.POST
+    errors = {
+        field: ["This field is required."]
+        for field in (User.USERNAME_FIELD, 'password')
+        if not isinstance(data.get(field), str) or not data.get(field)
+    }
+    if errors:
+        return None, JsonResponse(errors, status=400)
+    return (data[User.USERNAME_FIELD], data['password']), None
+
+
+@csrf_exempt
+@require_POST
+async def obtain_token_pair(request):
+    """``POST /api/token/`` as an async view: same request and response as
+    simplejwt's ``TokenObtainPairView``, but the password is checked on the
+    hashing threads (see api.hashers) instead of blocking the worker"""
+    credentials, error = _credentials(request)
+    if error is not None:
+        return error
+    username, password = credentials
+
+    user = await User.objects.filter(**{User.USERNAME_FIELD: username}).afirst()
+    # An unknown user still costs one hash, so response times do not reveal usernames
+    encoded = user.password if user is not None else UNUSABLE_PASSWORD_PREFIX
+    is_correct, must_update = await hashers.averify_password(password, encoded)
+    if not is_correct or not api_settings.USER_AUTHENTICATION_RULE(user):
+        return JsonResponse(
+            {"detail": "No active account found with the given credentials", "code": "no_active_account"},
+            status=401,
+        )
+    if must_update:
+        # Rehash with the current hasher and costs, as check_password() does
+        user.password = await hashers.amake_password(password)
+        await User.objects.filter(pk=user.pk).aupdate(password=user.password)
+
+    refresh = await sync_to_async(TokenObtainPairSerializer.get_token)(user)
+    if api_settings.UPDATE_LAST_LOGIN:
+        await sync_to_async(update_last_login)(None, user)
+    return JsonResponse({"refresh": str(refresh), "access": str(refresh.access_token)})
+
+
+def _json(data, status=200):
+    return HttpResponse(renderers.dumps(data), content_type='application/json', status=status)
+
+
+def authenticated(view):
+    """Authenticate an async view from the bearer access token, calling it
+    as ``view(request, snapshot, ...)`` with the user's profile snapshot"""
+    authentication = JWTStatelessUserAuthentication()
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = authentication.authenticate(request)
+            if result is None:
+                raise AuthenticationFailed('Authentication credentials were not provided.')
+            try:
+                snapshot = await profiles.aget(result[0].pk)
+            except User.DoesNotExist:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            if not snapshot.is_active:
+                raise AuthenticationFailed('User is inactive', code='user_inactive')
+        except AuthenticationFailed as error:
+            detail = error.detail if isinstance(error.detail, dict) else {'detail': error.detail}
+            response = JsonResponse(detail, status=401)
+            response.headers['WWW-Authenticate'] = authentication.authenticate_header(request)
+            return response
+        return await view(request, snapshot, *args, **kwargs)
+    return wrapper
+
+
+def _name(first_name, last_name, username):
+    return f"{first_name} {last_name}".strip() or username
+
+
+@require_GET
+@authenticated
+async def inbox(request, snapshot):
+    """``GET /api/conversations/``: the user's active conversations with their
+    last message, unread count and participants, in four queries"""
+    user_id = snapshot.user_id
+    conversations = [
+        conversation async for conversation in Conversation.objects.filter(
+            participants=user_id, is_active=True
+        ).distinct().annotate(
+            last_message_id=Subquery(
+                Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at').values('id')[:1]
+            )
+        ).values('id', 'conversation_type', 'title', 'updated_at', 'last_message_id')
+    ]
+    ids = [conversation['id'] for conversation in conversations]
+
+    participants = {}
+    async for conversation_id, *user in Conversation.participants.through.objects.filter(
+        conversation_id__in=ids
+    ).order_by('user_id').values_list(
+        'conversation_id', 'user_id', 'user__username', 'user__first_name', 'user__last_name'
+    ):
+        participants.setdefault(conversation_id, []).append(user)
+
+    last_messages = {
+        message[0]: message async for message in Message.objects.filter(
+            id__in=[conversation['last_message_id'] for conversation in conversations if conversation['last_message_id']]
+        ).values_list(
+            'id', 'content', 'created_at', 'message_type',
+            'sender__username', 'sender__first_name', 'sender__last_name'
+        )
+    }
+
+    unread = {
+        row['conversation_id']: row['count'] async for row in Message.objects.filter(
+            conversation_id__in=ids
+        ).exclude(sender_id=user_id).exclude(read_by__user_id=user_id).order_by().values(
+            'conversation_id'
+        ).annotate(count=Count('id'))
+    }
+
+    data = []
+    for conversation in conversations:
+        members = participants.get(conversation['id'], [])
+        other_participant = None
+        if conversation['conversation_type'] == 'DIRECT':
+            other = next((member for member in members if member[0] != user_id), None)
+            if other:
+                other_participant = {'id': other[0], 'username': other[1], 'name': _name(other[2], other[3], other[1])}
+        last_message = last_messages.get(conversation['last_message_id'])
+        if last_message:
+            message_id, content, created_at, message_type, username, first_name, last_name = last_message
+            last_message = {
+                'id': message_id,
+                'content': content,
+                'sender_name': _name(first_name, last_name, username),
+                'created_at': created_at,
+                'message_type': message_type,
+            }
+        data.append({
+            'id': conversation['id'],
+            'conversation_type': conversation['conversation_type'],
+            'title': conversation['title'],
+            'updated_at': _datetime(conversation['updated_at']),
+            'last_message': last_message,
+            'other_participant': other_participant,
+            'unread_count': unread.get(conversation['id'], 0),
+            'participant_names': [_name(first_name, last_name, username) for _, username, first_name, last_name in members],
+        })
+    return _json(data)
+
+
+async def _messages(conversation_id, user_id, after):
+    messages = Message.objects.filter(conversation_id=conversation_id, is_deleted=False)
+    if after is not None:
+        messages = messages.filter(id__gt=after)
+    messages = [message async for message in messages.select_related('sender')]
+    if not messages:
+        return []
+    read = {
+        message_id async for message_id in MessageRead.objects.filter(
+            user_id=user_id, message_id__in=[message.id for message in messages]
+        ).values_list('message_id', flat=True)
+    }
+    return [
+        {
+            'id': message.id,
+            'sender': {
+                'id': message.sender.id,
+                'username': message.sender.username,
+                'first_name': message.sender.first_name,
+                'last_name': message.sender.last_name,
+            },
+            'message_type': message.message_type,
+            'content': message.content,
+            'file_url': message.file_url,
+            'created_at': _datetime(message.created_at),
+            'edited_at': _datetime(message.edited_at) if message.edited_at else None,
+            'is_edited': message.is_edited,
+            'is_deleted': message.is_deleted,
+            'is_read': message.id in read,
+        }
+        for message in messages
+    ]
+
+
+@require_GET
+@authenticated
+async def message_list(request, snapshot, conversation_id):
+    """``GET /api/conversations/<id>/messages/``, newest first.
+
+    ``after=<message id>`` only returns newer messages, and with
+    ``wait=<seconds>`` the request waits for one to arrive when there is
+    none yet, looking at the conversation's marker every
+    ``LONG_POLL_INTERVAL`` seconds.
+    """
+    try:
+        after = int(request.GET['after']) if 'after' in request.GET else None
+        wait = max(0.0, min(float(request.GET.get('wait', 0)), settings.LONG_POLL_MAX_WAIT))
+    except ValueError:
+        return JsonResponse({"error": "after must be a message id and wait a number of seconds"}, status=400)
+    if wait > 0 and after is None:
+        return JsonResponse({"error": "wait requires after"}, status=400)
+
+    if not await Conversation.objects.filter(id=conversation_id, participants=snapshot.user_id).aexists():
+        return _json([])
+    deadline = time.monotonic() + wait
+    changed_key = f'{CHANGED_PREFIX}{conversation_id}'
+    # Read before querying, so a message committed in between is not missed
+    marker = await _changes().aget(changed_key)
+    while True:
+        messages = await _messages(conversation_id, snapshot.user_id, after)
+        queried = time.monotonic()
+        if messages or queried >= deadline:
+            return _json(messages)
+        while True:
+            await asyncio.sleep(min(settings.LONG_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+            now = time.monotonic()
+            latest = await _changes().aget(changed_key)
+            if latest != marker or now >= deadline or now - queried >= settings.LONG_POLL_RECHECK:
+                marker = latest
+                break
+
+
+@require_GET
+@authenticated
+async def profile(request, snapshot):
+    """``GET /api/profile/``, straight from the snapshot"""
+    return HttpResponse(snapshot.body, content_type='application/json', headers={'ETag': snapshot.etag})
+
+
+@require_GET
+@authenticated
+async def calendar(request, snapshot):
+    """``GET /api/calendar/``"""
+    calendar = await Calendar.objects.afor_user_id(snapshot.user_id)
+    return _json({'events': calendar.events})
+
+
+def _render_sweat_sheet(sweat_sheet_id):
+    return renderers.dumps(SweatSheetSerializer(trees.with_tree(SweatSheet.objects).get(pk=sweat_sheet_id)).data)
+
+
+@require_GET
+@authenticated
+async def sweat_sheet_detail(request, snapshot, pk):
+    """``GET /api/sweatsheets/<id>/``: the cached document from api.documents;
+    rendering a missing one runs on a thread"""
+    if snapshot.role in ('PRO', 'SWEAT_TEAM_MEMBER'):
+        visible = SweatSheet.objects.filter(user_id=snapshot.user_id)
+    else:
+        visible = SweatSheet.objects.filter(assigned_to_id=snapshot.user_id)
+    sweat_sheet = await visible.filter(pk=pk).values('id', 'template_id').afirst()
+    if sweat_sheet is None:
+        return JsonResponse({"detail": "No SweatSheet matches the given query."}, status=404)
+    document = await sync_to_async(documents.get_or_render)(
+        sweat_sheet['id'], sweat_sheet['template_id'],
+        functools.partial(_render_sweat_sheet, sweat_sheet['id']),
+    )
+    return HttpResponse(document, content_type='application/json')
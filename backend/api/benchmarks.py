@@ -0,0 +1,685 @@
+"""Benchmark suite run by ``manage.py benchmark``.
+
+Every benchmark runs inside a throwaway test database created by the
+command, so it never touches development data. Register a benchmark with
+the ``@benchmark`` decorator; it receives a ``Report`` used to print
+results and the ``scale`` factor passed on the command line.
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+
+from .models import Note, WorkoutCategory, WorkoutExercise, SweatSheet, Exercise
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function under ``name``"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class Report:
+    def __init__(self, command):
+        self.stdout = command.stdout
+        self.style = command.style
+
+    def line(self, message):
+        self.stdout.write(message)
+
+    def timings(self, label, samples):
+        """Print latency percentiles for a list of durations in seconds"""
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        self.stdout.write(
+            f'{label}: n={len(ordered)} '
+            f'p50={statistics.median(ordered) * 1000:.2f}ms '
+            f'p95={p95 * 1000:.2f}ms '
+            f'max={ordered[-1] * 1000:.2f}ms'
+        )
+        return p95
+
+    def check(self, label, ok):
+        style = self.style.SUCCESS if ok else self.style.ERROR
+        self.stdout.write(style(f'{label}: {"PASS" if ok else "FAIL"}'))
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+VOCABULARY = [
+    'squat', 'deadlift', 'bench', 'press', 'row', 'pull', 'push', 'lunge', 'plank',
+    'sprint', 'tempo', 'mobility', 'hip', 'hinge', 'core', 'shoulder', 'knee', 'ankle',
+    'stretch', 'recovery', 'strength', 'power', 'endurance', 'hypertrophy', 'deload',
+    'warmup', 'cooldown', 'superset', 'circuit', 'interval', 'cardio', 'agility',
+    'balance', 'grip', 'posture', 'glute', 'hamstring', 'quad', 'calf', 'lat', 'tricep',
+    'bicep', 'overhead', 'kettlebell', 'dumbbell', 'barbell', 'band', 'sled', 'rower',
+    'bike', 'swim', 'jump', 'box', 'hurdle', 'carry', 'farmer', 'rotation', 'anti',
+    'offseason', 'preseason', 'taper', 'peak', 'volume', 'intensity', 'technique',
+]
+
+
+def _zipf_words(rng, count):
+    # Skewed word choice so a few terms are very common, like real text
+    return ' '.join(
+        VOCABULARY[min(int(rng.paretovariate(1.2)) - 1, len(VOCABULARY) - 1)]
+        if rng.random() < 0.7 else rng.choice(VOCABULARY)
+        for _ in range(count)
+    )
+
+
+@benchmark('search')
+def search_benchmark(report, scale):
+    """Ranked search latency over a 100k-document index"""
+    from . import search
+
+    rng = random.Random(26)
+    documents = int(100_000 * scale)
+    notes = documents * 6 // 10
+    catalog = documents * 3 // 10
+    sheets = documents - notes - catalog
+
+    users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(100)])
+    category = WorkoutCategory.objects.create(name='Benchmark')
+    Note.objects.bulk_create([
+        Note(
+            title=_zipf_words(rng, 4),
+            content=_zipf_words(rng, 40),
+            author=users[i % len(users)],
+        )
+        for i in range(notes)
+    ], batch_size=search.BATCH_SIZE)
+    WorkoutExercise.objects.bulk_create([
+        # Names are unique per category
+        WorkoutExercise(category=category, name=f'{_zipf_words(rng, 3)} {i}', description=_zipf_words(rng, 20))
+        for i in range(catalog)
+    ], batch_size=search.BATCH_SIZE)
+    SweatSheet.objects.bulk_create([
+        SweatSheet(
+            name=_zipf_words(rng, 4),
+            user=users[i % 10],
+            assigned_to=users[10 + i % 90],
+            is_template=i % 20 == 0,
+        )
+        for i in range(sheets)
+    ], batch_size=search.BATCH_SIZE)
+
+    elapsed, total = timed(search.rebuild)
+    report.line(f'Indexed {total} documents in {elapsed:.2f}s')
+
+    # Incremental maintenance cost through the signal path
+    samples = []
+    for i in range(200):
+        duration, _ = timed(Note.objects.create, title=_zipf_words(rng, 4),
+                            content=_zipf_words(rng, 40), author=users[i % len(users)])
+        samples.append(duration)
+    report.timings('Note create + index', samples)
+
+    queries = [' '.join(rng.sample(VOCABULARY, rng.randint(1, 3))) for _ in range(300)]
+    for query in queries[:20]:
+        search.search(users[0], query)  # Warm caches
+
+    samples = []
+    for i, query in enumerate(queries):
+        duration, _ = timed(search.search, users[i % len(users)], query)
+        samples.append(duration)
+    p95 = report.timings('Search', samples)
+    report.check('Search p95 under 50ms', p95 < 0.05)
+
+
+TREE_TABLES = ('api_sweatsheet', 'api_phase', 'api_section', 'api_exercise',
+               'api_exerciseoverride', 'api_phaseoverride')
+
+
+def _tree_storage():
+    """(rows, bytes) held by the SweatSheet tree tables; bytes only on SQLite"""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        rows = 0
+        for table in TREE_TABLES:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            rows += cursor.fetchone()[0]
+        if connection.vendor != 'sqlite':
+            return rows, None
+        placeholders = ', '.join(['%s'] * len(TREE_TABLES))
+        cursor.execute(
+            'SELECT SUM(d.pgsize) FROM dbstat d JOIN sqlite_master m ON m.name = d.name '
+            f'WHERE m.tbl_name IN ({placeholders})',
+            TREE_TABLES,
+        )
+        return rows, cursor.fetchone()[0] or 0
+
+
+def _storage_delta(before, after):
+    rows = after[0] - before[0]
+    size = after[1] - before[1] if after[1] is not None else None
+    return rows, size
+
+
+def _describe_storage(rows, size):
+    return f'{rows} rows' + (f', {size / 1024:.0f} KiB' if size is not None else '')
+
+
+def _benchmark_template(rng, pro):
+    """A 200-exercise template (4 phases x 5 sections x 10 exercises)"""
+    from datetime import date, timedelta
+    from . import trees
+
+    category = WorkoutCategory.objects.create(name='Benchmark')
+    workouts = WorkoutExercise.objects.bulk_create([
+        WorkoutExercise(category=category, name=f'Workout {i}') for i in range(20)
+    ])
+    template = SweatSheet.objects.create(name='Template', user=pro, is_template=True)
+    trees.create_tree(template, [
+        {'phase_number': phase, 'sections': [
+            {'section_number': section, 'date': date.today() + timedelta(days=section), 'exercises': [
+                {'workout_category_id': category.id, 'specific_workout_id': rng.choice(workouts).id,
+                 'sets': '3', 'reps': '10', 'weight': ''}
+                for _ in range(10)
+            ]}
+            for section in range(1, 6)
+        ]}
+        for phase in range(1, 5)
+    ])
+    template.refresh_from_db()
+    exercise_ids = list(
+        Exercise.objects.filter(section__phase__sweat_sheet=template).values_list('id', flat=True)
+    )
+    return template, exercise_ids
+
+
+@benchmark('template_instances')
+def template_instances_benchmark(report, scale):
+    """Storage and read cost of 1,000 assignments of a 200-exercise template"""
+    from . import progress, trees
+    from .serializers import SweatSheetSerializer
+
+    rng = random.Random(33)
+    assignments = max(int(1000 * scale), 1)
+    pro = User.objects.create(username='bench-pro')
+    template, exercise_ids = _benchmark_template(rng, pro)
+    report.line(f'Template: {len(exercise_ids)} exercises, {assignments} assignments per mode')
+    athletes = User.objects.bulk_create([User(username=f'athlete{i}') for i in range(assignments * 2)])
+
+    # Copy-on-write instances
+    before = _tree_storage()
+    elapsed, instances = timed(trees.instantiate, template, athletes[:assignments])
+    instanced = _storage_delta(before, _tree_storage())
+    report.line(f'Instantiate: {elapsed:.2f}s, {_describe_storage(*instanced)}')
+
+    # Full copies, as assignment used to store them
+    before = _tree_storage()
+    copies = []
+
+    def copy_all():
+        for athlete in athletes[assignments:]:
+            sheet = SweatSheet.objects.create(name=template.name, user=pro, assigned_to=athlete)
+            trees.copy_tree(template, sheet)
+            copies.append(sheet)
+    elapsed, _ = timed(copy_all)
+    copied = _storage_delta(before, _tree_storage())
+    report.line(f'Copy: {elapsed:.2f}s, {_describe_storage(*copied)}')
+
+    # Athletes work through 30% of their program
+    done = exercise_ids[:len(exercise_ids) * 3 // 10]
+    before = _tree_storage()
+    for instance in instances:
+        progress.set_instance_exercises_completed(instance, done)
+    instanced_progress = _storage_delta(before, _tree_storage())
+    for sheet in copies:
+        copy_ids = Exercise.objects.filter(section__phase__sweat_sheet=sheet).order_by('id')[:len(done)]
+        progress.set_exercises_completed(Exercise.objects.filter(id__in=list(copy_ids.values_list('id', flat=True))))
+    report.line(f'Completing 30%: instances add {_describe_storage(*instanced_progress)}, copies add 0 rows')
+
+    unit = 1 if copied[1] is None else 0
+    ratio = instanced[unit] / copied[unit] if copied[unit] else 0.0
+    ratio_with_progress = (instanced[unit] + instanced_progress[unit]) / copied[unit] if copied[unit] else 0.0
+    report.line(
+        f'Instances use {ratio:.1%} of the copy storage fresh, '
+        f'{ratio_with_progress:.1%} at 30% completion'
+    )
+    report.check('Fresh instances under 10% of copy storage', ratio < 0.10)
+
+    # Reading an assigned sheet: merged template vs own tree
+    queryset = trees.with_tree(SweatSheet.objects)
+    for label, sheets in (('Detail read (instance)', instances), ('Detail read (copy)', copies)):
+        samples = []
+        for sheet in rng.sample(sheets, min(100, len(sheets))):
+            duration, _ = timed(lambda: SweatSheetSerializer(queryset.get(pk=sheet.pk)).data)
+            samples.append(duration)
+        report.timings(label, samples)
+
+
+@benchmark('completion_bitsets')
+def completion_bitsets_benchmark(report, scale):
+    """Toggle and progress reads on instance bitsets vs per-row completion"""
+    from django.db.models import Count, Q
+    from . import bitsets, progress, trees
+
+    rng = random.Random(34)
+    assignments = max(int(200 * scale), 1)
+    pro = User.objects.create(username='bench-pro')
+    template, exercise_ids = _benchmark_template(rng, pro)
+    athletes = User.objects.bulk_create([User(username=f'athlete{i}') for i in range(assignments * 2)])
+    instances = trees.instantiate(template, athletes[:assignments])
+    copies = []
+    for athlete in athletes[assignments:]:
+        sheet = SweatSheet.objects.create(name=template.name, user=pro, assigned_to=athlete)
+        trees.copy_tree(template, sheet)
+        copies.append(sheet)
+    copy_exercises = {
+        sheet.id: list(Exercise.objects.filter(section__phase__sweat_sheet=sheet).values_list('id', flat=True))
+        for sheet in copies
+    }
+
+    toggles = {'Toggle (bitset)': [], 'Toggle (rows)': []}
+    for _ in range(500):
+        index = rng.randrange(len(exercise_ids))
+        completed = rng.random() < 0.7
+        instance = rng.choice(instances)
+        duration, _ = timed(progress.set_instance_exercises_completed, instance, [exercise_ids[index]], completed)
+        toggles['Toggle (bitset)'].append(duration)
+        sheet = rng.choice(copies)
+        duration, _ = timed(
+            progress.set_exercises_completed,
+            Exercise.objects.filter(pk=copy_exercises[sheet.id][index]), completed
+        )
+        toggles['Toggle (rows)'].append(duration)
+    for label, samples in toggles.items():
+        report.timings(label, samples)
+
+    def bitset_progress(instance):
+        return bitsets.count(progress.completion(instance))
+
+    def row_progress(sheet):
+        return Exercise.objects.filter(section__phase__sweat_sheet=sheet).aggregate(
+            total=Count('id'), completed=Count('id', filter=Q(completed=True))
+        )
+
+    def row_completed_set(sheet):
+        return set(
+            Exercise.objects.filter(section__phase__sweat_sheet=sheet, completed=True)
+            .values_list('id', flat=True)
+        )
+
+    reads = (
+        ('Progress read (bitset popcount)', bitset_progress, instances),
+        ('Progress read (row aggregate)', row_progress, copies),
+        ('Completed set read (bitset)', progress.completed_exercise_ids, instances),
+        ('Completed set read (rows)', row_completed_set, copies),
+    )
+    for label, read, sheets in reads:
+        samples = [timed(read, rng.choice(sheets))[0] for _ in range(300)]
+        report.timings(label, samples)
+
+    sizes = [len(progress.completion(instance)) for instance in instances]
+    report.line(f'Completion bitset size: max {max(sizes)} bytes for {len(exercise_ids)} exercises')
+    consistent = all(
+        bitsets.count(progress.completion(instance)) == SweatSheet.objects.get(pk=instance.pk).completed_exercises
+        for instance in instances
+    )
+    report.check('Instance rollups match bitset popcounts', consistent)
+
+
+@benchmark('sweatsheet_documents')
+def sweatsheet_documents_benchmark(report, scale):
+    """Cold vs warm ``GET /api/sweatsheets/<id>/`` of 200-exercise sheets"""
+    from rest_framework.test import APIClient
+    from . import documents, trees
+
+    rng = random.Random(35)
+    sheets = max(int(50 * scale), 1)
+    pro = User.objects.create(username='bench-pro')
+    template, _ = _benchmark_template(rng, pro)
+    # Created one by one so the signals give each athlete a profile
+    athletes = [User.objects.create(username=f'athlete{i}') for i in range(sheets)]
+    assigned = trees.instantiate(template, athletes[:sheets // 2])
+    for athlete in athletes[sheets // 2:]:
+        sheet = SweatSheet.objects.create(name=template.name, user=pro, assigned_to=athlete)
+        trees.copy_tree(template, sheet)
+        assigned.append(sheet)
+    report.line(f'{len(assigned)} assigned sheets of 200 exercises, half of them template instances')
+
+    clients = {}
+    for sheet in assigned:
+        clients[sheet.id] = APIClient()
+        clients[sheet.id].force_authenticate(sheet.assigned_to)
+
+    def get(sheet):
+        return clients[sheet.id].get(f'/api/sweatsheets/{sheet.id}/').content
+
+    cold, warm = [], []
+    bodies = {}
+    mismatched = 0
+    for _ in range(3):
+        for sheet in assigned:
+            documents.invalidate([sheet.id])
+            duration, bodies[sheet.id] = timed(get, sheet)
+            cold.append(duration)
+    for _ in range(3):
+        for sheet in rng.sample(assigned, len(assigned)):
+            duration, body = timed(get, sheet)
+            warm.append(duration)
+            mismatched += body != bodies[sheet.id]
+    cold_p95 = report.timings('Detail GET (cold, rendered)', cold)
+    warm_p95 = report.timings('Detail GET (warm, cached)', warm)
+    report.line(f'Warm p95 is {cold_p95 / warm_p95:.1f}x faster than cold')
+    report.check('Cached documents match freshly rendered ones', not mismatched)
+    report.check('Warm reads at least 5x faster than cold at p95', cold_p95 >= 5 * warm_p95)
+
+
+@benchmark('json_rendering')
+def json_rendering_benchmark(report, scale):
+    """Render and parse throughput of DRF's JSON renderer/parser vs api.renderers"""
+    import io
+    import uuid
+    from datetime import datetime, timezone as dt_timezone
+    from decimal import Decimal
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from . import renderers, trees
+    from .models import Conversation, Message
+    from .serializers import SweatSheetSerializer, MessageSerializer, TeamUserSerializer
+
+    rng = random.Random(36)
+    pro = User.objects.create(username='bench-pro')
+    template, _ = _benchmark_template(rng, pro)
+    # Created one by one so the signals give each user a profile
+    users = [User.objects.create(username=f'user{i}', first_name='Ath', last_name=f'Lete {i}')
+             for i in range(max(int(1000 * scale), 1))]
+    conversation = Conversation.objects.create()
+    Message.objects.bulk_create([
+        Message(conversation=conversation, sender=rng.choice(users), content=' '.join(_zipf_words(rng, 20)))
+        for _ in range(max(int(500 * scale), 1))
+    ])
+
+    payloads = {
+        'SweatSheet tree': SweatSheetSerializer(trees.with_tree(SweatSheet.objects).get(pk=template.pk)).data,
+        'Message page': MessageSerializer(
+            Message.objects.filter(conversation=conversation).select_related('sender'), many=True
+        ).data,
+        'User directory': TeamUserSerializer(User.objects.select_related('profile'), many=True).data,
+        'Mixed scalars': [
+            {'at': datetime.now(dt_timezone.utc), 'local': datetime.now(), 'day': datetime.now().date(),
+             'weight': Decimal('102.5'), 'id': uuid.uuid4(), 'note': 'caf\u00e9 \u2028'}
+            for _ in range(1000)
+        ],
+    }
+    backends = {'DRF': (JSONRenderer(), JSONParser()), 'Fast': (renderers.FastJSONRenderer(), renderers.FastJSONParser())}
+    report.line(f'Fast backend: {"orjson" if renderers.orjson else "stdlib json"}')
+
+    identical = True
+    for label, data in payloads.items():
+        rendered = {name: renderer.render(data) for name, (renderer, _) in backends.items()}
+        identical &= rendered['DRF'] == rendered['Fast']
+        size = len(rendered['DRF'])
+        rates = {}
+        for name, (renderer, parser) in backends.items():
+            rounds = max(int(20_000_000 * scale / size), 20)
+            render_time, _ = timed(lambda: [renderer.render(data) for _ in range(rounds)])
+            parse_time, _ = timed(lambda: [parser.parse(io.BytesIO(rendered[name])) for _ in range(rounds)])
+            rates[name] = size * rounds / render_time / 2 ** 20, size * rounds / parse_time / 2 ** 20
+        report.line(
+            f'{label} ({size / 1024:.0f} KiB): '
+            f'render {rates["DRF"][0]:.0f} -> {rates["Fast"][0]:.0f} MiB/s '
+            f'({rates["Fast"][0] / rates["DRF"][0]:.1f}x), '
+            f'parse {rates["DRF"][1]:.0f} -> {rates["Fast"][1]:.0f} MiB/s '
+            f'({rates["Fast"][1] / rates["DRF"][1]:.1f}x)'
+        )
+    report.check('Fast renderer output is byte-identical to DRF', identical)
+
+
+@benchmark('login_storm')
+def login_storm_benchmark(report, scale):
+    """A burst of logins: hash cost per hasher, then logins/s through the sync
+    ``/api/token/`` and, all at once, the async ``/api/token/async/``"""
+    import asyncio
+    import os
+    from django.conf import settings
+    from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+    from django.test import Client, RequestFactory
+    from . import async_views
+
+    password = 'Morning-class-2026'
+    for label, hasher in (('PBKDF2 (Django default)', PBKDF2PasswordHasher()), ('Configured', get_hasher())):
+        samples = [timed(hasher.encode, password, hasher.salt())[0] for _ in range(5)]
+        report.timings(f'{label} {hasher.algorithm} hash', samples)
+
+    count = max(int(20 * scale), 2)
+    encoded = make_password(password)  # Verifying still costs a full hash per login
+    users = [User.objects.create(username=f'early{i}', password=encoded) for i in range(count)]
+    report.line(f'{count} users logging in, {os.cpu_count()} CPUs, {settings.PASSWORD_HASH_THREADS} hashing threads')
+
+    client = Client()
+    sync_time, statuses = timed(lambda: [
+        client.post('/api/token/', {'username': user.username, 'password': password},
+                    content_type='application/json').status_code
+        for user in users
+    ])
+    report.line(f'Sync token view, one at a time: {count / sync_time:.1f} logins/s')
+
+    factory = RequestFactory()
+
+    async def storm():
+        responses = await asyncio.gather(*[
+            async_views.obtain_token_pair(factory.post(
+                '/api/token/async/', {'username': user.username, 'password': password},
+                content_type='application/json',
+            ))
+            for user in users
+        ])
+        return [response.status_code for response in responses]
+
+    async_time, async_statuses = timed(asyncio.run, storm())
+    report.line(
+        f'Async token view, all at once: {count / async_time:.1f} logins/s '
+        f'({sync_time / async_time:.1f}x)'
+    )
+    report.check('Every login succeeded', set(statuses) == set(async_statuses) == {200})
+
+
+@benchmark('async_views')
+def async_views_benchmark(report, scale):
+    """Hot reads through the sync DRF views under WSGI vs the async variants
+    under ASGI, then long-polling requests all held by one event loop"""
+    import asyncio
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    from django.conf import settings
+    from django.test import AsyncClient, Client
+    from rest_framework_simplejwt.tokens import AccessToken
+    from . import async_views, trees
+    from .models import Conversation, Message
+
+    rng = random.Random(48)
+    count = max(int(50 * scale), 2)
+    threads = 4
+    coach = User.objects.create(username='bench-coach')
+    template, _ = _benchmark_template(rng, coach)
+    # Created one by one so the signals give each athlete a profile
+    athletes = [User.objects.create(username=f'athlete{i}', first_name='Ath') for i in range(count)]
+    sheets = trees.instantiate(template, athletes)
+    conversations = []
+    for athlete in athletes:
+        conversation = Conversation.objects.create()
+        conversation.participants.add(athlete, coach)
+        conversations.append(conversation)
+    Message.objects.bulk_create([
+        Message(conversation=conversation, sender=rng.choice([athlete, coach]), content=_zipf_words(rng, 12))
+        for athlete, conversation in zip(athletes, conversations) for _ in range(20)
+    ])
+    bearer = {athlete.id: f'Bearer {AccessToken.for_user(athlete)}' for athlete in athletes}
+    report.line(f'{count} athletes, {threads} WSGI threads vs one event loop')
+
+    endpoints = {
+        'Inbox': lambda i: 'conversations/',
+        'Message list': lambda i: f'conversations/{conversations[i].id}/messages/',
+        'Profile': lambda i: 'profile/',
+        'Calendar': lambda i: 'calendar/',
+        'SweatSheet detail': lambda i: f'sweatsheets/{sheets[i].id}/',
+    }
+
+    def sync_round(path):
+        def get(i):
+            client = Client(HTTP_AUTHORIZATION=bearer[athletes[i].id])
+            return client.get(f'/api/{path(i)}').content
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(get, range(count)))
+
+    async def async_round(path):
+        return [response.content for response in await asyncio.gather(*[
+            AsyncClient(AUTHORIZATION=bearer[athletes[i].id]).get(f'/api/async/{path(i)}')
+            for i in range(count)
+        ])]
+
+    mismatched = 0
+    for label, path in endpoints.items():
+        # Warm the profile snapshots, calendars and documents both sides use
+        bodies = sync_round(path)
+        mismatched += [json.loads(body) for body in bodies] != [
+            json.loads(body) for body in asyncio.run(async_round(path))
+        ]
+        sync_time, _ = timed(lambda: [sync_round(path) for _ in range(3)])
+        async_time, _ = timed(lambda: [asyncio.run(async_round(path)) for _ in range(3)])
+        report.line(
+            f'{label}: sync/WSGI {3 * count / sync_time:.0f} req/s, '
+            f'async/ASGI {3 * count / async_time:.0f} req/s ({sync_time / async_time:.1f}x)'
+        )
+    report.check('Async responses match the sync views', not mismatched)
+
+    # Every athlete waits on their conversation; a message arrives in each after a delay
+    waiters = max(int(200 * scale), count)
+    delay = 0.5
+    latest = {
+        conversation.id: conversation.messages.order_by('-id').values_list('id', flat=True).first()
+        for conversation in conversations
+    }
+
+    async def long_poll():
+        async def wait(i):
+            conversation = conversations[i % count]
+            response = await AsyncClient(AUTHORIZATION=bearer[athletes[i % count].id]).get(
+                f'/api/async/conversations/{conversation.id}/messages/'
+                f'?after={latest[conversation.id]}&wait={settings.LONG_POLL_MAX_WAIT}'
+            )
+            return len(json.loads(response.content))
+
+        async def post():
+            await asyncio.sleep(delay)
+            messages = await Message.objects.abulk_create([
+                Message(conversation=conversation, sender=coach, content='New message')
+                for conversation in conversations
+            ])
+            # What posting through MessageListCreateView does once committed
+            for message in messages:
+                async_views.conversation_changed(message.conversation_id, message.id)
+
+        results = await asyncio.gather(*[wait(i) for i in range(waiters)], post())
+        return results[:-1]
+
+    elapsed, received = timed(asyncio.run, long_poll())
+    report.line(
+        f'Long poll: {waiters} requests held open by one event loop, all answered '
+        f'{elapsed - delay:.2f}s after the messages were sent '
+        f'(a sync worker would need {waiters} threads to hold them)'
+    )
+    report.check('Every waiting request received its message', all(received))
+    report.check(
+        'Waiting requests answered within a poll interval plus 1s',
+        elapsed - delay <= settings.LONG_POLL_INTERVAL + 1,
+    )
+
+
+# Run in a fresh interpreter per sample; prints one JSON line of timings
+STARTUP_SCRIPT = '''
+import time
+started = time.perf_counter()
+import io, json, logging, sys
+import django
+django.setup()
+setup = time.perf_counter()
+from api import server
+application = server.load()
+loaded = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/profile/', 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+    'HTTP_ACCEPT': 'application/json',
+}
+statuses = []
+def request():
+    b''.join(application(dict(environ, **{'wsgi.input': io.BytesIO()}), lambda status, headers: statuses.append(status)))
+request()
+first = time.perf_counter()
+# Every 401 logs a warning, and writing it out costs more than the
+# middleware being compared; the best of several rounds drops the noise
+logging.disable(logging.WARNING)
+rounds = []
+for _ in range(5):
+    round_started = time.perf_counter()
+    for _ in range(%d):
+        request()
+    rounds.append((time.perf_counter() - round_started) / %d)
+print(json.dumps({
+    'setup': setup - started, 'load': loaded - setup, 'first': first - loaded,
+    'request': min(rounds), 'modules': len(sys.modules), 'status': statuses[0],
+}))
+'''
+
+
+@benchmark('startup')
+def startup_benchmark(report, scale):
+    """Cold start of a fresh process, full settings vs backend.settings_api:
+    django.setup(), loading the app and URLconf, the first response, then
+    the steady per-request cost of the middleware stack, best of five
+    rounds with request logging off"""
+    import json
+    import os
+    import subprocess
+    import sys
+    from django.conf import settings
+
+    runs = max(int(5 * scale), 3)
+    requests = max(int(500 * scale), 200)
+    script = STARTUP_SCRIPT % (requests, requests)
+    results = {}
+    for profile in ('backend.settings', 'backend.settings_api'):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile, PYTHONUNBUFFERED='1')
+        samples = []
+        for _ in range(runs):
+            # The last line is the timings; the 401s are logged before it
+            elapsed, output = timed(
+                subprocess.run, [sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                env=env, capture_output=True, text=True, check=True,
+            )
+            sample = json.loads(output.stdout.strip().splitlines()[-1])
+            sample['process'] = elapsed
+            samples.append(sample)
+        median = {key: statistics.median(sample[key] for sample in samples) for key in samples[0] if key != 'status'}
+        median['status'] = samples[0]['status']
+        results[profile] = median
+        report.line(
+            f'{profile}: setup {median["setup"] * 1000:.0f}ms, app + URLconf {median["load"] * 1000:.0f}ms, '
+            f'first response {median["first"] * 1000:.1f}ms, process start to exit {median["process"] * 1000:.0f}ms, '
+            f'{median["modules"]:.0f} modules, then {median["request"] * 1e6:.0f}us/request (median of {runs})'
+        )
+
+    full, api = results['backend.settings'], results['backend.settings_api']
+    cold = lambda result: result['setup'] + result['load'] + result['first']
+    report.line(
+        f'API profile: time to first response {cold(full) * 1000:.0f} -> {cold(api) * 1000:.0f}ms, '
+        f'{full["modules"] - api["modules"]:.0f} fewer modules, '
+        f'per request {full["request"] * 1e6:.0f} -> {api["request"] * 1e6:.0f}us'
+    )
+    report.check('Both profiles answer the same', full['status'] == api['status'])
+    report.check('API profile loads fewer modules', api['modules'] < full['modules'])
+    report.check('API profile serves requests faster', api['request'] < full['request'])
@@ -0,0 +1,54 @@
+"""Sets of small non-negative integers packed into bytes.
+
+Used for per-assignment exercise completion: bit ``n`` of a blob is the
+exercise with ``Exercise.ordinal == n``. Bit ``n`` lives in byte ``n // 8``,
+least significant bit first, and trailing zero bytes are dropped, so a
+sheet of a few hundred exercises needs a few dozen bytes.
+"""
+
+
+def contains(bits, n):
+    index = n >> 3
+    return index < len(bits) and bool(bits[index] >> (n & 7) & 1)
+
+
+def update(bits, ordinals, value=True):
+    """Set every ordinal in ``ordinals`` to ``value``.
+
+    Returns the new blob and the ordinals whose bit actually changed.
+    """
+    data = bytearray(bits)
+    changed = []
+    for n in ordinals:
+        index, mask = n >> 3, 1 << (n & 7)
+        if index >= len(data):
+            if not value:
+                continue
+            data.extend(bytes(index + 1 - len(data)))
+        if bool(data[index] & mask) != value:
+            data[index] ^= mask
+            changed.append(n)
+    return bytes(data.rstrip(b'\0')), changed
+
+
+def from_ordinals(ordinals):
+    return update(b'', ordinals)[0]
+
+
+def count(bits, mask=None):
+    """Number of ordinals in ``bits``, optionally only those also in ``mask``"""
+    value = int.from_bytes(bits, 'little')
+    if mask is not None:
+        value &= int.from_bytes(mask, 'little')
+    return value.bit_count()
+
+
+def members(bits):
+    """Every ordinal in ``bits``, ascending"""
+    value = int.from_bytes(bits, 'little')
+    result = []
+    while value:
+        lowest = value & -value
+        result.append(lowest.bit_length() - 1)
+        value ^= lowest
+    return result
@@ -0,0 +1,48 @@
+"""Single-flight calls: concurrent callers asking for the same key share one
+call instead of each repeating it.
+
+Per process: requests served by other processes make their own call.
+"""
+import threading
+
+from . import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """``func()``, unless a call for ``key`` is already running, in which
+        case wait for it and return its result (or raise its exception)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            metrics.incr(f'coalesce.{self.name}.shared')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
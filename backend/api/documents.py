@@ -0,0 +1,181 @@
+"""Cached, pre-rendered JSON of SweatSheet detail documents.
+
+``GET /api/sweatsheets/<id>/`` serializes the whole Phase -> Section ->
+Exercise tree, which rarely changes between the many times an athlete opens
+their sheet. The rendered bytes are kept in the cache selected by
+``DOCUMENT_CACHE_ALIAS`` under a key made of the sheet id and three
+counters: one for the sheet, one for its template (instances render the
+template's tree) and a global generation for the catalog every document
+embeds. Changing anything bumps a counter, so stale documents are simply
+never read again and expire on their own. A document names only its own
+creator and athlete, so renaming a user bumps just the sheets they create
+or are assigned.
+
+Model signals bump the counters for saves and deletes of the tree and of
+the override rows. Set-based writes in ``api.progress`` and ``api.trees``
+do not send signals and call ``invalidate()`` themselves. Counters are
+bumped only once the transaction commits, so a concurrent request cannot
+cache the tree as it was before the commit under the new counter.
+
+With the default local-memory cache every process keeps its own documents
+and only sees its own invalidations; point the alias at a shared cache when
+running more than one process.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import metrics
+from .models import (
+    WorkoutCategory, WorkoutExercise, SweatSheet, Phase, Section, Exercise,
+    ExerciseOverride, PhaseOverride
+)
+
+KEY_PREFIX = 'documents:'
+GENERATION_KEY = 'documents:generation'
+# User fields that appear in rendered documents
+USER_FIELDS = frozenset(['username', 'first_name', 'last_name'])
+
+_pending = threading.local()
+
+
+def _cache():
+    return caches[settings.DOCUMENT_CACHE_ALIAS]
+
+
+def _version_key(sweat_sheet_id):
+    return f'{KEY_PREFIX}version:{sweat_sheet_id}'
+
+
+def get_or_render(sweat_sheet_id, template_id, render):
+    """The cached document of a SweatSheet, calling ``render()`` for the
+    JSON bytes when there is no current one"""
+    cache = _cache()
+    keys = [_version_key(sweat_sheet_id), GENERATION_KEY]
+    if template_id:
+        keys.append(_version_key(template_id))
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a counter lost to eviction never
+            # comes back at a value an old document was stored under
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+
+    document_key = KEY_PREFIX + ':'.join([str(sweat_sheet_id)] + [str(versions[key]) for key in keys])
+    document = cache.get(document_key)
+    if document is None:
+        metrics.incr('documents.misses')
+        document = render()
+        cache.set(document_key, document, timeout=settings.DOCUMENT_CACHE_SECONDS)
+    else:
+        metrics.incr('documents.hits')
+    return document
+
+
+def invalidate(sweat_sheet_ids=(), phase_ids=(), section_ids=()):
+    """Mark the documents of these SweatSheets, and of the sheets owning these
+    phases and sections, stale once the current transaction commits"""
+    pending = _pending_ids()
+    pending['sweat_sheet'].update(sweat_sheet_ids)
+    pending['phase'].update(phase_ids)
+    pending['section'].update(section_ids)
+    # The first callback to run handles everything pending; the rest find
+    # nothing left to do. Ids from rolled back savepoints are flushed anyway.
+    transaction.on_commit(_flush)
+
+
+def invalidate_all():
+    """Mark every document stale, e.g. after a catalog change"""
+    _bump([GENERATION_KEY])
+
+
+def _pending_ids():
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = {'sweat_sheet': set(), 'phase': set(), 'section': set()}
+    return _pending.ids
+
+
+def _flush():
+    pending = _pending_ids()
+    sweat_sheet_ids, phase_ids, section_ids = (
+        set(pending['sweat_sheet']), set(pending['phase']), set(pending['section'])
+    )
+    for ids in pending.values():
+        ids.clear()
+    # Rows deleted since were reported with their own parents
+    if section_ids:
+        phase_ids.update(Section.objects.filter(id__in=section_ids).values_list('phase_id', flat=True))
+    if phase_ids:
+        sweat_sheet_ids.update(Phase.objects.filter(id__in=phase_ids).values_list('sweat_sheet_id', flat=True))
+    _bump([_version_key(pk) for pk in sweat_sheet_ids if pk is not None])
+
+
+def _bump(keys):
+    cache = _cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No counter means no document has been cached under it
+            pass
+
+
+# Signals covering saves and deletes of single objects
+@receiver(post_save, sender=SweatSheet)
+@receiver(post_delete, sender=SweatSheet)
+def sweat_sheet_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(sweat_sheet_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Phase)
+@receiver(post_delete, sender=Phase)
+@receiver(post_save, sender=ExerciseOverride)
+@receiver(post_delete, sender=ExerciseOverride)
+@receiver(post_save, sender=PhaseOverride)
+@receiver(post_delete, sender=PhaseOverride)
+def sweat_sheet_child_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(sweat_sheet_ids=[instance.sweat_sheet_id])
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def section_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(phase_ids=[instance.phase_id])
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def exercise_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(section_ids=[instance.section_id])
+
+
+@receiver(post_save, sender=WorkoutCategory)
+@receiver(post_delete, sender=WorkoutCategory)
+@receiver(post_save, sender=WorkoutExercise)
+@receiver(post_delete, sender=WorkoutExercise)
+def catalog_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(invalidate_all)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # New users are in no document yet and logins only save last_login
+    if raw or created:
+        return
+    if update_fields is None or USER_FIELDS & set(update_fields):
+        invalidate(sweat_sheet_ids=SweatSheet.objects.filter(
+            Q(user=instance) | Q(assigned_to=instance)
+        ).values_list('id', flat=True))
@@ -0,0 +1,115 @@
+"""Export of everything stored about a user, as NDJSON.
+
+Used by ``GET /api/export/`` and ``manage.py export_user_data``. Every line
+is one JSON object ``{"type": ..., "data": ...}``: the account first, then
+the calendar, notes, conversations, messages and SweatSheets. Records are
+read with ``.iterator(chunk_size=CHUNK_SIZE)`` and encoded as they are
+read, so memory use does not grow with the size of the history; a
+SweatSheet is the largest unit held at once, as one record with its whole
+Phase -> Section -> Exercise tree.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Prefetch, Q
+
+from . import renderers, trees
+from .models import Calendar, Conversation, Message, Note, Profile, SweatSheet
+
+CHUNK_SIZE = 500
+# Encoded lines are sent in blocks of about this many bytes
+BUFFER_SIZE = 64 * 1024
+
+
+def records(user):
+    """Yield ``(type, data)`` for every record belonging to ``user``"""
+    profile = Profile.objects.filter(user=user).values('role', 'phone_number').first() or {}
+    yield 'user', {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_joined': user.date_joined,
+        'last_login': user.last_login,
+        **profile,
+    }
+
+    calendar = Calendar.objects.filter(user=user).values('events').first()
+    if calendar is not None:
+        yield 'calendar', calendar
+
+    notes = Note.objects.filter(author=user).order_by('id').values('id', 'title', 'content', 'created_at')
+    for note in notes.iterator(chunk_size=CHUNK_SIZE):
+        yield 'note', note
+
+    conversations = (
+        Conversation.objects.filter(participants=user)
+        .prefetch_related(Prefetch('participants', queryset=User.objects.only('username')))
+        .order_by('id')
+    )
+    for conversation in conversations.iterator(chunk_size=CHUNK_SIZE):
+        yield 'conversation', {
+            'id': conversation.id,
+            'conversation_type': conversation.conversation_type,
+            'title': conversation.title,
+            'created_at': conversation.created_at,
+            'is_active': conversation.is_active,
+            'participants': [participant.username for participant in conversation.participants.all()],
+        }
+
+    # The user's own messages, deleted or not, and what others sent them
+    messages = Message.objects.filter(
+        Q(sender=user) | Q(conversation__in=Conversation.objects.filter(participants=user), is_deleted=False)
+    ).order_by('id').values(
+        'id', 'conversation_id', 'sender__username', 'message_type', 'content', 'file_url',
+        'created_at', 'edited_at', 'is_edited', 'is_deleted',
+    )
+    for message in messages.iterator(chunk_size=CHUNK_SIZE):
+        message['sender'] = message.pop('sender__username')
+        yield 'message', message
+
+    sweat_sheets = (
+        SweatSheet.objects.filter(Q(user=user) | Q(assigned_to=user))
+        .select_related('user', 'assigned_to', 'template')
+        .order_by('id')
+    )
+    for sweat_sheet in sweat_sheets.iterator(chunk_size=CHUNK_SIZE):
+        yield 'sweat_sheet', _sweat_sheet(sweat_sheet)
+
+
+def _sweat_sheet(sweat_sheet):
+    if sweat_sheet.template_id:
+        phases = trees.tree_data(
+            sweat_sheet.template,
+            {o.exercise_id: o for o in sweat_sheet.exercise_overrides.all()},
+            {o.phase_id: o for o in sweat_sheet.phase_overrides.all()},
+            bytes(sweat_sheet.completion),
+        )
+    else:
+        phases = trees.tree_data(sweat_sheet)
+    return {
+        'id': sweat_sheet.id,
+        'name': sweat_sheet.name,
+        'created_by': sweat_sheet.user.username,
+        'assigned_to': sweat_sheet.assigned_to.username if sweat_sheet.assigned_to else None,
+        'is_template': sweat_sheet.is_template,
+        'is_active': sweat_sheet.is_active,
+        'created_at': sweat_sheet.created_at,
+        'updated_at': sweat_sheet.updated_at,
+        'total_exercises': sweat_sheet.total_exercises,
+        'completed_exercises': sweat_sheet.completed_exercises,
+        'last_activity_at': sweat_sheet.last_activity_at,
+        'phases': phases,
+    }
+
+
+def ndjson(user):
+    """Yield the export of ``user`` as blocks of NDJSON bytes"""
+    buffer = bytearray()
+    for record_type, data in records(user):
+        buffer += renderers.dumps({'type': record_type, 'data': data})
+        buffer += b'\n'
+        if len(buffer) >= BUFFER_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
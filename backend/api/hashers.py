@@ -0,0 +1,71 @@
+"""Password hashers with their cost taken from settings.
+
+``PASSWORD_HASHERS`` puts ``Argon2PasswordHasher`` first when argon2-cffi is
+installed and ``ScryptPasswordHasher`` otherwise; the PBKDF2 hashers after
+them only verify existing hashes. Django rehashes a password with the first
+hasher on the next successful login whenever the algorithm or any of the
+``ARGON2_*``/``SCRYPT_*`` costs differ from the stored hash, so costs can be
+tuned without a migration.
+
+Argon2, scrypt and PBKDF2 all release the GIL while hashing, so
+``averify_password()`` and ``amake_password()`` run them on a pool of
+``PASSWORD_HASH_THREADS`` threads and an async view keeps serving other
+requests while a login is checked.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * N * r bytes; OpenSSL refuses more than 32 MiB by default
+        return 256 * self.work_factor * self.block_size
+
+
+@functools.cache
+def executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.PASSWORD_HASH_THREADS, thread_name_prefix='password-hash'
+    )
+
+
+async def averify_password(password, encoded):
+    """``verify_password()`` on the hashing threads: (is correct, must rehash)"""
+    return await asyncio.get_running_loop().run_in_executor(
+        executor(), hashers.verify_password, password, encoded
+    )
+
+
+async def amake_password(password):
+    return await asyncio.get_running_loop().run_in_executor(executor(), hashers.make_password, password)
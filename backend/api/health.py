@@ -0,0 +1,61 @@
+"""Liveness and readiness probes for load balancers and orchestrators.
+
+``/healthz`` only shows that the process answers requests: restart it when
+this fails. ``/readyz`` also runs a query on every database and a round trip
+on every cache, and answers 503 when one fails, so traffic is held back
+from a worker that cannot serve it. A failure is logged with its details,
+and the public response only says ``error``. Neither needs authentication
+and neither is cached.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+READY_KEY = 'health:ready'
+
+logger = logging.getLogger(__name__)
+
+
+@never_cache
+@require_safe
+def healthz(request):
+    return JsonResponse({'status': 'ok'})
+
+
+def _check_database(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def _check_cache(cache):
+    cache.set(READY_KEY, 1, timeout=5)
+    if cache.get(READY_KEY) != 1:
+        raise RuntimeError('cache did not return the value just set')
+
+
+@never_cache
+@require_safe
+def readyz(request):
+    checks = {}
+    for connection in connections.all():
+        try:
+            _check_database(connection)
+            checks[f'database:{connection.alias}'] = 'ok'
+        except Exception:
+            logger.exception('Readiness check failed for database %r', connection.alias)
+            checks[f'database:{connection.alias}'] = 'error'
+    for alias in settings.CACHES:
+        try:
+            _check_cache(caches[alias])
+            checks[f'cache:{alias}'] = 'ok'
+        except Exception:
+            logger.exception('Readiness check failed for cache %r', alias)
+            checks[f'cache:{alias}'] = 'error'
+    ready = all(result == 'ok' for result in checks.values())
+    return JsonResponse({'status': 'ready' if ready else 'unavailable', 'checks': checks}, status=200 if ready else 503)
@@ -0,0 +1,350 @@
+"""Chunked, resumable bulk imports of the exercise catalog and program templates.
+
+An ``ImportJob`` names a file and how far it has been imported. ``run()``
+streams the file record by record and writes ``CHUNK_SIZE`` records at a
+time; each chunk and the job's ``position`` are committed in one
+transaction, so an interrupted import continues after the last committed
+chunk instead of starting over. The position moves with a compare-and-set,
+so a second runner of the same import cannot commit a chunk twice.
+
+Catalog files are CSV or JSON Lines with ``category``, ``name`` and
+optional ``description`` fields, upserted on (category, name) with
+``bulk_create(update_conflicts=True)``. Program files are JSON Lines, one
+template SweatSheet per line in the same nested shape the SweatSheet API
+accepts, except that exercises name their catalog entry::
+
+    {"name": "Strength block", "phases": [{"phase_number": 1, "sections": [
+        {"section_number": 1, "date": "2026-01-05", "exercises": [
+            {"category": "Lower Body", "exercise": "Squats", "sets": "5", "reps": "5"}]}]}]}
+
+Malformed records are skipped and counted; the last problem is kept in
+``ImportJob.last_error``. ``manage.py import_data`` runs imports in the
+foreground and ``POST /api/imports/`` queues them for the job workers.
+
+Uploaded files are kept in ``IMPORT_UPLOAD_DIR`` only as long as they are
+needed: an upload is deleted once its import is done, or as soon as a
+re-upload of the same contents takes its place. Files imported from
+elsewhere, as ``import_data`` does, are never deleted.
+"""
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import date
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import documents, search, trees
+from .jobs import job
+from .models import ImportJob, SweatSheet, WorkoutCategory, WorkoutExercise
+
+CHUNK_SIZE = 1000
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+CATALOG_FIELDS = ('category', 'name')
+
+
+class InvalidImport(Exception):
+    """The import file as a whole cannot be imported"""
+
+
+class RecordError(ValueError):
+    """One record is malformed and is skipped"""
+
+
+class ImportConflict(Exception):
+    """Another runner committed a chunk of the same import first"""
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise InvalidImport(f"Unsupported file type {extension or path!r}; use .csv or .jsonl")
+    return FORMATS[extension]
+
+
+def checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def discard(path):
+    """Delete ``path`` if it is an upload in ``IMPORT_UPLOAD_DIR``"""
+    directory = os.path.realpath(settings.IMPORT_UPLOAD_DIR)
+    if os.path.dirname(os.path.realpath(path)) != directory:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def start(kind, path, owner, file_format=None, restart=False):
+    """The unfinished import of this file, or a new one.
+
+    A file counts as the same when its contents are, so a renamed or
+    re-uploaded copy resumes too. ``restart`` always starts a new import.
+    """
+    file_format = file_format or detect_format(path)
+    if kind == 'PROGRAMS' and file_format != 'jsonl':
+        raise InvalidImport("Programs can only be imported from JSON Lines")
+    digest = checksum(path)
+    if not restart:
+        existing = ImportJob.objects.filter(
+            kind=kind, checksum=digest, owner=owner
+        ).exclude(status='DONE').order_by('-id').first()
+        if existing is not None:
+            if existing.source != path:
+                superseded = existing.source
+                ImportJob.objects.filter(pk=existing.pk).update(source=path)
+                existing.source = path
+                transaction.on_commit(lambda: discard(superseded))
+            return existing
+    return ImportJob.objects.create(
+        kind=kind, file_format=file_format, source=path, checksum=digest, owner=owner
+    )
+
+
+def run(import_job, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """Import ``import_job`` from its position to the end of its file.
+
+    ``on_chunk(import_job)`` is called after every committed chunk.
+    """
+    handler = HANDLERS[import_job.kind]
+    ImportJob.objects.filter(pk=import_job.pk).update(status='RUNNING', finished_at=None)
+    import_job.status = 'RUNNING'
+    try:
+        records = islice(_read(import_job), import_job.position, None)
+        while True:
+            started = time.perf_counter()
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            _commit(import_job, handler, chunk, started)
+            if on_chunk is not None:
+                on_chunk(import_job)
+    except ImportConflict:
+        raise
+    except Exception as error:
+        ImportJob.objects.filter(pk=import_job.pk).update(status='FAILED', last_error=str(error))
+        import_job.status = 'FAILED'
+        raise
+    ImportJob.objects.filter(pk=import_job.pk).update(status='DONE', finished_at=timezone.now())
+    discard(import_job.source)
+    import_job.refresh_from_db()
+    return import_job
+
+
+def _commit(import_job, handler, chunk, started):
+    with transaction.atomic():
+        imported, errors = handler(import_job, [
+            (import_job.position + index + 1, record) for index, record in enumerate(chunk)
+        ])
+        elapsed = time.perf_counter() - started
+        changes = {
+            'position': F('position') + len(chunk),
+            'imported': F('imported') + imported,
+            'skipped': F('skipped') + len(errors),
+            'elapsed': F('elapsed') + elapsed,
+            'updated_at': timezone.now(),
+        }
+        if errors:
+            changes['last_error'] = errors[-1]
+        if not ImportJob.objects.filter(pk=import_job.pk, position=import_job.position).update(**changes):
+            raise ImportConflict(f"Import #{import_job.pk} moved past record {import_job.position}")
+    import_job.position += len(chunk)
+    import_job.imported += imported
+    import_job.skipped += len(errors)
+    import_job.elapsed += elapsed
+    if errors:
+        import_job.last_error = errors[-1]
+
+
+def _read(import_job):
+    """Yield every record of the file as a dict, or a ``RecordError``"""
+    with open(import_job.source, newline='', encoding='utf-8-sig') as source:
+        if import_job.file_format == 'csv':
+            reader = csv.DictReader(source)
+            missing = [field for field in CATALOG_FIELDS if field not in (reader.fieldnames or [])]
+            if missing:
+                raise InvalidImport(f"CSV header is missing {', '.join(missing)}")
+            yield from reader
+            return
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield RecordError(f"invalid JSON ({error})")
+                continue
+            yield record if isinstance(record, dict) else RecordError("expected a JSON object")
+
+
+def _text(record, field, max_length, required=True):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RecordError(f"{field} is required")
+    if len(value) > max_length:
+        raise RecordError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def _parse(numbered_records, parse):
+    """Apply ``parse`` to every record; returns ([(number, parsed)], error messages)"""
+    parsed, errors = [], []
+    for number, record in numbered_records:
+        try:
+            if isinstance(record, RecordError):
+                raise record
+            parsed.append((number, parse(record)))
+        except RecordError as error:
+            errors.append(f"Record {number}: {error}")
+    return parsed, errors
+
+
+# Exercise catalog
+def _catalog_row(record):
+    return (
+        _text(record, 'category', 100),
+        _text(record, 'name', 100),
+        _text(record, 'description', 10000, required=False),
+    )
+
+
+def import_catalog(import_job, numbered_records):
+    rows, errors = _parse(numbered_records, _catalog_row)
+    # Later records win; one statement may not upsert the same row twice
+    descriptions = {(category, name): description for _, (category, name, description) in rows}
+    if not descriptions:
+        return 0, errors
+
+    category_names = {category for category, _ in descriptions}
+    WorkoutCategory.objects.bulk_create(
+        [WorkoutCategory(name=name) for name in category_names], ignore_conflicts=True
+    )
+    category_ids = dict(WorkoutCategory.objects.filter(name__in=category_names).values_list('name', 'id'))
+    WorkoutExercise.objects.bulk_create(
+        [
+            WorkoutExercise(category_id=category_ids[category], name=name, description=description)
+            for (category, name), description in descriptions.items()
+        ],
+        update_conflicts=True, unique_fields=['category', 'name'], update_fields=['description'],
+        batch_size=500,
+    )
+
+    # Upserts send no signals: refresh the search index and cached documents here
+    keys = {(category_ids[category], name) for category, name in descriptions}
+    exercises = [
+        exercise for exercise in WorkoutExercise.objects.filter(
+            category_id__in=category_ids.values(), name__in={name for _, name in descriptions}
+        )
+        if (exercise.category_id, exercise.name) in keys
+    ]
+    search.reindex(exercises)
+    transaction.on_commit(documents.invalidate_all)
+    return len(descriptions), errors
+
+
+# Program templates
+def _program(record):
+    name = _text(record, 'name', 200)
+    phases = record.get('phases') or []
+    if not isinstance(phases, list):
+        raise RecordError("phases must be a list")
+    try:
+        phases = [
+            {
+                'phase_number': int(phase['phase_number']),
+                'sections': [
+                    {
+                        'section_number': int(section['section_number']),
+                        'date': date.fromisoformat(section['date']),
+                        'exercises': [
+                            {
+                                'catalog': (_text(exercise, 'category', 100), _text(exercise, 'exercise', 100)),
+                                'sets': _text(exercise, 'sets', 10, required=False),
+                                'reps': _text(exercise, 'reps', 10, required=False),
+                                'weight': _text(exercise, 'weight', 20, required=False),
+                            }
+                            for exercise in section.get('exercises') or []
+                        ],
+                    }
+                    for section in phase.get('sections') or []
+                ],
+            }
+            for phase in phases
+        ]
+    except RecordError:
+        raise
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        raise RecordError(f"malformed phases ({error!r})") from None
+    errors = trees.numbering_errors(phases)
+    if errors:
+        raise RecordError(errors[0])
+    return name, phases
+
+
+def import_programs(import_job, numbered_records):
+    programs, errors = _parse(numbered_records, _program)
+
+    # Resolve every catalog name of the chunk in one query
+    references = {
+        exercise['catalog']
+        for _, (_, phases) in programs
+        for phase in phases for section in phase['sections'] for exercise in section['exercises']
+    }
+    catalog = {
+        (category, name): (category_id, pk)
+        for category, name, category_id, pk in WorkoutExercise.objects.filter(
+            category__name__in={category for category, _ in references},
+            name__in={name for _, name in references},
+        ).values_list('category__name', 'name', 'category_id', 'id')
+    }
+
+    resolved = []
+    for number, (name, phases) in programs:
+        unknown = None
+        for phase in phases:
+            for section in phase['sections']:
+                for exercise in section['exercises']:
+                    if exercise['catalog'] not in catalog:
+                        unknown = exercise['catalog']
+                        continue
+                    exercise['workout_category_id'], exercise['specific_workout_id'] = catalog[exercise['catalog']]
+        if unknown:
+            errors.append(f"Record {number}: unknown catalog exercise {unknown[1]!r} in {unknown[0]!r}")
+        else:
+            resolved.append((name, phases))
+
+    sweat_sheets = SweatSheet.objects.bulk_create([
+        SweatSheet(name=name, user=import_job.owner, is_template=True) for name, _ in resolved
+    ])
+    for sweat_sheet, (_, phases) in zip(sweat_sheets, resolved):
+        trees.create_tree(sweat_sheet, phases)
+    search.reindex(sweat_sheets)
+    return len(sweat_sheets), errors
+
+
+HANDLERS = {
+    'CATALOG': import_catalog,
+    'PROGRAMS': import_programs,
+}
+
+
+@job('imports.run', max_attempts=3)
+def run_import_job(payload):
+    """Background run of an import queued by ``POST /api/imports/``; a retry
+    after a crash resumes from the last committed chunk"""
+    import_job = ImportJob.objects.select_related('owner').filter(pk=payload['import_job_id']).first()
+    if import_job is None or import_job.status == 'DONE':
+        return
+    run(import_job)
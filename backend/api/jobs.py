@@ -0,0 +1,192 @@
+"""DB-backed background job queue.
+
+Request handlers call ``enqueue()`` inside the transaction of their writes,
+so a job exists exactly when those writes were committed. Workers started by
+``manage.py run_workers`` claim due jobs in batches, run the registered
+handler and retry failures with exponential backoff.
+
+Handlers are registered with the ``@job`` decorator. Batch handlers receive
+the payloads of every claimed job with the same name in one call, which lets
+them load rows and talk to external services once per batch.
+"""
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class JobSpec:
+    def __init__(self, name, func, batch, max_attempts):
+        self.name = name
+        self.func = func
+        self.batch = batch
+        self.max_attempts = max_attempts
+
+
+def job(name, batch=False, max_attempts=None):
+    """Register ``func`` as the handler for jobs called ``name``.
+
+    With ``batch=True`` the handler is called with a list of payloads,
+    otherwise once per payload.
+    """
+    def decorator(func):
+        _registry[name] = JobSpec(name, func, batch, max_attempts or settings.JOB_MAX_ATTEMPTS)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, dedupe_key='', delay=None):
+    """Queue a job; returns the existing pending job when ``dedupe_key`` matches one"""
+    if name not in _registry:
+        raise ValueError(f"No job handler registered for {name!r}")
+
+    run_at = timezone.now() + (delay or timedelta())
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name,
+                payload=payload or {},
+                dedupe_key=dedupe_key,
+                run_at=run_at,
+                max_attempts=_registry[name].max_attempts,
+            )
+    except IntegrityError:
+        if not dedupe_key:
+            raise
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status='PENDING').first()
+        if existing is None:
+            # The pending job was claimed in the meantime; queue a fresh one
+            return enqueue(name, payload, dedupe_key, delay)
+        return existing
+
+
+def new_worker_id():
+    return f"worker-{uuid.uuid4().hex[:12]}"
+
+
+def claim(worker_id, limit):
+    """Atomically mark up to ``limit`` due jobs as running for ``worker_id``"""
+    now = timezone.now()
+
+    _reclaim_abandoned(now)
+
+    candidate_ids = list(
+        Job.objects.filter(status='PENDING', run_at__lte=now)
+        .order_by('run_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not candidate_ids:
+        return []
+
+    # The status check makes the claim safe against concurrent workers:
+    # only one of them can flip a given row from PENDING to RUNNING
+    Job.objects.filter(id__in=candidate_ids, status='PENDING').update(
+        status='RUNNING', locked_by=worker_id, locked_at=now
+    )
+    return list(Job.objects.filter(id__in=candidate_ids, status='RUNNING', locked_by=worker_id))
+
+
+def _reclaim_abandoned(now):
+    """Put jobs whose worker died mid-run back in the queue, one at a time:
+    a job whose dedupe key has a newer pending job cannot become pending
+    again, and is superseded by that job instead"""
+    stale = Job.objects.filter(
+        status='RUNNING',
+        locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    )
+    for stale_id, locked_at in stale.values_list('id', 'locked_at'):
+        # Matching the lock skips jobs another worker reclaimed in the meantime
+        abandoned = Job.objects.filter(id=stale_id, status='RUNNING', locked_at=locked_at)
+        try:
+            with transaction.atomic():
+                abandoned.update(status='PENDING', locked_by='', locked_at=None)
+        except IntegrityError:
+            abandoned.update(
+                status='DONE', finished_at=now, locked_by='', locked_at=None,
+                last_error='Abandoned by its worker and superseded by a newer pending job'
+            )
+
+
+def run_pending(worker_id, limit=None):
+    """Claim and run one batch of due jobs; returns how many were claimed"""
+    claimed = claim(worker_id, limit or settings.JOB_BATCH_SIZE)
+
+    by_name = {}
+    for claimed_job in claimed:
+        by_name.setdefault(claimed_job.name, []).append(claimed_job)
+
+    for name, group in by_name.items():
+        spec = _registry.get(name)
+        if spec is None:
+            _finish(group, error=f"No job handler registered for {name!r}", retry=False)
+        elif spec.batch:
+            _execute(spec, group)
+        else:
+            for single in group:
+                _execute(spec, [single])
+    return len(claimed)
+
+
+def _execute(spec, group):
+    try:
+        if spec.batch:
+            spec.func([claimed_job.payload for claimed_job in group])
+        else:
+            spec.func(group[0].payload)
+    except Exception:
+        logger.exception("Job %s failed", spec.name)
+        _finish(group, error=traceback.format_exc())
+    else:
+        _finish(group)
+
+
+def _finish(group, error='', retry=True):
+    now = timezone.now()
+    ids = [claimed_job.id for claimed_job in group]
+    if not error:
+        Job.objects.filter(id__in=ids).update(
+            status='DONE', finished_at=now, locked_by='', locked_at=None
+        )
+        return
+
+    for failed in group:
+        failed.attempts += 1
+        failed.last_error = error[-4000:]
+        failed.locked_by = ''
+        failed.locked_at = None
+        if retry and failed.attempts < failed.max_attempts:
+            backoff = settings.JOB_RETRY_BACKOFF * 2 ** (failed.attempts - 1)
+            failed.status = 'PENDING'
+            failed.run_at = now + timedelta(seconds=backoff)
+        else:
+            failed.status = 'FAILED'
+            failed.finished_at = now
+        try:
+            with transaction.atomic():
+                failed.save()
+        except IntegrityError:
+            # A newer pending job with the same dedupe key supersedes this retry
+            Job.objects.filter(id=failed.id).update(
+                status='DONE', finished_at=now, locked_by='', locked_at=None,
+                last_error=failed.last_error
+            )
+
+
+def purge_finished(older_than):
+    """Delete finished jobs older than ``older_than`` (a timedelta)"""
+    cutoff = timezone.now() - older_than
+    return Job.objects.filter(
+        Q(status='DONE') | Q(status='FAILED'),
+        finished_at__lt=cutoff
+    ).delete()[0]
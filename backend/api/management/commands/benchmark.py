@@ -0,0 +1,48 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.benchmarks import BENCHMARKS, Report
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Benchmarks to run (default: all)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List available benchmarks and exit',
+        )
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Multiply dataset sizes, e.g. 0.1 for a quick run',
+        )
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, func in sorted(BENCHMARKS.items()):
+                self.stdout.write(f'{name}: {(func.__doc__ or "").strip()}')
+            return
+
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+        report = Report(self)
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} =='))
+            # Fresh database per benchmark so they do not skew each other
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                BENCHMARKS[name](report, options['scale'])
+            finally:
+                # In-memory SQLite test databases survive destroy_test_db()
+                call_command('flush', interactive=False, verbosity=0)
+                connection.creation.destroy_test_db(old_name, verbosity=0)
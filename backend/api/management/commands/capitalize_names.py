@@ -1,30 +1,79 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db.models import CharField, Max, Min, Q
+from django.db.models.functions import Concat, Lower, Substr, Upper
+from api import documents, profiles
+
+# Names of printable ASCII only, which the database cases like Python does
+ASCII_NAME = r'^[ -~]*$'
+
+
+def capitalized(field):
+    """``field`` as ``str.capitalize()`` would leave it, computed by the database.
+    Only right for ASCII: UPPER/LOWER leave other letters alone on SQLite."""
+    return Concat(Upper(Substr(field, 1, 1)), Lower(Substr(field, 2)), output_field=CharField())
+
+
+def recapitalized(users):
+    """Users of the queryset whose names ``str.capitalize()`` changes, as
+    unsaved instances carrying the new names"""
+    return [
+        User(id=pk, first_name=first_name.capitalize(), last_name=last_name.capitalize())
+        for pk, first_name, last_name in users.values_list('id', 'first_name', 'last_name').iterator()
+        if first_name != first_name.capitalize() or last_name != last_name.capitalize()
+    ]
+
 
 class Command(BaseCommand):
-    help = 'Capitalize first and last names of all users'
+    help = (
+        'Capitalize first and last names of all users like the pre_save signal does: '
+        'one UPDATE per batch of ids for ASCII names, and bulk updates of names '
+        'capitalized in Python for the rest.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Range of user ids updated per statement; keeps write locks short',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the users whose names would change',
+        )
 
     def handle(self, *args, **options):
+        ascii_names = Q(first_name__regex=ASCII_NAME) & Q(last_name__regex=ASCII_NAME)
+        pending = User.objects.filter(ascii_names).filter(
+            ~Q(first_name=capitalized('first_name')) | ~Q(last_name=capitalized('last_name'))
+        )
+        others = User.objects.exclude(ascii_names)
+
+        if options['dry_run']:
+            self.stdout.write(f'{pending.count() + len(recapitalized(others))} users would be updated')
+            return
+
+        bounds = User.objects.aggregate(first=Min('id'), last=Max('id'))
         users_updated = 0
-        
-        for user in User.objects.all():
-            updated = False
-            
-            if user.first_name and user.first_name != user.first_name.capitalize():
-                user.first_name = user.first_name.capitalize()
-                updated = True
-                
-            if user.last_name and user.last_name != user.last_name.capitalize():
-                user.last_name = user.last_name.capitalize()
-                updated = True
-                
-            if updated:
-                user.save()
-                users_updated += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'Updated user: {user.username} -> {user.first_name} {user.last_name}')
+        if bounds['first'] is not None:
+            batch_size = options['batch_size']
+            for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+                batch = Q(id__gte=start, id__lt=start + batch_size)
+                ids = list(pending.filter(batch).values_list('id', flat=True))
+                # Set-based: no per-user save() and so no pre_save/post_save signals
+                users_updated += User.objects.filter(id__in=ids).update(
+                    first_name=capitalized('first_name'),
+                    last_name=capitalized('last_name'),
                 )
-        
+                users = recapitalized(others.filter(batch))
+                users_updated += User.objects.bulk_update(users, ['first_name', 'last_name'])
+                # update() sends no post_save, which is what normally refreshes them
+                profiles.forget_many(ids + [user.id for user in users])
+
+        if users_updated:
+            documents.invalidate_all()
         self.stdout.write(
             self.style.SUCCESS(f'Successfully updated {users_updated} users')
-        ) 
\ No newline at end of file
+        )
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from api.models import Profile, WorkoutCategory, WorkoutExercise, SweatSheet, Phase, Section, Exercise
+from api.models import Profile, WorkoutCategory, WorkoutExercise, SweatSheet
+from api import trees
 from datetime import date, timedelta
 import random
 
@@ -163,50 +164,47 @@ class Command(BaseCommand):
             }
         ]
 
-        for sheet_data in sample_sweatsheets:
-            sweatsheet = SweatSheet.objects.create(
-                name=sheet_data['name'],
-                user=creator,
-                is_template=sheet_data['is_template']
+        # Resolve every catalog exercise in one query instead of two per exercise
+        catalog = {
+            (category, name): (category_id, pk)
+            for category, name, category_id, pk in WorkoutExercise.objects.values_list(
+                'category__name', 'name', 'category_id', 'id'
             )
+        }
 
+        for sheet_data in sample_sweatsheets:
+            phases = []
             for phase_data in sheet_data['phases']:
-                phase = Phase.objects.create(
-                    sweat_sheet=sweatsheet,
-                    phase_number=phase_data['phase_number']
-                )
-
+                sections = []
                 for section_data in phase_data['sections']:
-                    # Create sections with dates starting from today
-                    section_date = date.today() + timedelta(days=section_data['section_number'] - 1)
-                    section = Section.objects.create(
-                        phase=phase,
-                        section_number=section_data['section_number'],
-                        date=section_date
-                    )
-
-                    for order, exercise_data in enumerate(section_data['exercises'], 1):
-                        try:
-                            category = WorkoutCategory.objects.get(name=exercise_data['category'])
-                            workout_exercise = WorkoutExercise.objects.get(
-                                name=exercise_data['exercise'],
-                                category=category
-                            )
-
-                            Exercise.objects.create(
-                                section=section,
-                                workout_category=category,
-                                specific_workout=workout_exercise,
-                                sets=exercise_data['sets'],
-                                reps=exercise_data['reps'],
-                                weight=exercise_data['weight'],
-                                order=order
-                            )
-                        except (WorkoutCategory.DoesNotExist, WorkoutExercise.DoesNotExist):
+                    exercises = []
+                    for exercise_data in section_data['exercises']:
+                        key = (exercise_data['category'], exercise_data['exercise'])
+                        if key not in catalog:
                             self.stdout.write(
                                 self.style.WARNING(f'Exercise not found: {exercise_data["exercise"]}')
                             )
+                            continue
+                        category_id, workout_id = catalog[key]
+                        exercises.append(dict(
+                            exercise_data,
+                            workout_category_id=category_id,
+                            specific_workout_id=workout_id,
+                        ))
+                    # Create sections with dates starting from today
+                    sections.append({
+                        'section_number': section_data['section_number'],
+                        'date': date.today() + timedelta(days=section_data['section_number'] - 1),
+                        'exercises': exercises,
+                    })
+                phases.append({'phase_number': phase_data['phase_number'], 'sections': sections})
 
+            sweatsheet = SweatSheet.objects.create(
+                name=sheet_data['name'],
+                user=creator,
+                is_template=sheet_data['is_template']
+            )
+            trees.create_tree(sweatsheet, phases)
             self.stdout.write(
                 self.style.SUCCESS(f'Created SweatSheet: {sweatsheet.name}')
-            ) 
\ No newline at end of file
+            )
@@ -0,0 +1,38 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api import export
+
+class Command(BaseCommand):
+    help = "Write everything stored about a user as NDJSON, one record per line"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--output',
+            help='File to write the export to (default: standard output)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for block in export.ndjson(user):
+                output.write(block)
+                written += len(block)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+
+        if options['output']:
+            self.stdout.write(
+                self.style.SUCCESS(f"Exported {user.username} to {options['output']} ({written} bytes)")
+            )
@@ -0,0 +1,504 @@
+"""Synthetic data at benchmark scale.
+
+Everything is written with ``bulk_create`` in batches: users with their
+profiles (skipping the per-user ``post_save`` signal),
+conversations with their participants, messages with read receipts, and
+SweatSheet templates, copies and template instances with their trees and
+progress rollups. Signals are skipped, so the search index is rebuilt once
+at the end.
+
+Distributions are skewed the way real usage is: a few SweatPros coach most
+athletes, message counts per conversation are heavy tailed, conversations
+were last active recently more often than long ago, and athletes work
+through their SweatSheets in order.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api import bitsets, search
+from api.models import (
+    Conversation, Exercise, Message, MessageRead, Phase, PhaseOverride,
+    Profile, Section, SweatSheet, WorkoutExercise,
+)
+
+PREFIX = 'scale_'
+PASSWORD = 'testpass123'
+
+FIRST_NAMES = [
+    'Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+    'Mike', 'Emma', 'James', 'Sarah', 'Olivia', 'Noah', 'Liam', 'Ava', 'Mia', 'Lucas',
+]
+LAST_NAMES = [
+    'Johnson', 'Wilson', 'Davis', 'Brown', 'Miller', 'Garcia', 'Martinez', 'Lee', 'Walker', 'Hall',
+    'Young', 'King', 'Wright', 'Lopez', 'Hill', 'Scott', 'Green', 'Adams', 'Baker', 'Nelson',
+]
+WORDS = (
+    'great session today keep pushing form looks solid add weight next week how did the squats feel '
+    'remember to stretch rest day tomorrow nice work on the deadlifts hydrate well sleep matters '
+    'we will adjust the plan core felt strong knees a bit sore try lighter sets focus on tempo'
+).split()
+SHEET_LEVELS = ['Beginner', 'Intermediate', 'Advanced', 'Elite']
+SHEET_FOCUS = ['Strength', 'Hypertrophy', 'Endurance', 'Mobility', 'Power', 'Conditioning']
+SHEET_KINDS = ['Block', 'Program', 'Cycle', 'Plan']
+REPS = ['5', '6', '8', '10', '12', '15', '20', '30s', '45s', '60s']
+
+# Shares of users by role, and of sheets by kind
+PRO_SHARE = 0.05
+TEAM_SHARE = 0.02
+TEMPLATE_SHARE = 0.2
+INSTANCE_SHARE = 0.7  # of the sheets assigned to athletes; the rest are own copies
+GROUP_SHARE = 0.15
+
+MESSAGE_COLUMNS = (
+    'id', 'conversation', 'sender', 'message_type', 'content', 'file_url',
+    'created_at', 'is_edited', 'is_deleted',
+)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Keep the timestamps set on the objects instead of ``auto_now(_add)``"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def insert_rows(model, fields, rows):
+    """INSERT plain tuples with ``executemany()``. Used for the largest tables,
+    where building model instances for ``bulk_create`` costs more than
+    writing the rows."""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows
+        )
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic dataset for benchmarking with bulk inserts: '
+        'users, conversations with messages, and SweatSheets'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--conversations', type=int, default=2000)
+        parser.add_argument(
+            '--messages-per',
+            type=int,
+            default=50,
+            help='Average messages per conversation; the distribution is heavy tailed',
+        )
+        parser.add_argument(
+            '--sheets',
+            type=int,
+            default=500,
+            help='SweatSheets to create: templates, copies and template instances',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, default=1, help='Seed for reproducible datasets')
+        parser.add_argument(
+            '--read-receipts',
+            action='store_true',
+            default=True,
+            help='Mark messages read by recipients, leaving a short unread tail (default)',
+        )
+        parser.add_argument('--no-read-receipts', action='store_false', dest='read_receipts')
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help=f'Delete previously generated users (usernames starting with {PREFIX!r}) and their data first',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        if options['users'] < 2:
+            raise CommandError('Pass --users 2 or more')
+
+        if options['clear']:
+            self.stdout.write(self.style.WARNING('Clearing generated data...'))
+            generated = User.objects.filter(username__startswith=PREFIX)
+            # Instances protect their templates, so they go first
+            SweatSheet.objects.filter(user__in=generated, template__isnull=False).delete()
+            generated.delete()
+        elif User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError('Generated data already exists; pass --clear to replace it')
+
+        self.catalog = list(WorkoutExercise.objects.values_list('category_id', 'id'))
+        if options['sheets'] and not self.catalog:
+            raise CommandError('No workout exercises found. Run populate_workouts first.')
+
+        started = time.perf_counter()
+        with explicit_timestamps(Conversation, SweatSheet):
+            self.stage('users', self.create_users, options['users'])
+            self.stage('conversations', self.create_conversations, options['conversations'])
+            self.stage(
+                'messages', self.create_messages, options['messages_per'], options['read_receipts']
+            )
+            self.stage('SweatSheets', self.create_sweat_sheets, options['sheets'])
+        self.stage('search documents', search.rebuild)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated dataset in {time.perf_counter() - started:.1f}s; '
+            f'users {PREFIX}000000 and up have password {PASSWORD!r}'
+        ))
+
+    def stage(self, label, create, *args):
+        started = time.perf_counter()
+        count = create(*args)
+        elapsed = time.perf_counter() - started
+        rate = int(count / elapsed) if elapsed else count
+        self.stdout.write(f'{count} {label} in {elapsed:.1f}s ({rate} rows/s)')
+
+    def pick(self, population, cum_weights):
+        return self.rng.choices(population, cum_weights=cum_weights)[0]
+
+    # Users
+
+    def create_users(self, count):
+        rng = self.rng
+        password = make_password(PASSWORD)  # Hashed once and shared: hashing is the slow part
+        roles = []
+        for _ in range(count):
+            share = rng.random()
+            if share < PRO_SHARE:
+                roles.append('PRO')
+            elif share < PRO_SHARE + TEAM_SHARE:
+                roles.append('SWEAT_TEAM_MEMBER')
+            else:
+                roles.append('ATHLETE')
+        # Small datasets still need a coach
+        roles[0] = 'PRO'
+
+        users = []
+        for numbers in batches(range(count), self.batch_size):
+            batch = [
+                User(
+                    username=f'{PREFIX}{number:06d}',
+                    email=f'{PREFIX}{number:06d}@example.com',
+                    # Capitalized as the pre_save signal would
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    password=password,
+                    date_joined=self.now - timedelta(days=rng.uniform(30, 730)),
+                )
+                for number in numbers
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(batch)
+                Profile.objects.bulk_create([
+                    Profile(user=user, role=roles[number], phone_number=f'+1555{rng.randint(1000000, 9999999)}')
+                    for user, number in zip(batch, numbers)
+                ])
+            users.extend(batch)
+
+        # Coaches by popularity: a few of them coach most athletes (Zipf)
+        self.coaches = [user.id for user, role in zip(users, roles) if role != 'ATHLETE']
+        self.coach_weights = list(accumulate(1 / rank for rank in range(1, len(self.coaches) + 1)))
+        self.athletes = [user.id for user, role in zip(users, roles) if role == 'ATHLETE'] or self.coaches
+        self.coach_of = {athlete: self.pick(self.coaches, self.coach_weights) for athlete in self.athletes}
+        self.user_ids = [user.id for user in users]
+        return count
+
+    # Conversations and messages
+
+    def create_conversations(self, count):
+        rng = self.rng
+        through = Conversation.participants.through
+        pairs = set()
+        self.conversations = []
+        for numbers in batches(range(count), self.batch_size):
+            conversations, members = [], []
+            for _ in numbers:
+                age = timedelta(days=rng.uniform(1, 365))
+                # Most conversations were active recently
+                idle = min(timedelta(days=rng.expovariate(1 / 7)), age)
+                if rng.random() < GROUP_SHARE:
+                    coach = self.pick(self.coaches, self.coach_weights)
+                    size = min(len(self.athletes), rng.randint(2, 10))
+                    participants = [coach] + [
+                        athlete for athlete in rng.sample(self.athletes, size) if athlete != coach
+                    ]
+                    conversation = Conversation(
+                        conversation_type='GROUP',
+                        title=f'{rng.choice(SHEET_FOCUS)} squad',
+                    )
+                else:
+                    # Athletes mostly talk to their coach; the rest is anyone to anyone
+                    for _attempt in range(5):
+                        athlete = rng.choice(self.athletes)
+                        other = self.coach_of[athlete] if rng.random() < 0.8 else rng.choice(self.user_ids)
+                        pair = (min(athlete, other), max(athlete, other))
+                        if athlete != other and pair not in pairs:
+                            break
+                    else:
+                        continue
+                    pairs.add(pair)
+                    participants = [other, athlete]
+                    conversation = Conversation(conversation_type='DIRECT')
+                conversation.created_at = self.now - age
+                conversation.updated_at = self.now - idle
+                conversations.append(conversation)
+                members.append(participants)
+
+            with transaction.atomic():
+                Conversation.objects.bulk_create(conversations)
+                through.objects.bulk_create([
+                    through(conversation_id=conversation.id, user_id=user_id)
+                    for conversation, participants in zip(conversations, members)
+                    for user_id in participants
+                ])
+            self.conversations.extend(
+                (conversation.id, conversation.created_at, conversation.updated_at, participants)
+                for conversation, participants in zip(conversations, members)
+            )
+        return len(self.conversations)
+
+    def create_messages(self, messages_per, read_receipts):
+        rng = self.rng
+        adapt = connection.ops.adapt_datetimefield_value
+        # Pareto with alpha 1.5: a long tail of busy conversations; the total
+        # is scaled to the requested average
+        weights = [min(rng.paretovariate(1.5), 100) for _ in self.conversations]
+        scale = messages_per * len(weights) / (sum(weights) or 1)
+        # Ids are assigned here so receipts can refer to messages without reading them back
+        next_id = (Message.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+        messages, receipts, total = [], [], 0
+        for (conversation_id, started, last, participants), weight in zip(self.conversations, weights):
+            count = max(1, round(weight * scale))
+            span = (last - started).total_seconds()
+            times = sorted(started + timedelta(seconds=rng.uniform(0, span)) for _ in range(count - 1))
+            times.append(last)
+            # How many of the latest messages each participant has not read yet
+            read_until = {
+                user_id: count - (0 if rng.random() < 0.7 else rng.randint(1, 10)) for user_id in participants
+            }
+            for index, created_at in enumerate(times):
+                # The first participant (the coach) writes a bit more than the others
+                sender = participants[0] if rng.random() < 0.3 else rng.choice(participants)
+                is_image = rng.random() < 0.03
+                messages.append((
+                    next_id,
+                    conversation_id,
+                    sender,
+                    'IMAGE' if is_image else 'TEXT',
+                    ' '.join(rng.choices(WORDS, k=rng.randint(3, 25))),
+                    f'https://cdn.example.com/uploads/{conversation_id}/{index}.jpg' if is_image else '',
+                    adapt(created_at),
+                    rng.random() < 0.02,
+                    False,
+                ))
+                if read_receipts:
+                    receipts.extend(
+                        (next_id, user_id, adapt(created_at + timedelta(minutes=rng.expovariate(1 / 30))))
+                        for user_id in participants
+                        if user_id != sender and index < read_until[user_id]
+                    )
+                next_id += 1
+            if len(messages) >= self.batch_size:
+                total += self.flush_messages(messages, receipts)
+                messages, receipts = [], []
+        if messages:
+            total += self.flush_messages(messages, receipts)
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Message]):
+                cursor.execute(sql)
+        return total
+
+    def flush_messages(self, messages, receipts):
+        with transaction.atomic():
+            insert_rows(Message, MESSAGE_COLUMNS, messages)
+            insert_rows(MessageRead, ('message', 'user', 'read_at'), receipts)
+        return len(messages)
+
+    # SweatSheets
+
+    def create_sweat_sheets(self, count):
+        rng = self.rng
+        template_count = min(count, max(1, round(count * TEMPLATE_SHARE)))
+        assigned = count - template_count
+
+        # Templates first: instances and copies are made from them
+        templates = []  # (id, name, owner, [(phase id, end ordinal)], total exercises)
+        for numbers in batches(range(template_count), max(1, self.batch_size // 100)):
+            owners = [self.pick(self.coaches, self.coach_weights) for _ in numbers]
+            sheets = self.insert_trees(
+                [dict(user_id=owner, is_template=True) for owner in owners], progress=None
+            )
+            templates.extend(sheets)
+
+        made = template_count
+        template_weights = list(accumulate(1 / rank for rank in range(1, len(templates) + 1)))
+        for numbers in batches(range(assigned), max(1, self.batch_size // 100)):
+            copies, instances = [], []
+            for _ in numbers:
+                athlete = rng.choice(self.athletes)
+                template = self.pick(templates, template_weights)
+                if rng.random() < INSTANCE_SHARE:
+                    instances.append((athlete, template))
+                else:
+                    copies.append(dict(user_id=self.coach_of.get(athlete, template[2]), assigned_to_id=athlete))
+            self.insert_trees(copies, progress=lambda: rng.random())
+            self.insert_instances(instances)
+            made += len(copies) + len(instances)
+        return made
+
+    def sheet_name(self):
+        rng = self.rng
+        return f'{rng.choice(SHEET_LEVELS)} {rng.choice(SHEET_FOCUS)} {rng.choice(SHEET_KINDS)}'
+
+    def insert_trees(self, sheets, progress):
+        """Create SweatSheets with their own trees from ``sheets`` (field dicts);
+        ``progress()`` gives the completed share of each, worked through in order"""
+        rng = self.rng
+        shapes = []
+        for fields in sheets:
+            created_at = self.now - timedelta(days=rng.uniform(1, 180))
+            shape = [
+                [rng.randint(3, 8) for _ in range(rng.randint(2, 5))]
+                for _ in range(rng.randint(2, 6))
+            ]
+            total = sum(map(sum, shape))
+            completed = round(total * progress()) if progress else 0
+            fields.update(
+                name=self.sheet_name(),
+                created_at=created_at,
+                updated_at=created_at,
+                exercise_ordinals=total,
+                total_exercises=total,
+                completed_exercises=completed,
+                last_activity_at=created_at + (self.now - created_at) * rng.random() if completed else None,
+            )
+            shapes.append((shape, completed))
+        if not sheets:
+            return []
+
+        with transaction.atomic():
+            sweat_sheets = SweatSheet.objects.bulk_create([SweatSheet(**fields) for fields in sheets])
+            phases, phase_shapes = [], []
+            for sweat_sheet, (shape, completed) in zip(sweat_sheets, shapes):
+                ordinal = 0
+                for phase_number, sections in enumerate(shape, 1):
+                    size = sum(sections)
+                    done = max(0, min(size, completed - ordinal))
+                    phases.append(Phase(
+                        sweat_sheet=sweat_sheet,
+                        phase_number=phase_number,
+                        is_completed=done == size,
+                        completed_at=sweat_sheet.last_activity_at if done == size else None,
+                        total_exercises=size,
+                        completed_exercises=done,
+                        last_activity_at=sweat_sheet.last_activity_at if done else None,
+                    ))
+                    phase_shapes.append((sections, ordinal, completed))
+                    ordinal += size
+            Phase.objects.bulk_create(phases, batch_size=self.batch_size)
+
+            sections, section_plans = [], []
+            for phase, (sizes, ordinal, completed) in zip(phases, phase_shapes):
+                start = phase.sweat_sheet.created_at.date()
+                for section_number, size in enumerate(sizes, 1):
+                    sections.append(Section(
+                        phase=phase,
+                        section_number=section_number,
+                        date=start + timedelta(days=(phase.phase_number - 1) * 7 + section_number - 1),
+                    ))
+                    section_plans.append((size, ordinal, completed))
+                    ordinal += size
+            Section.objects.bulk_create(sections, batch_size=self.batch_size)
+
+            exercises = []
+            for section, (size, ordinal, completed) in zip(sections, section_plans):
+                for order in range(1, size + 1):
+                    category_id, workout_id = rng.choice(self.catalog)
+                    exercises.append(Exercise(
+                        section=section,
+                        workout_category_id=category_id,
+                        specific_workout_id=workout_id,
+                        sets=str(rng.randint(1, 5)),
+                        reps=rng.choice(REPS),
+                        weight='' if rng.random() < 0.5 else f'{rng.randrange(10, 300, 5)} lbs',
+                        completed=ordinal < completed,
+                        order=order,
+                        ordinal=ordinal,
+                    ))
+                    ordinal += 1
+            Exercise.objects.bulk_create(exercises, batch_size=self.batch_size)
+
+        ends = {}
+        for phase in phases:
+            ends.setdefault(phase.sweat_sheet_id, []).append(phase)
+        result = []
+        for sweat_sheet in sweat_sheets:
+            end, boundaries = 0, []
+            for phase in ends[sweat_sheet.id]:
+                end += phase.total_exercises
+                boundaries.append((phase.id, end))
+            result.append((sweat_sheet.id, sweat_sheet.name, sweat_sheet.user_id, boundaries, sweat_sheet.total_exercises))
+        return result
+
+    def insert_instances(self, instances):
+        """Assign templates to athletes as instances, with a completion bitset
+        and phase overrides for the phases they finished"""
+        rng = self.rng
+        sheets, overrides = [], []
+        for athlete, (template_id, name, owner, boundaries, total) in instances:
+            created_at = self.now - timedelta(days=rng.uniform(1, 180))
+            completed = round(total * rng.random())
+            last_activity_at = created_at + (self.now - created_at) * rng.random() if completed else None
+            sheets.append(SweatSheet(
+                name=name,
+                user_id=owner,
+                assigned_to_id=athlete,
+                template_id=template_id,
+                created_at=created_at,
+                updated_at=created_at,
+                completion=bitsets.from_ordinals(range(completed)),
+                total_exercises=total,
+                completed_exercises=completed,
+                last_activity_at=last_activity_at,
+            ))
+            overrides.append([
+                PhaseOverride(phase_id=phase_id, is_completed=True, completed_at=last_activity_at)
+                for phase_id, end in boundaries if end <= completed
+            ])
+        with transaction.atomic():
+            SweatSheet.objects.bulk_create(sheets)
+            for sweat_sheet, phase_overrides in zip(sheets, overrides):
+                for override in phase_overrides:
+                    override.sweat_sheet = sweat_sheet
+            PhaseOverride.objects.bulk_create(
+                [override for phase_overrides in overrides for override in phase_overrides],
+                batch_size=self.batch_size,
+            )
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api import imports
+
+class Command(BaseCommand):
+    help = (
+        'Import an exercise catalog or program templates from a CSV or JSON Lines file. '
+        'Running it again on the same file resumes an interrupted import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=['catalog', 'programs'], default='catalog')
+        parser.add_argument(
+            '--owner',
+            help='Username owning the import and the imported programs (default: first superuser)',
+        )
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Override detection by file extension')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=imports.CHUNK_SIZE,
+            help='Number of records written per transaction',
+        )
+        parser.add_argument('--restart', action='store_true', help='Start over instead of resuming')
+
+    def handle(self, *args, **options):
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+        else:
+            owner = User.objects.filter(is_superuser=True).order_by('id').first()
+        if owner is None:
+            raise CommandError('Pass --owner with an existing username')
+
+        try:
+            import_job = imports.start(
+                options['kind'].upper(), options['path'], owner,
+                file_format=options['format'], restart=options['restart'],
+            )
+        except (imports.InvalidImport, OSError) as error:
+            raise CommandError(str(error))
+        if import_job.position:
+            self.stdout.write(f'Resuming import #{import_job.id} after record {import_job.position}')
+
+        def report(import_job):
+            self.stdout.write(
+                f'{import_job.position} records, {import_job.imported} imported, '
+                f'{import_job.skipped} skipped, {import_job.rows_per_second} rows/s'
+            )
+
+        try:
+            import_job = imports.run(import_job, chunk_size=options['chunk_size'], on_chunk=report)
+        except (imports.InvalidImport, imports.ImportConflict) as error:
+            raise CommandError(str(error))
+
+        if import_job.last_error:
+            self.stdout.write(self.style.WARNING(f'Last skipped record: {import_job.last_error}'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {import_job.imported} of {import_job.position} records '
+                f'in {import_job.elapsed:.2f}s ({import_job.rows_per_second} rows/s)'
+            )
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from api.models import SweatSheet
+from api import progress
+
+class Command(BaseCommand):
+    help = 'Recompute SweatSheet and Phase progress rollups from their exercises'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of SweatSheets recomputed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sheet_ids = SweatSheet.objects.order_by('id').values_list('id', flat=True)
+        refreshed = 0
+
+        batch = []
+        for sheet_id in sheet_ids.iterator(chunk_size=batch_size):
+            batch.append(sheet_id)
+            if len(batch) >= batch_size:
+                refreshed += progress.refresh_rollups(batch)
+                batch = []
+        if batch:
+            refreshed += progress.refresh_rollups(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt progress rollups for {refreshed} SweatSheets')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from api import search
+import time
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for SweatSheets, notes and workout exercises'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=search.BATCH_SIZE,
+            help='Number of objects indexed per bulk insert',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = search.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {total} documents in {elapsed:.2f}s')
+        )
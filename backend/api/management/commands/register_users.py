@@ -0,0 +1,60 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from api import provisioning
+
+class Command(BaseCommand):
+    help = (
+        'Register user accounts in bulk from a CSV or JSON Lines file with username, email, '
+        'first_name, last_name, password, role and phone_number fields'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=provisioning.BATCH_SIZE,
+            help='Accounts created per transaction',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Processes hashing passwords (default: one per CPU)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            entries = self.read(options['path'])
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        started = time.perf_counter()
+        created = 0
+        batch_size = options['batch_size']
+        for offset in range(0, len(entries), batch_size):
+            users, errors = provisioning.register(
+                entries[offset:offset + batch_size], workers=options['workers']
+            )
+            created += len(users)
+            for error in errors:
+                problems = '; '.join(
+                    f"{field}: {' '.join(str(message) for message in messages)}"
+                    for field, messages in error['errors'].items()
+                )
+                self.stdout.write(self.style.WARNING(f"Record {offset + error['index'] + 1}: {problems}"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Registered {created} of {len(entries)} users in {time.perf_counter() - started:.2f}s'
+            )
+        )
+
+    def read(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as source:
+            if path.lower().endswith('.csv'):
+                # Blank cells take the defaults
+                return [{field: value for field, value in row.items() if value} for row in csv.DictReader(source)]
+            return [json.loads(line) for line in source if line.strip()]
@@ -0,0 +1,160 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections, connections
+from api import jobs
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+PURGE_INTERVAL = 3600  # seconds
+MAX_ERROR_BACKOFF = 60  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+def work(threads, batch_size, poll_interval, once, stop_event):
+    """Run ``threads`` job loops in this process until stopped"""
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job-worker') as pool:
+        futures = [
+            pool.submit(_loop, batch_size, poll_interval, once, stop_event)
+            for _ in range(threads)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def _loop(batch_size, poll_interval, once, stop_event):
+    worker_id = jobs.new_worker_id()
+    processed = 0
+    errors = 0
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            try:
+                claimed = jobs.run_pending(worker_id, batch_size)
+            except Exception:
+                # A locked database or a bad batch must not kill the worker;
+                # back off and try again with a fresh connection
+                errors += 1
+                logger.exception("Job worker %s failed to run a batch", worker_id)
+                connections.close_all()
+                if once:
+                    break
+                stop_event.wait(min(poll_interval * 2 ** errors, MAX_ERROR_BACKOFF))
+                continue
+            errors = 0
+            processed += claimed
+            if not claimed:
+                if once:
+                    break
+                stop_event.wait(poll_interval)
+    finally:
+        connections.close_all()
+    return processed
+
+
+def _process_main(threads, batch_size, poll_interval, once):
+    import django
+    django.setup()  # No-op when forked, required when spawned
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    work(threads, batch_size, poll_interval, once, stop_event)
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers (notifications and other deferred work)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.JOB_WORKER_PROCESSES,
+            help='Number of worker processes',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.JOB_WORKER_THREADS,
+            help='Number of worker threads per process',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.JOB_BATCH_SIZE,
+            help='Maximum number of jobs claimed at once by a worker thread',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='Seconds to wait when the queue is empty',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is drained instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        threads = max(options['threads'], 1)
+        processes = max(options['processes'], 1)
+        worker_args = (threads, options['batch_size'], options['poll_interval'], options['once'])
+
+        purged = jobs.purge_finished(timedelta(days=settings.JOB_RETENTION_DAYS))
+        if purged:
+            self.stdout.write(f'Purged {purged} finished jobs')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Starting {processes} worker process(es) x {threads} thread(s)')
+        )
+
+        if processes == 1:
+            stop_event = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+            try:
+                self._run_in_process(worker_args, stop_event)
+            except KeyboardInterrupt:
+                stop_event.set()
+            return
+
+        # Child processes must not inherit open database connections
+        connections.close_all()
+        children = [
+            multiprocessing.Process(target=_process_main, args=worker_args, daemon=False)
+            for _ in range(processes)
+        ]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+            for child in children:
+                child.join()
+
+    def _run_in_process(self, worker_args, stop_event):
+        threads, batch_size, poll_interval, once = worker_args
+        last_purge = time.monotonic()
+        if once:
+            processed = work(threads, batch_size, poll_interval, once, stop_event)
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+            return
+
+        # Run the pool in the background so this thread can purge old jobs
+        runner = threading.Thread(
+            target=work, args=(threads, batch_size, poll_interval, once, stop_event)
+        )
+        runner.start()
+        while runner.is_alive():
+            runner.join(timeout=1.0)
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                jobs.purge_finished(timedelta(days=settings.JOB_RETENTION_DAYS))
+                close_old_connections()
+                last_purge = time.monotonic()
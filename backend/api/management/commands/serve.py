@@ -0,0 +1,85 @@
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api import server, tokens
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the app in production under gunicorn. Send the master HUP to reload '
+        'gracefully and TERM to stop; probes are at /healthz and /readyz.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=settings.SERVER_BIND, help='Address to listen on, host:port or unix:path')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.SERVER_WORKERS,
+            help='Number of worker processes (default: from the CPU count)',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.SERVER_THREADS,
+            help='Number of request threads per worker process',
+        )
+        parser.add_argument('--asgi', action='store_true', help='Serve backend.asgi with uvicorn workers')
+        parser.add_argument(
+            '--preload',
+            action='store_true',
+            help='Load the app before forking the workers (code changes then need a restart)',
+        )
+        parser.add_argument(
+            '--max-requests',
+            type=int,
+            default=settings.SERVER_MAX_REQUESTS,
+            help='Recycle a worker after this many requests (0 never does)',
+        )
+        parser.add_argument('--max-requests-jitter', type=int, default=settings.SERVER_MAX_REQUESTS_JITTER)
+        parser.add_argument('--timeout', type=int, default=settings.SERVER_TIMEOUT, help='Seconds before a silent worker is restarted')
+        parser.add_argument(
+            '--graceful-timeout',
+            type=int,
+            default=settings.SERVER_GRACEFUL_TIMEOUT,
+            help='Seconds workers get to finish their requests on reload and shutdown',
+        )
+        parser.add_argument('--keepalive', type=int, default=settings.SERVER_KEEPALIVE)
+        parser.add_argument(
+            '--no-prewarm',
+            dest='prewarm',
+            action='store_false',
+            help='Do not open database connections before a worker takes requests (--asgi never does)',
+        )
+        parser.add_argument('--pid', help='Write the master process id to this file, e.g. for kill -HUP')
+        parser.add_argument('--print-config', action='store_true', help='Print the server settings and exit')
+
+    def handle(self, *args, **options):
+        config = server.config(
+            options['bind'], workers=max(options['workers'], 0), threads=max(options['threads'], 1),
+            asgi=options['asgi'], preload=options['preload'], max_requests=max(options['max_requests'], 0),
+            max_requests_jitter=max(options['max_requests_jitter'], 0), timeout=options['timeout'],
+            graceful_timeout=options['graceful_timeout'], keepalive=options['keepalive'],
+            prewarm=options['prewarm'], pidfile=options['pid'],
+        )
+        if options['print_config']:
+            for key, value in config.items():
+                self.stdout.write(f'{key} = {getattr(value, "__name__", value)}')
+            return
+
+        if config['workers'] > 1 and not tokens.shared_cache():
+            raise CommandError(
+                f'TOKEN_CACHE_ALIAS {settings.TOKEN_CACHE_ALIAS!r} is a per-process cache: with '
+                f'{config["workers"]} workers a rotated or revoked refresh token would still work '
+                'in the others. Point it at a shared cache, or pass --workers 1.'
+            )
+        if find_spec('gunicorn') is None:
+            raise CommandError('gunicorn is not installed: pip install gunicorn')
+        if options['asgi'] and find_spec('uvicorn') is None:
+            raise CommandError('--asgi needs uvicorn: pip install uvicorn')
+        self.stdout.write(self.style.SUCCESS(
+            f'Serving on {options["bind"]} with {config["workers"]} {config["worker_class"]} worker(s)'
+            f' x {config["threads"]} thread(s), {server.cpu_count()} CPU(s)'
+        ))
+        server.run(config, asgi=options['asgi'])
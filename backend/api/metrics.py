@@ -0,0 +1,55 @@
+"""Named counters kept in the Django cache.
+
+Counters live in the cache selected by ``METRICS_CACHE_ALIAS`` so web
+processes and job workers can share them; with the default local-memory
+cache each process only sees its own counts. ``GET /api/metrics/`` exposes
+a snapshot to staff users.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'metrics:'
+NAMES_KEY = 'metrics:names'
+
+
+def _cache():
+    return caches[settings.METRICS_CACHE_ALIAS]
+
+
+def incr(name, value=1):
+    """Add ``value`` to counter ``name``, creating it on first use"""
+    if not value:
+        return
+    cache = _cache()
+    key = KEY_PREFIX + name
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        if not cache.add(key, value, timeout=None):
+            cache.incr(key, value)
+        _register(cache, name)
+
+
+def _register(cache, name):
+    names = cache.get(NAMES_KEY) or []
+    if name not in names:
+        cache.set(NAMES_KEY, sorted(set(names) | {name}), timeout=None)
+
+
+def get(name):
+    return _cache().get(KEY_PREFIX + name, 0)
+
+
+def snapshot(prefix=''):
+    """Current value of every counter whose name starts with ``prefix``"""
+    cache = _cache()
+    names = [name for name in cache.get(NAMES_KEY) or [] if name.startswith(prefix)]
+    values = cache.get_many([KEY_PREFIX + name for name in names])
+    return {name: values.get(KEY_PREFIX + name, 0) for name in names}
+
+
+def reset(prefix=''):
+    cache = _cache()
+    names = cache.get(NAMES_KEY) or []
+    cache.delete_many([KEY_PREFIX + name for name in names if name.startswith(prefix)])
+    cache.set(NAMES_KEY, [name for name in names if not name.startswith(prefix)], timeout=None)
@@ -0,0 +1,189 @@
+"""Response compression.
+
+``CompressionMiddleware`` compresses responses with the best encoding the
+client accepts: zstd or brotli when the ``zstandard`` or ``brotli`` package
+is installed, gzip otherwise. Only the API's own media types are
+compressed, JSON and NDJSON: HTML pages such as the admin carry CSRF
+tokens next to text an attacker can influence, and compressing those lets
+the compressed length leak the token (BREACH). For the same reason a
+response that sets the CSRF cookie is never compressed. Responses smaller
+than ``COMPRESSION_MIN_SIZE`` bytes, responses that already have a
+``Content-Encoding`` and uploaded files under ``MEDIA_URL`` are sent as
+they are too. Streaming responses are
+compressed chunk by chunk, flushing after every chunk so clients still
+receive each one as soon as it is produced.
+
+Every compressed response adds its uncompressed size to the
+``compression.<view>.bytes`` counter and the bytes it saved to
+``compression.<view>.saved`` in ``api.metrics``, where ``<view>`` is the
+URL name of the endpoint.
+"""
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ACCEPT_ENCODING_RE = re.compile(r'\s*([a-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?', re.IGNORECASE)
+# The API's media types, the only ones compressed
+COMPRESSIBLE_TYPES = re.compile(r'^application/(json|x-ndjson|[a-z0-9.+-]+\+json)\s*(;|$)', re.IGNORECASE)
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self):
+        # wbits 16 + 15 writes a gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    name = 'zstd'
+
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# In order of preference when the client accepts several equally
+ENCODERS = [
+    encoder for encoder, available in (
+        (ZstdEncoder, zstandard is not None),
+        (BrotliEncoder, brotli is not None),
+        (GzipEncoder, True),
+    )
+    if available
+]
+
+
+def choose_encoder(accept_encoding):
+    """The preferred available encoder acceptable to the client, or None"""
+    weights = {}
+    for match in ACCEPT_ENCODING_RE.finditer(accept_encoding):
+        try:
+            weights[match.group(1).lower()] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+    best = None
+    for encoder in ENCODERS:
+        weight = weights.get(encoder.name, weights.get('*', 0))
+        if weight > 0 and (best is None or weight > best[0]):
+            best = (weight, encoder)
+    return best and best[1]
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if not self._compressible(request, response):
+            return response
+
+        encoder = choose_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        # Whether or not we compress, the response depends on Accept-Encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoder is None:
+            return response
+
+        endpoint = request.resolver_match.url_name if request.resolver_match else None
+        endpoint = endpoint or 'other'
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async_stream(
+                    response.streaming_content, encoder(), endpoint
+                )
+            else:
+                response.streaming_content = self._compress_stream(
+                    response.streaming_content, encoder(), endpoint
+                )
+            del response.headers['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressor = encoder()
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            _record(endpoint, len(response.content), len(compressed))
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag promises byte-identical bodies, which no longer holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoder.name
+        return response
+
+    def _compressible(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return False
+        if settings.MEDIA_URL and request.path.startswith(settings.MEDIA_URL):
+            return False
+        if settings.CSRF_COOKIE_NAME in response.cookies:
+            return False
+        return bool(COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')))
+
+    def _compress_stream(self, chunks, compressor, endpoint):
+        size = compressed = 0
+        for chunk in chunks:
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            compressed += len(data)
+            if data:
+                yield data
+        data = compressor.finish()
+        _record(endpoint, size, compressed + len(data))
+        yield data
+
+    async def _compress_async_stream(self, chunks, compressor, endpoint):
+        size = compressed = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            compressed += len(data)
+            if data:
+                yield data
+        data = compressor.finish()
+        _record(endpoint, size, compressed + len(data))
+        yield data
+
+
+def _record(endpoint, size, compressed):
+    metrics.incr(f'compression.{endpoint}.bytes', size)
+    metrics.incr(f'compression.{endpoint}.saved', size - compressed)
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_conversation_message_messageread'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('SWEATSHEET', 'SweatSheet'), ('NOTE', 'Note'), ('EXERCISE', 'Workout Exercise')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('snippet', models.CharField(blank=True, max_length=300)),
+                ('checksum', models.CharField(max_length=40)),
+                ('is_public', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assignee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('kind', models.CharField(choices=[('SWEATSHEET', 'SweatSheet'), ('NOTE', 'Note'), ('EXERCISE', 'Workout Exercise')], max_length=20)),
+                ('is_public', models.BooleanField(default=False)),
+                ('assignee', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='api.searchdocument')),
+                ('owner', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_public', True)), fields=['term', '-weight'], name='api_searchterm_public'), models.Index(fields=['term', 'owner', '-weight'], name='api_searchterm_owner'), models.Index(fields=['term', 'assignee', '-weight'], name='api_searchterm_assignee')],
+                'unique_together': {('document', 'term')},
+            },
+        ),
+    ]
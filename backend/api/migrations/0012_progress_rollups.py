@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_rollups(apps, schema_editor):
+    Phase = apps.get_model('api', 'Phase')
+    SweatSheet = apps.get_model('api', 'SweatSheet')
+    Exercise = apps.get_model('api', 'Exercise')
+
+    for group_field, model in (('section__phase_id', Phase), ('section__phase__sweat_sheet_id', SweatSheet)):
+        rows = (
+            Exercise.objects.values(group_field)
+            .annotate(total=Count('id'), completed=Count('id', filter=Q(completed=True)))
+        )
+        for row in rows:
+            model.objects.filter(pk=row[group_field]).update(
+                total_exercises=row['total'], completed_exercises=row['completed']
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phase',
+            name='completed_exercises',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phase',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='phase',
+            name='total_exercises',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='completed_exercises',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='total_exercises',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_progress_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
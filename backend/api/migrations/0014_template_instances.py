@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_sweatsheet_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='instances', to='api.sweatsheet'),
+        ),
+        migrations.CreateModel(
+            name='ExerciseOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sets', models.CharField(blank=True, max_length=10, null=True)),
+                ('reps', models.CharField(blank=True, max_length=10, null=True)),
+                ('weight', models.CharField(blank=True, max_length=20, null=True)),
+                ('completed', models.BooleanField(default=False)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overrides', to='api.exercise')),
+                ('sweat_sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_overrides', to='api.sweatsheet')),
+            ],
+            options={
+                'unique_together': {('sweat_sheet', 'exercise')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PhaseOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_completed', models.BooleanField(default=False)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('phase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overrides', to='api.phase')),
+                ('sweat_sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phase_overrides', to='api.sweatsheet')),
+            ],
+            options={
+                'unique_together': {('sweat_sheet', 'phase')},
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+def assign_ordinals(apps, schema_editor):
+    """Number each sheet's exercises and move instance completion into bitsets"""
+    SweatSheet = apps.get_model('api', 'SweatSheet')
+    Exercise = apps.get_model('api', 'Exercise')
+    ExerciseOverride = apps.get_model('api', 'ExerciseOverride')
+
+    ordinals = {}
+    for sweat_sheet_id in SweatSheet.objects.values_list('id', flat=True).iterator():
+        exercises = list(
+            Exercise.objects.filter(section__phase__sweat_sheet_id=sweat_sheet_id)
+            .order_by('section__phase__phase_number', 'section__section_number', 'order', 'id')
+            .only('id')
+        )
+        for ordinal, exercise in enumerate(exercises):
+            exercise.ordinal = ordinal
+            ordinals[exercise.id] = ordinal
+        Exercise.objects.bulk_update(exercises, ['ordinal'], batch_size=500)
+        SweatSheet.objects.filter(id=sweat_sheet_id).update(exercise_ordinals=len(exercises))
+
+    completed = {}
+    for sweat_sheet_id, exercise_id in ExerciseOverride.objects.filter(completed=True).values_list(
+        'sweat_sheet_id', 'exercise_id'
+    ):
+        completed.setdefault(sweat_sheet_id, set()).add(ordinals[exercise_id])
+    for sweat_sheet_id, members in completed.items():
+        bits = bytearray((max(members) >> 3) + 1)
+        for ordinal in members:
+            bits[ordinal >> 3] |= 1 << (ordinal & 7)
+        SweatSheet.objects.filter(id=sweat_sheet_id).update(completion=bytes(bits))
+
+    # Overrides that only recorded completion are no longer needed
+    ExerciseOverride.objects.filter(sets__isnull=True, reps__isnull=True, weight__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_template_instances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='ordinal',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='completion',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='sweatsheet',
+            name='exercise_ordinals',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(assign_ordinals, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='exerciseoverride',
+            name='completed',
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_exercises(apps, schema_editor):
+    """Fold catalog exercises sharing a category and name into the oldest one"""
+    WorkoutExercise = apps.get_model('api', 'WorkoutExercise')
+    Exercise = apps.get_model('api', 'Exercise')
+    SearchDocument = apps.get_model('api', 'SearchDocument')
+
+    keep = {}
+    duplicates = {}
+    for pk, category_id, name in WorkoutExercise.objects.order_by('id').values_list('id', 'category_id', 'name'):
+        kept = keep.setdefault((category_id, name), pk)
+        if kept != pk:
+            duplicates[pk] = kept
+    for duplicate, kept in duplicates.items():
+        Exercise.objects.filter(specific_workout_id=duplicate).update(specific_workout_id=kept)
+    SearchDocument.objects.filter(kind='EXERCISE', object_id__in=list(duplicates)).delete()
+    WorkoutExercise.objects.filter(id__in=list(duplicates)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_completion_bitsets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('CATALOG', 'Exercise catalog'), ('PROGRAMS', 'Program templates')], max_length=10)),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], max_length=10)),
+                ('source', models.CharField(max_length=500)),
+                ('checksum', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('imported', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('elapsed', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(merge_duplicate_exercises, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='workoutexercise',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='api_workoutexercise_unique_name'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
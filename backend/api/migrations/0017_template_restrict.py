@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_catalog_imports'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sweatsheet',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='instances', to='api.sweatsheet'),
+        ),
+    ]
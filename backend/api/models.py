@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
@@ -14,19 +15,24 @@ class Note(models.Model):
         return self.title
 
 # Signal to capitalize user names
+NAME_FIELDS = frozenset(['first_name', 'last_name'])
+
 @receiver(pre_save, sender=User)
-def capitalize_user_names(sender, instance, **kwargs):
-    if instance.first_name:
-        instance.first_name = instance.first_name.capitalize()
-    if instance.last_name:
-        instance.last_name = instance.last_name.capitalize()
+def capitalize_user_names(sender, instance, update_fields=None, **kwargs):
+    # Saves that do not write the names, like the last_login update on every login
+    if update_fields is not None and not NAME_FIELDS & set(update_fields):
+        return
+    for field in NAME_FIELDS:
+        name = getattr(instance, field)
+        if name and name != name.capitalize():
+            setattr(instance, field, name.capitalize())
 
-# Signal to create profile and calendar when user is created
+# Signal to create profile when user is created; calendars are created on
+# first access (see CalendarManager.for_user)
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
-        Calendar.objects.create(user=instance)
 
 class Profile(models.Model):
     ROLE_CHOICES = (
@@ -41,10 +47,35 @@ class Profile(models.Model):
     def __str__(self):
         return self.user.username
 
+class CalendarManager(models.Manager):
+    def for_user(self, user):
+        """The calendar of ``user``, created on first access.
+
+        Many athletes never open their calendar, so none is created with the
+        user. Concurrent first accesses both insert, ignoring the conflict on
+        the unique user column, and read back the one row that won.
+        """
+        calendar = self.filter(user=user).first()
+        if calendar is None:
+            self.bulk_create([self.model(user=user)], ignore_conflicts=True)
+            calendar = self.get(user=user)
+        calendar.user = user
+        return calendar
+
+    async def afor_user_id(self, user_id):
+        """``for_user()`` for async views, which only know the user id"""
+        calendar = await self.filter(user_id=user_id).afirst()
+        if calendar is None:
+            await self.abulk_create([self.model(user_id=user_id)], ignore_conflicts=True)
+            calendar = await self.aget(user_id=user_id)
+        return calendar
+
 class Calendar(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     events = models.JSONField(default=dict)
 
+    objects = CalendarManager()
+
     def __str__(self):
         return f"{self.user.username}'s Calendar"
 
@@ -131,6 +162,12 @@ class WorkoutExercise(models.Model):
     category = models.ForeignKey(WorkoutCategory, on_delete=models.CASCADE, related_name='exercises')
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+
+    class Meta:
+        # Natural key for catalog upserts (see api.imports)
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'name'], name='api_workoutexercise_unique_name'),
+        ]
     
     def __str__(self):
         return f"{self.category.name} - {self.name}"
@@ -143,6 +180,24 @@ class SweatSheet(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_template = models.BooleanField(default=False)  # For reusable templates
+    # Set on template instances: the structure is read from the template and
+    # only per-athlete overrides are stored (see api.trees). A template in
+    # use cannot be deleted on its own, but goes with its instances when
+    # their creator is deleted
+    template = models.ForeignKey(
+        'self', on_delete=models.RESTRICT, related_name='instances', null=True, blank=True
+    )
+    # Completed template exercises of an instance, as a bitset of their
+    # ordinals (see api.bitsets)
+    completion = models.BinaryField(default=b'')
+    # Next free Exercise.ordinal in this tree; ordinals are never reused
+    exercise_ordinals = models.PositiveIntegerField(default=0)
+    # Bumped on every tree edit; tree patches must name the version they were based on
+    version = models.PositiveIntegerField(default=0)
+    # Progress rollups, maintained by api.progress
+    total_exercises = models.PositiveIntegerField(default=0)
+    completed_exercises = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"{self.user.username}'s {self.name}"
@@ -152,6 +207,10 @@ class Phase(models.Model):
     phase_number = models.IntegerField()
     is_completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Progress rollups, maintained by api.progress
+    total_exercises = models.PositiveIntegerField(default=0)
+    completed_exercises = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         unique_together = ['sweat_sheet', 'phase_number']
@@ -181,9 +240,171 @@ class Exercise(models.Model):
     weight = models.CharField(max_length=20, blank=True)
     completed = models.BooleanField(default=False)
     order = models.IntegerField()
+    # Position of the exercise in its SweatSheet's completion bitsets
+    ordinal = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['order']
     
     def __str__(self):
-        return f"{self.specific_workout.name} - {self.sets}x{self.reps}"
\ No newline at end of file
+        return f"{self.specific_workout.name} - {self.sets}x{self.reps}"
+
+class ExerciseOverride(models.Model):
+    """Per-athlete changes to a template exercise in a template instance"""
+    sweat_sheet = models.ForeignKey(SweatSheet, on_delete=models.CASCADE, related_name='exercise_overrides')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='overrides')
+    # Null fields inherit the template's value
+    sets = models.CharField(max_length=10, null=True, blank=True)
+    reps = models.CharField(max_length=10, null=True, blank=True)
+    weight = models.CharField(max_length=20, null=True, blank=True)
+
+    class Meta:
+        unique_together = ['sweat_sheet', 'exercise']
+
+    def __str__(self):
+        return f"{self.sweat_sheet} - exercise {self.exercise_id}"
+
+class PhaseOverride(models.Model):
+    """Per-athlete completion of a template phase in a template instance"""
+    sweat_sheet = models.ForeignKey(SweatSheet, on_delete=models.CASCADE, related_name='phase_overrides')
+    phase = models.ForeignKey(Phase, on_delete=models.CASCADE, related_name='overrides')
+    is_completed = models.BooleanField(default=False)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['sweat_sheet', 'phase']
+
+    def __str__(self):
+        return f"{self.sweat_sheet} - phase {self.phase_id}"
+
+# Search Models
+class SearchDocument(models.Model):
+    """One searchable SweatSheet, note or catalog exercise"""
+    KIND_CHOICES = (
+        ('SWEATSHEET', 'SweatSheet'),
+        ('NOTE', 'Note'),
+        ('EXERCISE', 'Workout Exercise'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=200)
+    snippet = models.CharField(max_length=300, blank=True)
+    checksum = models.CharField(max_length=40)  # Skips re-indexing unchanged text
+    # Visibility: public documents match everyone, the rest only their owner/assignee
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    assignee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    is_public = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.title}"
+
+class SearchTerm(models.Model):
+    """Inverted index posting: a term and its weight within one document"""
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+    # Denormalized from the document so each visibility class has its own
+    # weight-ordered index; cleanup happens through ``document``
+    kind = models.CharField(max_length=20, choices=SearchDocument.KIND_CHOICES)
+    is_public = models.BooleanField(default=False)
+    owner = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+', null=True,
+                              db_index=False, db_constraint=False)
+    assignee = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+', null=True,
+                                 db_index=False, db_constraint=False)
+
+    class Meta:
+        unique_together = ['document', 'term']
+        # Postings are read highest-weight first per term ("champion lists")
+        indexes = [
+            models.Index(fields=['term', '-weight'], condition=models.Q(is_public=True),
+                         name='api_searchterm_public'),
+            models.Index(fields=['term', 'owner', '-weight'], name='api_searchterm_owner'),
+            models.Index(fields=['term', 'assignee', '-weight'], name='api_searchterm_assignee'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.document_id}"
+
+
+# Background Jobs
+class Job(models.Model):
+    """A unit of deferred work picked up by ``manage.py run_workers``"""
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    dedupe_key = models.CharField(max_length=200, blank=True)  # At most one pending job per key
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'], name='api_job_status_run_at')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='PENDING') & ~models.Q(dedupe_key=''),
+                name='api_job_unique_pending_dedupe_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """A resumable bulk import of catalog exercises or program templates (``api.imports``)"""
+    KIND_CHOICES = (
+        ('CATALOG', 'Exercise catalog'),
+        ('PROGRAMS', 'Program templates'),
+    )
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    source = models.CharField(max_length=500)  # Path of the file being imported
+    checksum = models.CharField(max_length=64)  # Recognises the same file when resuming
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    # Records read and committed so far; an interrupted import resumes here
+    position = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    elapsed = models.FloatField(default=0)  # Seconds spent importing, over all runs
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def rows_per_second(self):
+        return round(self.position / self.elapsed, 1) if self.elapsed else 0.0
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import #{self.id} ({self.status})"
@@ -0,0 +1,199 @@
+"""User notifications delivered by background jobs.
+
+Views only enqueue jobs; the handlers below run in ``manage.py run_workers``,
+resolve recipients in bulk and hand a batch of notifications to the
+transport configured by ``NOTIFICATION_TRANSPORT``. Each notification is a
+plain dict with ``user_id``, ``email``, ``subject``, ``body`` and ``data``.
+
+New messages are not delivered one by one. Each recipient gets at most one
+pending digest job per conversation, due ``NOTIFICATION_DIGEST_WINDOW``
+seconds after the first message it covers, so a burst in a group chat
+collapses into a single notification. Messages the recipient has already
+read by then are left out. The ``notifications.*`` counters in
+``api.metrics`` record how many per-message notifications were emitted or
+suppressed.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import get_connection, EmailMessage
+from django.utils.module_loading import import_string
+
+from . import jobs, metrics
+from .jobs import job
+from .models import Conversation, Job, Message, SweatSheet
+
+logger = logging.getLogger(__name__)
+
+
+class BaseTransport:
+    def send(self, notifications):
+        raise NotImplementedError
+
+
+class LocMemTransport(BaseTransport):
+    """Keeps sent notifications in ``LocMemTransport.outbox``, for tests"""
+    outbox = []
+
+    def send(self, notifications):
+        LocMemTransport.outbox.extend(notifications)
+
+
+class ConsoleTransport(BaseTransport):
+    """Logs notifications instead of delivering them, for development"""
+
+    def send(self, notifications):
+        for notification in notifications:
+            logger.info(
+                "Notification for user %s: %s", notification['user_id'], notification['subject']
+            )
+
+
+class EmailTransport(BaseTransport):
+    """Sends each notification as an email over one SMTP connection"""
+
+    def send(self, notifications):
+        messages = [
+            EmailMessage(notification['subject'], notification['body'], to=[notification['email']])
+            for notification in notifications
+            if notification['email']
+        ]
+        if messages:
+            get_connection().send_messages(messages)
+
+
+def get_transport():
+    return import_string(settings.NOTIFICATION_TRANSPORT)()
+
+
+def display_name(user):
+    return f"{user.first_name} {user.last_name}".strip() or user.username
+
+
+def _notification(user, subject, body, **data):
+    return {
+        'user_id': user.id,
+        'email': user.email,
+        'subject': subject,
+        'body': body,
+        'data': data,
+    }
+
+
+def _digest_key(user_id, conversation_id):
+    return f'digest:{user_id}:{conversation_id}'
+
+
+@job('notifications.new_message', batch=True)
+def notify_new_messages(payloads):
+    """Fan new messages out to one pending digest per recipient and conversation"""
+    messages = (
+        Message.objects.filter(id__in=[payload['message_id'] for payload in payloads], is_deleted=False)
+        .prefetch_related('conversation__participants')
+        .order_by('id')
+    )
+
+    window = timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+    for message in messages:
+        for participant in message.conversation.participants.all():
+            if participant.id == message.sender_id:
+                continue
+            digest = jobs.enqueue(
+                'notifications.conversation_digest',
+                {
+                    'user_id': participant.id,
+                    'conversation_id': message.conversation_id,
+                    'first_message_id': message.id,
+                },
+                dedupe_key=_digest_key(participant.id, message.conversation_id),
+                delay=window,
+            )
+            if digest.payload['first_message_id'] != message.id:
+                metrics.incr('notifications.coalesced')
+
+
+@job('notifications.conversation_digest', batch=True)
+def send_conversation_digests(payloads):
+    users = User.objects.in_bulk([payload['user_id'] for payload in payloads])
+    conversations = Conversation.objects.in_bulk([payload['conversation_id'] for payload in payloads])
+
+    notifications = []
+    considered = 0
+    for payload in payloads:
+        user = users.get(payload['user_id'])
+        conversation = conversations.get(payload['conversation_id'])
+        if user is None or conversation is None:
+            continue
+
+        messages = Message.objects.filter(
+            conversation=conversation,
+            id__gte=payload['first_message_id'],
+            is_deleted=False,
+        ).exclude(sender=user)
+
+        # Messages after this point belong to the next digest already queued
+        next_digest = Job.objects.filter(
+            dedupe_key=_digest_key(user.id, conversation.id), status='PENDING'
+        ).values_list('payload', flat=True).first()
+        if next_digest:
+            messages = messages.filter(id__lt=next_digest['first_message_id'])
+
+        considered += messages.count()
+        unread = list(
+            messages.exclude(read_by__user=user)
+            .select_related('sender')
+            .order_by('id')
+        )
+        if unread:
+            notifications.append(_digest_notification(user, conversation, unread))
+
+    metrics.incr('notifications.messages', considered)
+    metrics.incr('notifications.emitted', len(notifications))
+    metrics.incr('notifications.suppressed', considered - len(notifications))
+
+    if notifications:
+        get_transport().send(notifications)
+
+
+def _digest_notification(user, conversation, messages):
+    senders = list(dict.fromkeys(display_name(message.sender) for message in messages))
+    latest = messages[-1]
+    if len(messages) == 1:
+        subject = f"New message from {senders[0]}"
+    else:
+        subject = f"{len(messages)} new messages from {', '.join(senders[:3])}"
+        if len(senders) > 3:
+            subject += f" and {len(senders) - 3} others"
+    if conversation.conversation_type == 'GROUP' and conversation.title:
+        subject += f" in {conversation.title}"
+
+    return _notification(
+        user,
+        subject,
+        latest.content[:200],
+        conversation_id=conversation.id,
+        message_ids=[message.id for message in messages],
+    )
+
+
+@job('notifications.sweatsheet_assigned', batch=True)
+def notify_sweatsheets_assigned(payloads):
+    sweatsheets = SweatSheet.objects.filter(
+        id__in=[payload['sweat_sheet_id'] for payload in payloads],
+        assigned_to__isnull=False
+    ).select_related('user', 'assigned_to')
+
+    notifications = [
+        _notification(
+            sweatsheet.assigned_to,
+            f"New SweatSheet: {sweatsheet.name}",
+            f"{display_name(sweatsheet.user)} assigned you the SweatSheet \"{sweatsheet.name}\".",
+            sweat_sheet_id=sweatsheet.id,
+        )
+        for sweatsheet in sweatsheets
+    ]
+
+    if notifications:
+        get_transport().send(notifications)
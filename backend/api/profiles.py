@@ -0,0 +1,186 @@
+"""Per-user snapshots of the ``GET /api/profile/`` document.
+
+The profile page polls its document, which joins ``auth_user`` and
+``api_profile``. Each user's document is kept rendered, with its ETag, in
+the cache selected by ``PROFILE_CACHE_ALIAS`` under ``profiles:<user id>``,
+and is written through rather than invalidated: saving a User or a Profile
+stores the new snapshot once the transaction commits, and deleting a user
+drops it. Together with ``JWTStatelessUserAuthentication`` on the view, a
+read of a cached snapshot usually makes no database query.
+
+The snapshot also carries what requests are authorized on, the user's
+active flag and role, and those must not lag behind the database: writes
+that send no signals (``update()``, ``bulk_create()``) skip the write
+through, and with the default local-memory cache every process keeps its
+own snapshots and only sees its own writes. So both are read again from
+the database once they are ``PROFILE_AUTH_SECONDS`` old, and kept until
+then under ``profiles:access:<user id>``; a snapshot that disagrees with
+them is rebuilt. The rest of the document may stay stale until
+``PROFILE_CACHE_SECONDS`` pass, so bulk writers of users and profiles call
+``forget_many()`` with the ids they changed; share the cache in
+production.
+
+A miss builds the snapshot from the database and stores it with ``add()``,
+so it never replaces a snapshot written through while it was reading.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.http import quote_etag
+
+from . import metrics, renderers
+from .models import Profile
+
+KEY_PREFIX = 'profiles:'
+ACCESS_PREFIX = 'profiles:access:'
+# User fields that appear in the snapshot
+USER_FIELDS = frozenset(['username', 'first_name', 'last_name', 'email', 'is_active'])
+
+
+class Snapshot:
+    """The rendered profile document of one user"""
+    __slots__ = ('user_id', 'is_active', 'role', 'body', 'etag')
+
+    def __init__(self, user_id, is_active, role, body):
+        self.user_id = user_id
+        self.is_active = is_active
+        self.role = role
+        self.body = body
+        self.etag = quote_etag(hashlib.md5(body).hexdigest())
+
+
+def _cache():
+    return caches[settings.PROFILE_CACHE_ALIAS]
+
+
+def _key(user_id):
+    return f'{KEY_PREFIX}{user_id}'
+
+
+def _access_key(user_id):
+    return f'{ACCESS_PREFIX}{user_id}'
+
+
+def _access(user_id):
+    return User.objects.filter(pk=user_id).values_list('is_active', 'profile__role')
+
+
+def _current(snapshot, access):
+    return snapshot is not None and access is not None and (snapshot.is_active, snapshot.role) == tuple(access)
+
+
+def render(user, profile):
+    return Snapshot(user.pk, user.is_active, profile.role, renderers.dumps({
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'profile': {
+            'role': profile.role,
+            'phone_number': profile.phone_number,
+        }
+    }))
+
+
+def get(user_id):
+    """The snapshot of the user, built on a miss, with an active flag and
+    role at most ``PROFILE_AUTH_SECONDS`` old; raises ``User.DoesNotExist``"""
+    key, access_key = _key(user_id), _access_key(user_id)
+    found = _cache().get_many([key, access_key])
+    snapshot, access = found.get(key), found.get(access_key)
+    if snapshot is not None and access is None:
+        access = _access(user_id).first()
+        if access is None:
+            raise User.DoesNotExist('User matching query does not exist.')
+        _cache().set(access_key, access, timeout=settings.PROFILE_AUTH_SECONDS)
+    if _current(snapshot, access):
+        metrics.incr('profiles.hits')
+        return snapshot
+    metrics.incr('profiles.misses')
+    user = User.objects.select_related('profile').get(pk=user_id)
+    fresh = render(user, user.profile)
+    # Replace a stale snapshot, but never one written through while this was reading
+    if snapshot is not None:
+        _cache().set(key, fresh, timeout=settings.PROFILE_CACHE_SECONDS)
+    else:
+        _cache().add(key, fresh, timeout=settings.PROFILE_CACHE_SECONDS)
+    _cache().set(access_key, (fresh.is_active, fresh.role), timeout=settings.PROFILE_AUTH_SECONDS)
+    return fresh
+
+
+async def aget(user_id):
+    """``get()`` for async views"""
+    key, access_key = _key(user_id), _access_key(user_id)
+    found = await _cache().aget_many([key, access_key])
+    snapshot, access = found.get(key), found.get(access_key)
+    if snapshot is not None and access is None:
+        access = await _access(user_id).afirst()
+        if access is None:
+            raise User.DoesNotExist('User matching query does not exist.')
+        await _cache().aset(access_key, access, timeout=settings.PROFILE_AUTH_SECONDS)
+    if _current(snapshot, access):
+        metrics.incr('profiles.hits')
+        return snapshot
+    metrics.incr('profiles.misses')
+    user = await User.objects.select_related('profile').aget(pk=user_id)
+    fresh = render(user, user.profile)
+    if snapshot is not None:
+        await _cache().aset(key, fresh, timeout=settings.PROFILE_CACHE_SECONDS)
+    else:
+        await _cache().aadd(key, fresh, timeout=settings.PROFILE_CACHE_SECONDS)
+    await _cache().aset(access_key, (fresh.is_active, fresh.role), timeout=settings.PROFILE_AUTH_SECONDS)
+    return fresh
+
+
+def write(user, profile):
+    """Store the snapshot of ``user`` once the current transaction commits,
+    and return it"""
+    snapshot = render(user, profile)
+
+    def store():
+        _cache().set(_key(user.pk), snapshot, timeout=settings.PROFILE_CACHE_SECONDS)
+        _cache().set(
+            _access_key(user.pk), (snapshot.is_active, snapshot.role), timeout=settings.PROFILE_AUTH_SECONDS
+        )
+
+    transaction.on_commit(store)
+    return snapshot
+
+
+def forget(user_id):
+    forget_many([user_id])
+
+
+def forget_many(user_ids):
+    """Drop the snapshots of users changed without signals, e.g. by ``update()``"""
+    _cache().delete_many([key for user_id in user_ids for key in (_key(user_id), _access_key(user_id))])
+
+
+@receiver(post_save, sender=User)
+def write_user(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # A new user has no profile until create_user_profile saves it, which
+    # writes the snapshot; logins only update last_login
+    if raw or created or (update_fields is not None and not USER_FIELDS & set(update_fields)):
+        return
+    try:
+        profile = instance.profile
+    except Profile.DoesNotExist:
+        return
+    write(instance, profile)
+
+
+@receiver(post_save, sender=Profile)
+def write_profile(sender, instance, raw=False, **kwargs):
+    if not raw:
+        write(instance.user, instance)
+
+
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    transaction.on_commit(lambda: forget(instance.pk))
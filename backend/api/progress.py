@@ -0,0 +1,333 @@
+"""Exercise completion and SweatSheet progress.
+
+Completion changes are applied with set-based ``update()`` calls. Phases
+and SweatSheets carry denormalized rollups (``total_exercises``,
+``completed_exercises``, ``last_activity_at``) that are adjusted in the
+same transaction, so dashboards read progress without touching the
+Phase -> Section -> Exercise tree. ``refresh_rollups()`` recomputes them
+from scratch after structural edits and from ``manage.py
+rebuild_progress_rollups``.
+
+Template instances (see ``api.trees``) have no tree of their own: their
+completion is a bitset over the template's ``Exercise.ordinal`` values in
+``SweatSheet.completion`` (see ``api.bitsets``). Toggling an exercise flips
+one bit, the SweatSheet rollup is its popcount, and phase and section
+progress is counted from the bitset without any per-exercise rows.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import bitsets, documents
+from .models import SweatSheet, Phase, Exercise, PhaseOverride
+
+MAX_BULK_EXERCISES = 500
+ORDINALS_CACHE_SECONDS = 3600
+
+
+def trackable_sweatsheets(user):
+    """SweatSheets whose progress ``user`` may change: assigned to them or created by them"""
+    return SweatSheet.objects.filter(models.Q(assigned_to=user) | models.Q(user=user))
+
+
+def percent(completed, total):
+    return round(100.0 * completed / total, 1) if total else 0.0
+
+
+def _aggregate(group_field, ids):
+    rows = (
+        Exercise.objects.filter(**{f'{group_field}__in': ids})
+        .values(group_field)
+        .annotate(total=Count('id'), completed=Count('id', filter=Q(completed=True)))
+    )
+    return {row[group_field]: (row['total'], row['completed']) for row in rows}
+
+
+def _rollup(obj, **extra):
+    return {
+        'id': obj['id'],
+        'total': obj['total_exercises'],
+        'completed': obj['completed_exercises'],
+        'percent': percent(obj['completed_exercises'], obj['total_exercises']),
+        'last_activity_at': obj['last_activity_at'],
+        **extra,
+    }
+
+
+def progress_for(section_ids, phase_ids, sweat_sheet_ids):
+    """Completion counts and percentages for the given sections, phases and sheets"""
+    rollup_fields = ('id', 'total_exercises', 'completed_exercises', 'last_activity_at')
+    return {
+        'sections': [
+            {'id': section_id, 'total': total, 'completed': completed, 'percent': percent(completed, total)}
+            for section_id, (total, completed) in _aggregate('section_id', section_ids).items()
+        ],
+        'phases': [
+            _rollup(phase, is_completed=phase['is_completed'])
+            for phase in Phase.objects.filter(id__in=phase_ids).values(*rollup_fields, 'is_completed')
+        ],
+        'sweat_sheets': [
+            _rollup(sweat_sheet)
+            for sweat_sheet in SweatSheet.objects.filter(id__in=sweat_sheet_ids).values(*rollup_fields)
+        ],
+    }
+
+
+def set_exercises_completed(exercises, completed=True, auto_complete_phases=False):
+    """Mark every exercise in the ``exercises`` queryset (un)completed.
+
+    Only rows whose state changes are written, in one UPDATE, and the
+    rollups of their phases and sheets move by the same amount inside the
+    same transaction. With ``auto_complete_phases`` a phase is marked
+    completed once all of its exercises are, and reopened when one of them
+    is un-completed. Returns ``(result, found_ids)``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            exercises.select_for_update()
+            .values_list('id', 'completed', 'section_id', 'section__phase_id', 'section__phase__sweat_sheet_id')
+        )
+        changing = [row for row in rows if row[1] != completed]
+        updated = Exercise.objects.filter(id__in=[row[0] for row in changing]).update(completed=completed)
+
+        step = 1 if completed else -1
+        phase_ids = {row[3] for row in rows}
+        sweat_sheet_ids = {row[4] for row in rows}
+        _apply_deltas(Phase, Counter(row[3] for row in changing), step, phase_ids, now)
+        _apply_deltas(SweatSheet, Counter(row[4] for row in changing), step, sweat_sheet_ids, now)
+        documents.invalidate(sweat_sheet_ids)
+
+        if auto_complete_phases and phase_ids:
+            sync_phase_completion(phase_ids)
+
+    result = {
+        'updated': updated,
+        'completed': completed,
+        'progress': progress_for({row[2] for row in rows}, phase_ids, sweat_sheet_ids),
+    }
+    return result, [row[0] for row in rows]
+
+
+def _apply_deltas(model, changes, step, touched_ids, now):
+    by_delta = {}
+    for obj_id, count in changes.items():
+        by_delta.setdefault(count * step, []).append(obj_id)
+    for delta, ids in by_delta.items():
+        model.objects.filter(id__in=ids).update(
+            completed_exercises=F('completed_exercises') + delta, last_activity_at=now
+        )
+    model.objects.filter(id__in=set(touched_ids) - set(changes)).update(last_activity_at=now)
+
+
+def sync_phase_completion(phase_ids):
+    """Complete phases whose exercises are all done and reopen the others"""
+    Phase.objects.filter(
+        id__in=phase_ids, is_completed=False,
+        total_exercises__gt=0, completed_exercises=F('total_exercises')
+    ).update(is_completed=True, completed_at=timezone.now())
+    Phase.objects.filter(id__in=phase_ids, is_completed=True).filter(
+        Q(total_exercises=0) | Q(completed_exercises__lt=F('total_exercises'))
+    ).update(is_completed=False, completed_at=None)
+    documents.invalidate(phase_ids=phase_ids)
+
+
+def touch(phase):
+    """Record activity on a phase and its SweatSheet without changing counts"""
+    now = timezone.now()
+    Phase.objects.filter(id=phase.id).update(last_activity_at=now)
+    SweatSheet.objects.filter(id=phase.sweat_sheet_id).update(last_activity_at=now)
+    documents.invalidate([phase.sweat_sheet_id])
+
+
+def refresh_rollups(sweat_sheet_ids):
+    """Recompute the rollups of the given SweatSheets and their phases from the
+    tree, and those of template instances of or among them"""
+    sweat_sheet_ids = list(sweat_sheet_ids)
+    with transaction.atomic():
+        phase_counts = _aggregate('section__phase_id', Phase.objects.filter(
+            sweat_sheet_id__in=sweat_sheet_ids
+        ).values('id'))
+        phases = list(Phase.objects.filter(sweat_sheet_id__in=sweat_sheet_ids).only(
+            'id', 'total_exercises', 'completed_exercises'
+        ))
+        for phase in phases:
+            phase.total_exercises, phase.completed_exercises = phase_counts.get(phase.id, (0, 0))
+        Phase.objects.bulk_update(phases, ['total_exercises', 'completed_exercises'], batch_size=500)
+
+        sheet_counts = _aggregate('section__phase__sweat_sheet_id', sweat_sheet_ids)
+        sweat_sheets = list(SweatSheet.objects.filter(id__in=sweat_sheet_ids).only(
+            'id', 'total_exercises', 'completed_exercises'
+        ))
+        for sweat_sheet in sweat_sheets:
+            sweat_sheet.total_exercises, sweat_sheet.completed_exercises = sheet_counts.get(sweat_sheet.id, (0, 0))
+        SweatSheet.objects.bulk_update(sweat_sheets, ['total_exercises', 'completed_exercises'], batch_size=500)
+
+        instances = list(
+            SweatSheet.objects.filter(Q(id__in=sweat_sheet_ids) | Q(template_id__in=sweat_sheet_ids))
+            .filter(template__isnull=False)
+            .only('id', 'template_id', 'completion')
+        )
+        templates = {instance.template_id for instance in instances}
+        live = {template_id: [] for template_id in templates}
+        for template_id, ordinal in Exercise.objects.filter(
+            section__phase__sweat_sheet__in=templates
+        ).values_list('section__phase__sweat_sheet_id', 'ordinal'):
+            live[template_id].append(ordinal)
+        # Bits of exercises deleted from the template no longer count
+        masks = {template_id: bitsets.from_ordinals(ordinals) for template_id, ordinals in live.items()}
+        for instance in instances:
+            instance.total_exercises = len(live[instance.template_id])
+            instance.completed_exercises = bitsets.count(bytes(instance.completion), masks[instance.template_id])
+        SweatSheet.objects.bulk_update(instances, ['total_exercises', 'completed_exercises'], batch_size=500)
+        # Instances of these sheets are covered by their template's document version
+        documents.invalidate(sweat_sheet_ids)
+    return len(sweat_sheets)
+
+
+# Template instances
+
+def instance_for(user, exercise_ids=(), sweat_sheet_id=None, phase_id=None):
+    """The template instance whose copy of the given template nodes ``user`` is
+    working on: the trackable instance ``sweat_sheet_id`` if given, otherwise
+    the instance assigned to ``user`` whose template holds them"""
+    if sweat_sheet_id is not None:
+        return trackable_sweatsheets(user).filter(pk=sweat_sheet_id, template__isnull=False).first()
+    instances = SweatSheet.objects.filter(assigned_to=user, template__isnull=False)
+    if phase_id is not None:
+        return instances.filter(template__phases=phase_id).first()
+    return instances.filter(template__phases__sections__exercises__in=exercise_ids).first()
+
+
+def completion(instance):
+    """The completion bitset of a template instance, read fresh"""
+    return bytes(SweatSheet.objects.values_list('completion', flat=True).get(pk=instance.pk))
+
+
+def completed_exercise_ids(instance):
+    """Ids of the template exercises completed in ``instance``"""
+    bits, version = SweatSheet.objects.values_list('completion', 'template__version').get(pk=instance.pk)
+    ordinals = _template_ordinals(instance.template_id, version)
+    return {ordinals[ordinal] for ordinal in bitsets.members(bytes(bits)) if ordinal in ordinals}
+
+
+def _template_ordinals(template_id, version):
+    """{ordinal: exercise id} of a template, cached per tree version"""
+    key = f'progress:ordinals:{template_id}:{version}'
+    ordinals = cache.get(key)
+    if ordinals is None:
+        ordinals = dict(
+            Exercise.objects.filter(section__phase__sweat_sheet=template_id).values_list('ordinal', 'id')
+        )
+        cache.set(key, ordinals, ORDINALS_CACHE_SECONDS)
+    return ordinals
+
+
+def _instance_counts(instance, phase_ids):
+    """{phase_id: {section_id: [total, completed]}} for an instance"""
+    bits = completion(instance)
+    counts = {phase_id: {} for phase_id in phase_ids}
+    for ordinal, section_id, phase_id in Exercise.objects.filter(
+        section__phase_id__in=phase_ids
+    ).values_list('ordinal', 'section_id', 'section__phase_id'):
+        section = counts[phase_id].setdefault(section_id, [0, 0])
+        section[0] += 1
+        section[1] += bitsets.contains(bits, ordinal)
+    return counts
+
+
+def instance_progress_for(instance, section_ids, phase_ids):
+    """``progress_for()`` of a template instance"""
+    counts = _instance_counts(instance, phase_ids)
+    states = {state.phase_id: state for state in instance.phase_overrides.filter(phase_id__in=phase_ids)}
+    sections, phases = [], []
+    for phase_id, phase_sections in counts.items():
+        total = sum(section[0] for section in phase_sections.values())
+        completed = sum(section[1] for section in phase_sections.values())
+        state = states.get(phase_id)
+        phases.append({
+            'id': phase_id,
+            'total': total,
+            'completed': completed,
+            'percent': percent(completed, total),
+            'last_activity_at': state.last_activity_at if state else None,
+            'is_completed': state.is_completed if state else False,
+        })
+        sections.extend(
+            {'id': section_id, 'total': total, 'completed': completed, 'percent': percent(completed, total)}
+            for section_id, (total, completed) in phase_sections.items()
+            if section_id in section_ids
+        )
+    sweat_sheet = SweatSheet.objects.filter(pk=instance.pk).values(
+        'id', 'total_exercises', 'completed_exercises', 'last_activity_at'
+    )
+    return {'sections': sections, 'phases': phases, 'sweat_sheets': [_rollup(row) for row in sweat_sheet]}
+
+
+def set_instance_exercises_completed(instance, exercise_ids, completed=True, auto_complete_phases=False):
+    """``set_exercises_completed()`` for template exercises of a template instance.
+
+    Flips the exercises' bits in the instance's completion bitset and moves
+    its rollup by the number of bits that changed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Exercise.objects.filter(id__in=exercise_ids, section__phase__sweat_sheet=instance.template_id)
+            .values_list('id', 'section_id', 'section__phase_id', 'ordinal')
+        )
+        sheet = SweatSheet.objects.select_for_update().filter(pk=instance.pk)
+        bits, changed = bitsets.update(
+            bytes(sheet.values_list('completion', flat=True).get()), [row[3] for row in rows], completed
+        )
+        step = 1 if completed else -1
+        sheet.update(
+            completion=bits,
+            completed_exercises=F('completed_exercises') + step * len(changed),
+            last_activity_at=now,
+        )
+        instance.completion = bits
+        documents.invalidate([instance.id])
+
+        phase_ids = {row[2] for row in rows}
+        PhaseOverride.objects.bulk_create(
+            [PhaseOverride(sweat_sheet=instance, phase_id=phase_id, last_activity_at=now) for phase_id in phase_ids],
+            update_conflicts=True, unique_fields=['sweat_sheet', 'phase'], update_fields=['last_activity_at'],
+        )
+        if auto_complete_phases and phase_ids:
+            sync_instance_phase_completion(instance, phase_ids)
+
+    result = {
+        'updated': len(changed),
+        'completed': completed,
+        'progress': instance_progress_for(instance, {row[1] for row in rows}, phase_ids),
+    }
+    return result, [row[0] for row in rows]
+
+
+def sync_instance_phase_completion(instance, phase_ids):
+    """``sync_phase_completion()`` for the phases of a template instance"""
+    now = timezone.now()
+    counts = _instance_counts(instance, phase_ids)
+    for phase_id, sections in counts.items():
+        total = sum(section[0] for section in sections.values())
+        done = total > 0 and all(section[0] == section[1] for section in sections.values())
+        state = PhaseOverride.objects.filter(sweat_sheet=instance, phase_id=phase_id)
+        if done:
+            state.filter(is_completed=False).update(is_completed=True, completed_at=now)
+        else:
+            state.filter(is_completed=True).update(is_completed=False, completed_at=None)
+    documents.invalidate([instance.id])
+
+
+def complete_instance_phase(instance, phase):
+    now = timezone.now()
+    PhaseOverride.objects.update_or_create(
+        sweat_sheet=instance, phase=phase,
+        defaults={'is_completed': True, 'completed_at': now, 'last_activity_at': now},
+    )
+    SweatSheet.objects.filter(id=instance.id).update(last_activity_at=now)
+    documents.invalidate([instance.id])
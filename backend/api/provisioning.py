@@ -0,0 +1,134 @@
+"""Bulk registration of user accounts, for onboarding whole team rosters.
+
+``register(entries)`` validates every entry on its own, hashes the
+passwords of the valid ones across a process pool (hashing is slow by
+design, a few hundred milliseconds per password) and inserts the users with
+their profiles in one transaction with ``bulk_create``, instead of a
+``create_user()`` plus the profile insert of the ``create_user_profile``
+signal per user. Invalid entries are reported back by position and do not
+stop the others.
+
+Used by ``POST /api/register/bulk/`` and ``manage.py register_users``. The
+endpoint hashes in the request's own process and takes at most
+``MAX_USERS`` accounts, so a roster is done well within the server's
+worker timeout; larger rosters go through the command, in batches of
+``BATCH_SIZE`` spread over every CPU.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .models import Profile
+from .serializers import RosterUserSerializer
+
+# Accounts per request of the bulk registration endpoint: about 11s of
+# hashing at 220ms a password, against a SERVER_TIMEOUT of 30s
+MAX_USERS = 50
+# Accounts per transaction of manage.py register_users
+BATCH_SIZE = 1000
+# Below this many passwords, starting worker processes costs more than it saves
+PARALLEL_THRESHOLD = 4
+
+
+def _setup_worker():
+    # Workers started with spawn (macOS, Windows) import Django afresh
+    django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """``make_password()`` of every password, in order, hashed by up to
+    ``workers`` processes (default: one per CPU). Empty passwords give
+    unusable ones."""
+    passwords = [password or None for password in passwords]
+    usable = [password for password in passwords if password is not None]
+    workers = min(workers or os.cpu_count() or 1, len(usable))
+    if workers <= 1 or len(usable) < PARALLEL_THRESHOLD:
+        hashed = [make_password(password) for password in usable]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as pool:
+            hashed = list(pool.map(make_password, usable, chunksize=max(1, len(usable) // (workers * 4))))
+    hashed = iter(hashed)
+    return [make_password(None) if password is None else next(hashed) for password in passwords]
+
+
+def _error(index, field, message):
+    return {'index': index, 'errors': {field: [message]}}
+
+
+def register(entries, allowed_roles=None, workers=None):
+    """Create an account for every valid entry of ``entries``, dicts of
+    ``RosterUserSerializer`` fields.
+
+    Returns ``(users, errors)``: the created users, with their profiles, and
+    ``{'index': ..., 'errors': {field: [...]}}`` for every skipped entry.
+    """
+    valid, errors, seen = [], [], set()
+    for index, entry in enumerate(entries):
+        serializer = RosterUserSerializer(data=entry)
+        if not serializer.is_valid():
+            errors.append({'index': index, 'errors': serializer.errors})
+            continue
+        data = serializer.validated_data
+        if allowed_roles is not None and data['role'] not in allowed_roles:
+            errors.append(_error(index, 'role', f"You cannot create {data['role']} accounts"))
+        elif data['username'] in seen:
+            errors.append(_error(index, 'username', 'Duplicate username in this request.'))
+        else:
+            seen.add(data['username'])
+            valid.append((index, data))
+
+    # Checked before hashing so taken usernames cost no hashing; the insert
+    # re-checks for registrations that happened in between
+    valid = _drop_taken(valid, errors)
+    passwords = hash_passwords([data['password'] for _, data in valid], workers=workers)
+    accounts = list(zip(valid, passwords))
+
+    users = []
+    for attempt in range(2):
+        try:
+            users = _insert(accounts)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+            available = {index for index, _ in _drop_taken([account[0] for account in accounts], errors)}
+            accounts = [account for account in accounts if account[0][0] in available]
+    errors.sort(key=lambda error: error['index'])
+    return users, errors
+
+
+def _drop_taken(valid, errors):
+    """``valid`` without the entries whose username exists, which are added to ``errors``"""
+    taken = set(User.objects.filter(
+        username__in=[data['username'] for _, data in valid]
+    ).values_list('username', flat=True))
+    for index, data in valid:
+        if data['username'] in taken:
+            errors.append(_error(index, 'username', 'A user with that username already exists.'))
+    return [(index, data) for index, data in valid if data['username'] not in taken]
+
+
+def _insert(accounts):
+    if not accounts:
+        return []
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username=data['username'],
+                email=User.objects.normalize_email(data['email']),
+                first_name=data['first_name'],
+                last_name=data['last_name'],
+                password=password,
+            )
+            for (_, data), password in accounts
+        ])
+        # Bulk inserts skip the create_user_profile signal
+        Profile.objects.bulk_create([
+            Profile(user=user, role=data['role'], phone_number=data['phone_number'])
+            for user, ((_, data), _) in zip(users, accounts)
+        ])
+    return users
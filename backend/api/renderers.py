@@ -0,0 +1,74 @@
+"""Fast JSON encoding and decoding for API requests and responses.
+
+``orjson`` is used when it is installed and the standard library otherwise.
+Values orjson does not know (Decimals, lazy strings, ...) are converted
+the same way DRF's own ``JSONRenderer`` does, and UTC datetimes are written
+with a ``Z`` suffix like DRF writes them, so both produce identical output. ``FastJSONRenderer`` and
+``FastJSONParser`` are the default renderer and parser in
+``REST_FRAMEWORK``; ``manage.py benchmark json_rendering`` compares them
+with DRF's.
+"""
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+# Valid JSON but not valid JavaScript; DRF escapes them too
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def dumps(data):
+    """Encode ``data`` as compact UTF-8 JSON bytes"""
+    content = None
+    if orjson is not None:
+        try:
+            content = orjson.dumps(
+                data, default=_encoder.default,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits; the stdlib encoder takes those
+            pass
+    if content is None:
+        content = json.dumps(
+            data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        ).encode('utf-8')
+    if b'\xe2\x80' in content:
+        for character, escaped in LINE_SEPARATORS:
+            content = content.replace(character, escaped)
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` encoding through ``dumps()``"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indented output (``Accept: application/json; indent=4``) is left to DRF
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """``JSONParser`` decoding UTF-8 bodies with orjson when it is installed"""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,311 @@
+"""Full-text search over SweatSheets, notes and the workout exercise catalog.
+
+The index is a small inverted index stored in two tables: one
+``SearchDocument`` per indexed object and one ``SearchTerm`` row per distinct
+term in that document. Model signals keep it up to date one object at a
+time; ``rebuild()`` (used by ``manage.py rebuild_search_index``) repopulates
+it in bulk.
+
+Queries use champion lists: for every query term only the highest-weight
+postings visible to the user are read (through one index per visibility
+class), and exact scores are computed for that candidate set. Latency
+therefore stays flat as common terms accumulate postings.
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum, Case, When, FloatField, Value
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Note, SweatSheet, WorkoutExercise, SearchDocument, SearchTerm
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+BATCH_SIZE = 2000
+CANDIDATES_PER_TERM = 200
+# Term statistics only feed the ranking, so slightly stale values are fine
+STATS_CACHE_SECONDS = 300
+DOCUMENT_COUNT_KEY = 'search:documents'
+
+KIND_NAMES = {
+    'sweatsheet': 'SWEATSHEET',
+    'note': 'NOTE',
+    'exercise': 'EXERCISE',
+}
+VISIBILITY_FIELDS = ('is_public', 'owner_id', 'assignee_id')
+
+
+def tokenize(text):
+    """Split text into lowercase index terms"""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall((text or '').lower())
+        if token not in STOP_WORDS
+    ]
+
+
+def _weigh_terms(title, body):
+    weights = Counter()
+    for token in tokenize(title):
+        weights[token] += TITLE_WEIGHT
+    for token in tokenize(body):
+        weights[token] += BODY_WEIGHT
+    # Dampen long documents repeating the same word
+    return {term: 1.0 + math.log(weight) for term, weight in weights.items()}
+
+
+def _document_fields(instance):
+    """Return (kind, defaults, body) describing how an object is indexed"""
+    if isinstance(instance, SweatSheet):
+        return 'SWEATSHEET', {
+            'title': instance.name[:200],
+            'snippet': '',
+            'owner_id': instance.user_id,
+            'assignee_id': instance.assigned_to_id,
+            'is_public': instance.is_template,
+        }, ''
+    if isinstance(instance, Note):
+        return 'NOTE', {
+            'title': instance.title[:200],
+            'snippet': instance.content[:300],
+            'owner_id': instance.author_id,
+            'assignee_id': None,
+            'is_public': False,
+        }, instance.content
+    if isinstance(instance, WorkoutExercise):
+        return 'EXERCISE', {
+            'title': instance.name[:200],
+            'snippet': instance.description[:300],
+            'owner_id': None,
+            'assignee_id': None,
+            'is_public': True,
+        }, instance.description
+    raise TypeError(f"{type(instance).__name__} is not searchable")
+
+
+def _checksum(title, body):
+    return hashlib.sha1(f"{title}\x00{body}".encode('utf-8')).hexdigest()
+
+
+def _postings(document, body):
+    return [
+        SearchTerm(
+            document=document,
+            term=term,
+            weight=weight,
+            kind=document.kind,
+            is_public=document.is_public,
+            owner_id=document.owner_id,
+            assignee_id=document.assignee_id,
+        )
+        for term, weight in _weigh_terms(document.title, body).items()
+    ]
+
+
+def index_instance(instance):
+    """Add or refresh one object in the index"""
+    kind, defaults, body = _document_fields(instance)
+    defaults['checksum'] = _checksum(defaults['title'], body)
+
+    with transaction.atomic():
+        document = SearchDocument.objects.filter(kind=kind, object_id=instance.pk).first()
+        if document is None:
+            document = SearchDocument.objects.create(kind=kind, object_id=instance.pk, **defaults)
+        else:
+            text_changed = document.checksum != defaults['checksum']
+            visibility_changed = any(
+                getattr(document, field) != defaults[field] for field in VISIBILITY_FIELDS
+            )
+            for attr, value in defaults.items():
+                setattr(document, attr, value)
+            document.save()
+
+            if not text_changed:
+                # Postings are still valid; only their copy of visibility may be stale
+                if visibility_changed:
+                    document.terms.update(**{field: defaults[field] for field in VISIBILITY_FIELDS})
+                return document
+            document.terms.all().delete()
+
+        SearchTerm.objects.bulk_create(_postings(document, body))
+    return document
+
+
+def remove_instance(instance):
+    """Drop one object from the index"""
+    kind = _document_fields(instance)[0]
+    SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Rebuild the whole index from scratch; returns the number of documents"""
+    total = 0
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        SearchDocument.objects.all().delete()
+
+        for queryset in (SweatSheet.objects.all(), Note.objects.all(), WorkoutExercise.objects.all()):
+            batch = []
+            for instance in queryset.iterator(chunk_size=batch_size):
+                batch.append(instance)
+                if len(batch) >= batch_size:
+                    total += _bulk_index(batch)
+                    batch = []
+            if batch:
+                total += _bulk_index(batch)
+    cache.delete(DOCUMENT_COUNT_KEY)
+    return total
+
+
+def reindex(instances):
+    """Refresh many objects of one model in the index with bulk inserts, for
+    rows written without signals (e.g. by ``api.imports``)"""
+    if not instances:
+        return 0
+    kind = _document_fields(instances[0])[0]
+    with transaction.atomic():
+        SearchDocument.objects.filter(kind=kind, object_id__in=[instance.pk for instance in instances]).delete()
+        total = _bulk_index(instances)
+    cache.delete(DOCUMENT_COUNT_KEY)
+    return total
+
+
+def _bulk_index(instances):
+    documents = []
+    bodies = []
+    for instance in instances:
+        kind, defaults, body = _document_fields(instance)
+        defaults['checksum'] = _checksum(defaults['title'], body)
+        documents.append(SearchDocument(kind=kind, object_id=instance.pk, **defaults))
+        bodies.append(body)
+
+    SearchDocument.objects.bulk_create(documents)
+    SearchTerm.objects.bulk_create([
+        posting
+        for document, body in zip(documents, bodies)
+        for posting in _postings(document, body)
+    ], batch_size=BATCH_SIZE)
+    return len(documents)
+
+
+def _inverse_document_frequencies(terms):
+    """idf of each term present in the index, cached for STATS_CACHE_SECONDS"""
+    keys = {f'search:df:{term}': term for term in terms}
+    cached = cache.get_many(list(keys) + [DOCUMENT_COUNT_KEY])
+
+    document_count = cached.get(DOCUMENT_COUNT_KEY)
+    if document_count is None:
+        document_count = SearchDocument.objects.count()
+        cache.set(DOCUMENT_COUNT_KEY, document_count, STATS_CACHE_SECONDS)
+
+    frequencies = {keys[key]: df for key, df in cached.items() if key in keys}
+    missing = [term for term in terms if term not in frequencies]
+    if missing:
+        counted = dict(
+            SearchTerm.objects.filter(term__in=missing)
+            .values_list('term')
+            .annotate(df=Count('id'))
+        )
+        for term in missing:
+            frequencies[term] = counted.get(term, 0)
+        cache.set_many(
+            {f'search:df:{term}': frequencies[term] for term in missing},
+            STATS_CACHE_SECONDS
+        )
+
+    return {
+        term: math.log(1 + max(document_count, 1) / df)
+        for term, df in frequencies.items()
+        if df
+    }
+
+
+def _candidates(user, term, kinds, per_term):
+    """Highest-weight postings of ``term`` in each visibility class"""
+    candidate_ids = set()
+    for visibility in ({'is_public': True}, {'owner': user}, {'assignee': user}):
+        postings = SearchTerm.objects.filter(term=term, **visibility)
+        if kinds:
+            postings = postings.filter(kind__in=kinds)
+        candidate_ids.update(
+            postings.order_by('-weight').values_list('document_id', flat=True)[:per_term]
+        )
+    return candidate_ids
+
+
+def search(user, query, kinds=None, limit=20):
+    """Rank documents visible to ``user`` against ``query``.
+
+    Documents matching more query terms always rank first; ties are broken
+    by the sum of term weight times inverse document frequency.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    idf = _inverse_document_frequencies(terms)
+    if not idf:
+        return []
+
+    per_term = max(limit * 10, CANDIDATES_PER_TERM)
+    candidate_ids = set()
+    for term in idf:
+        candidate_ids.update(_candidates(user, term, kinds, per_term))
+    if not candidate_ids:
+        return []
+
+    ranked = list(
+        SearchTerm.objects.filter(document_id__in=candidate_ids, term__in=list(idf))
+        .values('document_id')
+        .annotate(
+            matched=Count('id'),
+            score=Sum(Case(
+                *[When(term=term, then=Value(value)) for term, value in idf.items()],
+                output_field=FloatField(),
+            ) * F('weight')),
+        )
+        .order_by('-matched', '-score', 'document_id')[:limit]
+    )
+
+    documents = SearchDocument.objects.in_bulk([row['document_id'] for row in ranked])
+    results = []
+    for row in ranked:
+        document = documents[row['document_id']]
+        results.append({
+            'type': document.get_kind_display(),
+            'kind': document.kind.lower(),
+            'id': document.object_id,
+            'title': document.title,
+            'snippet': document.snippet,
+            'score': round(row['score'], 4),
+            'matched_terms': row['matched'],
+        })
+    return results
+
+
+# Signals keeping the index in sync with the source tables
+@receiver(post_save, sender=SweatSheet)
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=WorkoutExercise)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_instance(instance)
+
+@receiver(post_delete, sender=SweatSheet)
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=WorkoutExercise)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_instance(instance)
@@ -1,9 +1,16 @@
 from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers
+from . import bitsets, progress, trees
 from .models import (
     Note, Profile, Calendar, 
     Conversation, Message, MessageRead,
-    WorkoutCategory, WorkoutExercise, SweatSheet, Phase, Section, Exercise
+    WorkoutCategory, WorkoutExercise, SweatSheet, Phase, Section, Exercise,
+    ImportJob
 )
 
 class UserSerializer(serializers.ModelSerializer):
@@ -281,34 +288,55 @@ class WorkoutExerciseSerializer(serializers.ModelSerializer):
 class ExerciseSerializer(serializers.ModelSerializer):
     workout_category = WorkoutCategorySerializer(read_only=True)
     specific_workout = WorkoutExerciseSerializer(read_only=True)
+    # Catalog references are validated in bulk by SweatSheetSerializer
+    workout_category_id = serializers.IntegerField(write_only=True)
+    specific_workout_id = serializers.IntegerField(write_only=True)
     
     class Meta:
         model = Exercise
         fields = [
             'id', 'workout_category', 'specific_workout', 
-            'sets', 'reps', 'weight', 'completed', 'order'
+            'sets', 'reps', 'weight', 'completed', 'order', 'ordinal',
+            'workout_category_id', 'specific_workout_id'
         ]
+        read_only_fields = ['ordinal']
+        extra_kwargs = {
+            'sets': {'allow_blank': True},
+            'reps': {'allow_blank': True},
+            'order': {'required': False},
+        }
     
     def create(self, validated_data):
         # Handle nested creation if needed
         return super().create(validated_data)
 
 class SectionSerializer(serializers.ModelSerializer):
-    exercises = ExerciseSerializer(many=True, read_only=True)
+    exercises = ExerciseSerializer(many=True, required=False)
     
     class Meta:
         model = Section
         fields = ['id', 'section_number', 'date', 'exercises']
 
 class PhaseSerializer(serializers.ModelSerializer):
-    sections = SectionSerializer(many=True, read_only=True)
+    sections = SectionSerializer(many=True, required=False)
     
     class Meta:
         model = Phase
-        fields = ['id', 'phase_number', 'is_completed', 'completed_at', 'sections']
+        fields = [
+            'id', 'phase_number', 'is_completed', 'completed_at',
+            'total_exercises', 'completed_exercises', 'last_activity_at', 'sections'
+        ]
+        read_only_fields = ['completed_at', 'total_exercises', 'completed_exercises', 'last_activity_at']
 
 class SweatSheetSerializer(serializers.ModelSerializer):
-    phases = PhaseSerializer(many=True, read_only=True)
+    """SweatSheet with its full Phase -> Section -> Exercise tree.
+
+    Writing ``phases`` (on create, or on update to replace the tree) stores
+    the whole tree with one bulk insert per level; see ``api.trees``.
+    Template instances are rendered from their template's tree with the
+    athlete's overrides merged in.
+    """
+    phases = PhaseSerializer(many=True, required=False)
     creator_name = serializers.SerializerMethodField()
     assigned_to = serializers.CharField(source='assigned_to.username', read_only=True)
     
@@ -316,8 +344,115 @@ class SweatSheetSerializer(serializers.ModelSerializer):
         model = SweatSheet
         fields = [
             'id', 'name', 'created_at', 'updated_at', 'is_active', 
-            'is_template', 'phases', 'creator_name', 'assigned_to'
+            'is_template', 'phases', 'creator_name', 'assigned_to',
+            'total_exercises', 'completed_exercises', 'last_activity_at', 'version', 'template'
         ]
+        read_only_fields = ['total_exercises', 'completed_exercises', 'last_activity_at', 'version', 'template']
     
     def get_creator_name(self, obj):
-        return f"{obj.user.first_name} {obj.user.last_name}".strip() or obj.user.username
\ No newline at end of file
+        return f"{obj.user.first_name} {obj.user.last_name}".strip() or obj.user.username
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.template_id:
+            data['phases'] = self._instance_phases(instance)
+        return data
+
+    def _instance_phases(self, instance):
+        phases = PhaseSerializer(instance.template.phases.all(), many=True, context=self.context).data
+        exercise_overrides = {o.exercise_id: o for o in instance.exercise_overrides.all()}
+        phase_overrides = {o.phase_id: o for o in instance.phase_overrides.all()}
+        completion = bytes(instance.completion)
+        timestamp = serializers.DateTimeField()
+
+        def render_time(value):
+            return timestamp.to_representation(value) if value else None
+
+        for phase in phases:
+            completed = 0
+            for section in phase['sections']:
+                for exercise in section['exercises']:
+                    exercise['completed'] = bitsets.contains(completion, exercise['ordinal'])
+                    completed += exercise['completed']
+                    override = exercise_overrides.get(exercise['id'])
+                    for field in trees.OVERRIDE_FIELDS:
+                        if override is not None and getattr(override, field) is not None:
+                            exercise[field] = getattr(override, field)
+            state = phase_overrides.get(phase['id'])
+            phase['is_completed'] = bool(state and state.is_completed)
+            phase['completed_at'] = render_time(state and state.completed_at)
+            phase['last_activity_at'] = render_time(state and state.last_activity_at)
+            phase['completed_exercises'] = completed
+        return phases
+
+    def validate_phases(self, phases):
+        errors = trees.numbering_errors(phases) + trees.reference_errors(phases)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return phases
+
+    def create(self, validated_data):
+        phases = validated_data.pop('phases', [])
+        with transaction.atomic():
+            sweat_sheet = super().create(validated_data)
+            if phases:
+                trees.create_tree(sweat_sheet, phases)
+        return trees.with_tree(SweatSheet.objects).get(pk=sweat_sheet.pk)
+
+    def update(self, instance, validated_data):
+        phases = validated_data.pop('phases', None)
+        with transaction.atomic():
+            if phases is not None:
+                instance.version = F('version') + 1
+            sweat_sheet = super().update(instance, validated_data)
+            if phases is not None:
+                trees.replace_tree(sweat_sheet, phases)
+        return trees.with_tree(SweatSheet.objects).get(pk=sweat_sheet.pk)
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'kind', 'file_format', 'status', 'position', 'imported', 'skipped',
+            'last_error', 'rows_per_second', 'created_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+class CompleteExerciseSerializer(serializers.Serializer):
+    """Body of ``POST /api/exercises/<id>/complete/``"""
+    # The template instance to complete the exercise on (see progress.instance_for)
+    sweat_sheet_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+
+class CompleteExercisesSerializer(CompleteExerciseSerializer):
+    """Body of ``POST /api/exercises/complete/``"""
+    exercise_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=progress.MAX_BULK_EXERCISES
+    )
+    completed = serializers.BooleanField(default=True)
+    auto_complete_phases = serializers.BooleanField(default=False)
+
+class RosterUserSerializer(serializers.Serializer):
+    """One account of a bulk registration (see api.provisioning)"""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    # Accounts without a password cannot log in until one is set
+    password = serializers.CharField(required=False, allow_blank=True, default='', trim_whitespace=False)
+    role = serializers.ChoiceField(choices=Profile.ROLE_CHOICES, default='ATHLETE')
+    phone_number = serializers.CharField(max_length=15, required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        # Capitalized here because bulk inserts skip the pre_save signal
+        data['first_name'] = data['first_name'].capitalize()
+        data['last_name'] = data['last_name'].capitalize()
+        if data['password']:
+            user = User(username=data['username'], email=data['email'],
+                        first_name=data['first_name'], last_name=data['last_name'])
+            try:
+                validate_password(data['password'], user)
+            except DjangoValidationError as error:
+                raise serializers.ValidationError({'password': list(error.messages)})
+        return data
@@ -0,0 +1,157 @@
+"""Production HTTP server: the app under gunicorn, sized from the CPU count.
+
+``manage.py serve`` starts a gunicorn master that forks the worker
+processes. By default they are sync workers, or gthread workers with
+``--threads``, or uvicorn event loops serving ``backend.asgi`` with
+``--asgi``. A worker is recycled after ``max_requests`` requests, with
+jitter so the workers do not all restart at once. The master handles the
+usual signals:
+
+- ``HUP``: graceful reload. New workers start with freshly loaded code and
+  settings, and the old ones finish their requests within
+  ``graceful_timeout``
+- ``TERM``: graceful shutdown
+- ``TTIN``/``TTOU``: one worker more or fewer
+
+``preload`` loads the application, URLconf and views in the master before
+forking, so workers share that memory and start answering at once. A
+preloaded master cannot reload code on ``HUP``; restart it instead.
+``prewarm`` opens the database connection of every worker thread before it
+takes traffic, which pays off with persistent connections
+(``CONN_MAX_AGE``).
+
+Under ``--asgi`` there are no request threads to keep connections on: the
+ORM runs on whichever executor thread is free, and a persistent connection
+left on each of them piles up without being reused or closed at the end of
+a request. ASGI workers therefore run with ``CONN_MAX_AGE = 0`` whatever
+the settings say, and are not prewarmed.
+
+Processes that only serve the API start with less loaded under
+``DJANGO_SETTINGS_MODULE=backend.settings_api``; the ``startup`` benchmark
+tracks the difference.
+
+Probes: ``/healthz`` answers as long as the worker serves requests, and
+``/readyz`` only when the database and caches respond too (api/health.py).
+
+gunicorn, and uvicorn for ``--asgi``, are optional dependencies needed
+only by this server.
+"""
+import os
+import threading
+from concurrent.futures import wait
+
+from django.db import connections
+from django.urls import get_resolver
+
+# How long prewarming waits for the other threads of a worker
+PREWARM_TIMEOUT = 10
+
+
+def cpu_count():
+    """CPUs this process may run on, which in a container can be fewer than the host has"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers(asgi=False, threads=1):
+    # Sync workers block on every request, hence the usual 2 per CPU + 1;
+    # threads already overlap the waiting, and one event loop per CPU keeps
+    # the CPUs busy under ASGI
+    cpus = cpu_count()
+    if asgi:
+        return cpus
+    return cpus + 1 if threads > 1 else 2 * cpus + 1
+
+
+def worker_class(asgi, threads):
+    if asgi:
+        return 'uvicorn.workers.UvicornWorker'
+    return 'gthread' if threads > 1 else 'sync'
+
+
+def config(bind, workers=0, threads=0, asgi=False, preload=False, max_requests=0,
+           max_requests_jitter=0, timeout=30, graceful_timeout=30, keepalive=5,
+           prewarm=True, pidfile=None):
+    """gunicorn settings for these options; 0 workers or threads picks the default"""
+    threads = threads or 1
+    workers = workers or default_workers(asgi, threads)
+    options = {
+        'bind': [bind],
+        'workers': workers,
+        'threads': threads,
+        'worker_class': worker_class(asgi, threads),
+        'preload_app': preload,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests_jitter,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'keepalive': keepalive,
+        'pidfile': pidfile,
+        'accesslog': '-',
+        'pre_fork': pre_fork,
+    }
+    if prewarm and not asgi:
+        options['post_worker_init'] = prewarm_worker
+    return options
+
+
+def load(asgi=False):
+    """The WSGI or ASGI application, with the URLconf and views imported"""
+    if asgi:
+        # Connections close at the end of every request (see above)
+        for alias in connections:
+            connections.settings[alias]['CONN_MAX_AGE'] = 0
+        from backend.asgi import application
+    else:
+        from backend.wsgi import application
+    get_resolver().url_patterns
+    return application
+
+
+def pre_fork(server, worker):
+    # Connections opened by a preloading master must not be shared with workers
+    connections.close_all()
+
+
+def _connect():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def prewarm_worker(worker):
+    """Open the database connections of the worker and of each of its request
+    threads, which gthread workers keep in ``tpool``"""
+    _connect()
+    pool = getattr(worker, 'tpool', None)
+    threads = worker.cfg.threads
+    if pool is None or threads <= 1:
+        return
+    # Every task holds its thread until all have connected, so each runs on a different thread
+    barrier = threading.Barrier(threads)
+
+    def connect_thread():
+        _connect()
+        try:
+            barrier.wait(timeout=PREWARM_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+
+    wait([pool.submit(connect_thread) for _ in range(threads)], timeout=PREWARM_TIMEOUT)
+    worker.log.info('Opened database connections for %d threads', threads)
+
+
+def run(options, asgi=False):
+    """Run gunicorn with ``config()`` settings until it is stopped"""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load(asgi)
+
+    Server().run()
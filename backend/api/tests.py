@@ -1,3 +1,1136 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import async_views, bitsets, documents, health, jobs, profiles, progress, provisioning, renderers, search, server, tokens, trees
+from .jobs import job
+from .middleware import CompressionMiddleware
+from .models import (
+    Calendar, Conversation, Exercise, ImportJob, Profile, Job, Message, Note, Phase, SearchDocument,
+    SweatSheet, WorkoutCategory, WorkoutExercise
+)
+from .notifications import LocMemTransport
+from .serializers import CompleteExercisesSerializer
+from .tokens import RefreshToken
+
+calls = []
+
+
+def make_user(username, role='ATHLETE', **fields):
+    user = User.objects.create(username=username, **fields)
+    user.profile.role = role
+    user.profile.save(update_fields=['role'])
+    return user
+
+
+def make_template(owner, phases=2, exercises=3):
+    """A template SweatSheet of ``owner`` with ``phases`` phases of one
+    section each, holding ``exercises`` catalog exercises"""
+    category, _ = WorkoutCategory.objects.get_or_create(name='Lower Body')
+    catalog = [
+        WorkoutExercise.objects.get_or_create(category=category, name=f'Exercise {n}')[0]
+        for n in range(exercises)
+    ]
+    template = SweatSheet.objects.create(name='Block A', user=owner, is_template=True)
+    trees.create_tree(template, [
+        {
+            'phase_number': phase,
+            'sections': [{
+                'section_number': 1,
+                'date': timezone.localdate(),
+                'exercises': [
+                    {'workout_category_id': category.id, 'specific_workout_id': workout.id, 'sets': '3', 'reps': '10'}
+                    for workout in catalog
+                ],
+            }],
+        }
+        for phase in range(1, phases + 1)
+    ])
+    template.refresh_from_db()
+    return template
+
+
+def tree_shape(sweat_sheet):
+    """The tree of a SweatSheet as nested tuples, for comparing whole trees"""
+    return [
+        (phase.phase_number, phase.is_completed, [
+            (section.section_number, [
+                (exercise.specific_workout_id, exercise.sets, exercise.reps, exercise.completed)
+                for exercise in section.exercises.order_by('order', 'id')
+            ])
+            for section in phase.sections.order_by('section_number')
+        ])
+        for phase in sweat_sheet.phases.order_by('phase_number')
+    ]
+
+
+@job('tests.record')
+def record(payload):
+    calls.append(payload)
+
+
+@job('tests.record_batch', batch=True)
+def record_batch(payloads):
+    calls.append(list(payloads))
+
+
+@job('tests.fail', max_attempts=3)
+def fail(payload):
+    raise RuntimeError('boom')
+
+
+@override_settings(JOB_RETRY_BACKOFF=30, JOB_LOCK_TIMEOUT=300)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def run_due(self):
+        return jobs.run_pending(jobs.new_worker_id(), 100)
+
+    def test_enqueue_dedupes_pending_jobs(self):
+        first = jobs.enqueue('tests.record', {'n': 1}, dedupe_key='same')
+        second = jobs.enqueue('tests.record', {'n': 2}, dedupe_key='same')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+        # Once the pending job has run, the key queues a new one
+        self.run_due()
+        third = jobs.enqueue('tests.record', {'n': 3}, dedupe_key='same')
+        self.assertNotEqual(third.pk, first.pk)
+        self.assertEqual(calls, [{'n': 1}])
+
+    def test_enqueue_rejects_unknown_jobs(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('tests.unknown')
+
+    def test_failures_back_off_until_failed(self):
+        failing = jobs.enqueue('tests.fail')
+        for attempt in range(1, 4):
+            before = timezone.now()
+            with self.assertLogs('api.jobs', level='ERROR'):
+                self.assertEqual(self.run_due(), 1)
+            failing.refresh_from_db()
+            self.assertEqual(failing.attempts, attempt)
+            if attempt < 3:
+                self.assertEqual(failing.status, 'PENDING')
+                backoff = timedelta(seconds=30 * 2 ** (attempt - 1))
+                self.assertGreaterEqual(failing.run_at, before + backoff)
+                self.assertEqual(self.run_due(), 0)
+                Job.objects.filter(pk=failing.pk).update(run_at=timezone.now())
+        self.assertEqual(failing.status, 'FAILED')
+        self.assertIn('boom', failing.last_error)
+        self.assertIsNotNone(failing.finished_at)
+
+    def test_batch_handlers_get_every_payload_at_once(self):
+        for n in range(3):
+            jobs.enqueue('tests.record_batch', {'n': n})
+        jobs.enqueue('tests.record', {'single': True})
+        self.assertEqual(self.run_due(), 4)
+        self.assertIn([{'n': 0}, {'n': 1}, {'n': 2}], calls)
+        self.assertIn({'single': True}, calls)
+        self.assertEqual(Job.objects.filter(status='DONE').count(), 4)
+
+    def test_abandoned_jobs_are_reclaimed(self):
+        abandoned = jobs.enqueue('tests.record', {'n': 1})
+        Job.objects.filter(pk=abandoned.pk).update(
+            status='RUNNING', locked_by='dead', locked_at=timezone.now() - timedelta(seconds=600)
+        )
+        self.assertEqual(self.run_due(), 1)
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.status, 'DONE')
+        self.assertEqual(calls, [{'n': 1}])
+
+    def test_abandoned_job_with_pending_twin_is_superseded(self):
+        abandoned = jobs.enqueue('tests.record', {'n': 1}, dedupe_key='twin')
+        Job.objects.filter(pk=abandoned.pk).update(
+            status='RUNNING', locked_by='dead', locked_at=timezone.now() - timedelta(seconds=600)
+        )
+        twin = jobs.enqueue('tests.record', {'n': 2}, dedupe_key='twin')
+        self.assertNotEqual(twin.pk, abandoned.pk)
+
+        self.assertEqual(self.run_due(), 1)
+        abandoned.refresh_from_db()
+        twin.refresh_from_db()
+        self.assertEqual(abandoned.status, 'DONE')
+        self.assertIn('superseded', abandoned.last_error)
+        self.assertEqual(twin.status, 'DONE')
+        self.assertEqual(calls, [{'n': 2}])
+
+
+@override_settings(
+    NOTIFICATION_TRANSPORT='api.notifications.LocMemTransport', NOTIFICATION_DIGEST_WINDOW=0
+)
+class NotificationTests(TestCase):
+    def setUp(self):
+        LocMemTransport.outbox.clear()
+        self.coach = User.objects.create(username='coach', first_name='Casey')
+        self.athlete = User.objects.create(username='athlete', email='athlete@example.com')
+
+    def run_all(self):
+        worker_id = jobs.new_worker_id()
+        while jobs.run_pending(worker_id, 100):
+            pass
+
+    def test_sweatsheet_assignment_is_delivered(self):
+        sheet = SweatSheet.objects.create(name='Block A', user=self.coach, assigned_to=self.athlete)
+        jobs.enqueue('notifications.sweatsheet_assigned', {'sweat_sheet_id': sheet.id})
+        self.run_all()
+        self.assertEqual(len(LocMemTransport.outbox), 1)
+        notification = LocMemTransport.outbox[0]
+        self.assertEqual(notification['user_id'], self.athlete.id)
+        self.assertEqual(notification['subject'], 'New SweatSheet: Block A')
+
+    def test_messages_collapse_into_one_digest(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.coach, self.athlete)
+        for content in ('one', 'two', 'three'):
+            message = Message.objects.create(conversation=conversation, sender=self.coach, content=content)
+            jobs.enqueue('notifications.new_message', {'message_id': message.id})
+        self.run_all()
+        self.assertEqual(len(LocMemTransport.outbox), 1)
+        self.assertEqual(LocMemTransport.outbox[0]['subject'], '3 new messages from Casey')
+
+    def test_posted_message_queues_its_notification(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.coach, self.athlete)
+        client = APIClient()
+        client.force_authenticate(self.coach)
+        response = client.post(
+            f'/api/conversations/{conversation.id}/messages/', {'content': 'hello'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Job.objects.filter(name='notifications.new_message', status='PENDING').exists())
+        self.run_all()
+        self.assertEqual(LocMemTransport.outbox[0]['subject'], 'New message from Casey')
+
+    def test_posted_message_wakes_long_polls(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.coach, self.athlete)
+        client = APIClient()
+        client.force_authenticate(self.coach)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f'/api/conversations/{conversation.id}/messages/', {'content': 'hello'}, format='json'
+            )
+        marker = caches[settings.LONG_POLL_CACHE_ALIAS].get(f'{async_views.CHANGED_PREFIX}{conversation.id}')
+        self.assertEqual(marker, response.data['id'])
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        caches[settings.TOKEN_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username='athlete', password='secret')
+        self.client = APIClient()
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def post_refresh(self, refresh):
+        return self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+
+    def test_refresh_rotates_the_token(self):
+        response = self.post_refresh(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], self.refresh)
+        self.assertEqual(self.post_refresh(response.data['refresh']).status_code, 200)
+
+    def test_concurrent_refreshes_share_the_successor(self):
+        first = self.post_refresh(self.refresh)
+        second = self.post_refresh(self.refresh)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+
+    def test_rotated_token_is_refused_after_the_reuse_window(self):
+        self.post_refresh(self.refresh)
+        # What expiring the successor entry leaves behind
+        caches[settings.TOKEN_CACHE_ALIAS].delete(
+            tokens.SUCCESSOR_KEY + hashlib.sha256(self.refresh.encode()).hexdigest()
+        )
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+    def test_users_deactivated_without_signals_cannot_refresh(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+    def test_deleted_users_cannot_refresh(self):
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+
+class ImportUploadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.upload_dir = directory.name
+        self.enterContext(override_settings(IMPORT_UPLOAD_DIR=self.upload_dir))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+
+    def upload(self):
+        csv = SimpleUploadedFile('catalog.csv', b'category,name\nLower Body,Squats\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/imports/', {'kind': 'catalog', 'file': csv}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        return ImportJob.objects.get(pk=response.data['id'])
+
+    def test_reupload_replaces_the_pending_file(self):
+        first = self.upload()
+        second = self.upload()
+        self.assertEqual(second.pk, first.pk)
+        self.assertFalse(os.path.exists(first.source))
+        self.assertEqual(os.listdir(self.upload_dir), [os.path.basename(second.source)])
+
+    def test_upload_is_deleted_once_imported(self):
+        import_job = self.upload()
+        jobs.run_pending(jobs.new_worker_id(), 100)
+        import_job.refresh_from_db()
+        self.assertEqual(import_job.status, 'DONE')
+        self.assertTrue(WorkoutExercise.objects.filter(name='Squats').exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+
+class ProfileSnapshotTests(TestCase):
+    def setUp(self):
+        caches[settings.PROFILE_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username='athlete', password='secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def expire_access(self):
+        # What PROFILE_AUTH_SECONDS passing does
+        caches[settings.PROFILE_CACHE_ALIAS].delete(profiles.ACCESS_PREFIX + str(self.user.pk))
+
+    def test_warm_reads_make_no_query(self):
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+
+    def test_deactivation_without_signals_is_seen_once_the_access_expires(self):
+        self.client.get('/api/profile/')
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.expire_access()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_role_change_without_signals_rebuilds_the_snapshot(self):
+        self.assertEqual(profiles.get(self.user.pk).role, 'ATHLETE')
+        Profile.objects.filter(user=self.user).update(role='PRO')
+        self.expire_access()
+        snapshot = profiles.get(self.user.pk)
+        self.assertEqual(snapshot.role, 'PRO')
+        self.assertIn(b'"PRO"', snapshot.body)
+
+
+class CompressionTests(SimpleTestCase):
+    body = b'{"name": "Squats"}' * 200
+
+    def respond(self, response):
+        request = RequestFactory().get('/api/things/', HTTP_ACCEPT_ENCODING='gzip')
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_json_is_compressed(self):
+        response = self.respond(HttpResponse(self.body, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertLess(len(response.content), len(self.body))
+
+    def test_html_is_not_compressed(self):
+        response = self.respond(HttpResponse(self.body, content_type='text/html; charset=utf-8'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+
+    def test_responses_setting_the_csrf_cookie_are_not_compressed(self):
+        response = HttpResponse(self.body, content_type='application/json')
+        response.set_cookie(settings.CSRF_COOKIE_NAME, 'secret')
+        self.assertFalse(self.respond(response).has_header('Content-Encoding'))
+
+
+class CompleteExercisesValidationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='athlete'))
+
+    def post(self, data):
+        return self.client.post('/api/exercises/complete/', data, format='json')
+
+    def test_bad_bodies_are_rejected(self):
+        for data in (
+            {},
+            {'exercise_ids': []},
+            {'exercise_ids': [True]},
+            {'exercise_ids': ['one']},
+            {'exercise_ids': [1], 'completed': 'maybe'},
+            {'exercise_ids': [1], 'sweat_sheet_id': 'abc'},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(data).status_code, 400)
+
+    def test_false_strings_are_false(self):
+        serializer = CompleteExercisesSerializer(data={'exercise_ids': [1], 'completed': 'false'})
+        self.assertTrue(serializer.is_valid())
+        self.assertIs(serializer.validated_data['completed'], False)
+
+    def test_valid_body_reaches_the_lookup(self):
+        self.assertEqual(self.post({'exercise_ids': [1], 'sweat_sheet_id': None}).status_code, 404)
+
+    def test_single_completion_rejects_a_bad_sweat_sheet_id(self):
+        response = self.client.post('/api/exercises/1/complete/', {'sweat_sheet_id': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class DocumentInvalidationTests(TestCase):
+    def setUp(self):
+        caches[settings.DOCUMENT_CACHE_ALIAS].clear()
+        self.coach = User.objects.create(username='coach')
+        other = User.objects.create(username='other')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sheet = SweatSheet.objects.create(name='Mine', user=self.coach)
+            self.other_sheet = SweatSheet.objects.create(name='Theirs', user=other)
+        self.renders = []
+
+    def document(self, sweat_sheet):
+        return documents.get_or_render(
+            sweat_sheet.id, None, lambda: self.renders.append(sweat_sheet.id) or b'{}'
+        )
+
+    def test_renaming_a_user_only_invalidates_their_sheets(self):
+        self.document(self.sheet)
+        self.document(self.other_sheet)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coach.first_name = 'Casey'
+            self.coach.save(update_fields=['first_name'])
+        self.document(self.sheet)
+        self.document(self.other_sheet)
+        self.assertEqual(self.renders, [self.sheet.id, self.other_sheet.id, self.sheet.id])
+
+
+class ServerTests(SimpleTestCase):
+    def test_asgi_workers_are_not_prewarmed(self):
+        self.assertIn('post_worker_init', server.config('127.0.0.1:8000'))
+        self.assertNotIn('post_worker_init', server.config('127.0.0.1:8000', asgi=True))
+
+    def test_asgi_closes_connections_after_every_request(self):
+        previous = {alias: connections.settings[alias]['CONN_MAX_AGE'] for alias in connections}
+        self.addCleanup(lambda: [
+            connections.settings[alias].update(CONN_MAX_AGE=age) for alias, age in previous.items()
+        ])
+        server.load(asgi=True)
+        self.assertEqual({connections.settings[alias]['CONN_MAX_AGE'] for alias in connections}, {0})
+
+
+class ReadinessTests(TestCase):
+    def test_failures_are_logged_but_not_shown(self):
+        with mock.patch.object(health, '_check_cache', side_effect=RuntimeError('secret.internal:6379 refused')):
+            with self.assertLogs('api.health', level='ERROR') as logs:
+                response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(set(response.json()['checks'].values()) - {'ok'}, {'error'})
+        self.assertNotIn(b'secret.internal', response.content)
+        self.assertIn('secret.internal', '\n'.join(logs.output))
+
+
+class TemplateDeletionTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach', role='PRO')
+        self.athlete = make_user('athlete')
+        self.template = make_template(self.coach)
+        self.instance, = trees.instantiate(self.template, [self.athlete])
+
+    def test_deleting_a_pro_removes_their_templates_and_instances(self):
+        self.coach.delete()
+        self.assertFalse(SweatSheet.objects.exists())
+        self.assertTrue(User.objects.filter(pk=self.athlete.pk).exists())
+
+    def test_deleting_an_athlete_keeps_the_template(self):
+        self.athlete.delete()
+        self.assertEqual(list(SweatSheet.objects.values_list('id', flat=True)), [self.template.id])
+
+    def test_assigned_templates_cannot_be_deleted_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.coach)
+        response = client.delete(f'/api/sweatsheets/{self.template.id}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(SweatSheet.objects.filter(pk=self.template.pk).exists())
+
+
+class CompletionScopeTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach', role='PRO')
+        self.athlete = make_user('athlete')
+        self.template = make_template(self.coach)
+        self.instance, = trees.instantiate(self.template, [self.athlete])
+        self.exercise = Exercise.objects.filter(section__phase__sweat_sheet=self.template).first()
+        self.phase = self.exercise.section.phase
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_strangers_cannot_complete_template_exercises(self):
+        stranger = self.client_for(make_user('stranger'))
+        response = stranger.post(f'/api/exercises/{self.exercise.id}/complete/')
+        self.assertEqual(response.status_code, 404)
+        self.exercise.refresh_from_db()
+        self.assertFalse(self.exercise.completed)
+        self.template.refresh_from_db()
+        self.assertEqual(self.template.completed_exercises, 0)
+
+    def test_strangers_cannot_complete_template_phases(self):
+        stranger = self.client_for(make_user('stranger'))
+        self.assertEqual(stranger.post(f'/api/phases/{self.phase.id}/complete/').status_code, 404)
+        self.phase.refresh_from_db()
+        self.assertFalse(self.phase.is_completed)
+
+    def test_athletes_complete_on_their_instance(self):
+        athlete = self.client_for(self.athlete)
+        self.assertEqual(athlete.post(f'/api/exercises/{self.exercise.id}/complete/').status_code, 200)
+        self.assertEqual(athlete.post(f'/api/phases/{self.phase.id}/complete/').status_code, 200)
+        self.exercise.refresh_from_db()
+        self.assertFalse(self.exercise.completed)
+        self.assertEqual(progress.completed_exercise_ids(self.instance), {self.exercise.id})
+        self.assertTrue(self.instance.phase_overrides.get(phase=self.phase).is_completed)
+
+
+class CapitalizeNamesTests(TestCase):
+    def setUp(self):
+        names = {'ascii': ('ANNA', 'smith'), 'accented': ('JOSÉ', 'élodie'), 'done': ('Zoë', 'Smith')}
+        self.users = {}
+        for username, (first_name, last_name) in names.items():
+            user = User.objects.create(username=username)
+            # Bypass the pre_save signal that capitalizes names
+            User.objects.filter(pk=user.pk).update(first_name=first_name, last_name=last_name)
+            self.users[username] = user
+
+    def names(self, username):
+        return tuple(User.objects.filter(username=username).values_list('first_name', 'last_name').get())
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('capitalize_names', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_counts_ascii_and_other_names(self):
+        self.assertIn('2 users would be updated', self.run_command('--dry-run'))
+        self.assertEqual(self.names('ascii'), ('ANNA', 'smith'))
+
+    def test_profile_snapshots_are_refreshed(self):
+        caches[settings.PROFILE_CACHE_ALIAS].clear()
+        self.assertIn(b'"ANNA"', profiles.get(self.users['ascii'].pk).body)
+        self.assertIn(b'"JOS\xc3\x89"', profiles.get(self.users['accented'].pk).body)
+        self.run_command()
+        self.assertIn(b'"Anna"', profiles.get(self.users['ascii'].pk).body)
+        self.assertIn(b'"Jos\xc3\xa9"', profiles.get(self.users['accented'].pk).body)
+
+    def test_names_are_capitalized_like_the_signal(self):
+        self.assertIn('updated 2 users', self.run_command('--batch-size', '1'))
+        self.assertEqual(self.names('ascii'), ('Anna', 'Smith'))
+        self.assertEqual(self.names('accented'), ('José', 'Élodie'))
+        self.assertEqual(self.names('done'), ('Zoë', 'Smith'))
+        self.assertIn('0 users would be updated', self.run_command('--dry-run'))
+
+
+class TreePatchTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach', role='PRO')
+        self.sheet = make_template(self.coach)
+        self.phases = list(self.sheet.phases.order_by('phase_number'))
+        self.sections = [phase.sections.get() for phase in self.phases]
+        self.exercises = [list(section.exercises.order_by('order')) for section in self.sections]
+
+    def patch(self, *operations, version=None):
+        version = self.sheet.version if version is None else version
+        result = trees.apply_patch(self.sheet, version, list(operations))
+        self.sheet.refresh_from_db()
+        return result
+
+    def section_order(self, section):
+        return list(section.exercises.order_by('order', 'id').values_list('id', flat=True))
+
+    def test_add_nodes_under_refs(self):
+        workout = self.exercises[0][0].specific_workout
+        version, created, replaced = self.patch(
+            {'op': 'add', 'type': 'phase', 'ref': 'p', 'data': {'phase_number': 3}},
+            {'op': 'add', 'type': 'section', 'ref': 's', 'parent': 'p',
+             'data': {'section_number': 1, 'date': '2026-01-05'}},
+            {'op': 'add', 'type': 'exercise', 'ref': 'e', 'parent': 's',
+             'data': {'workout_category_id': workout.category_id, 'specific_workout_id': workout.id, 'sets': '5'}},
+        )
+        self.assertEqual(version, 1)
+        self.assertEqual(set(created), {'p', 's', 'e'})
+        self.assertEqual(replaced, {})
+        exercise = Exercise.objects.get(pk=created['e'])
+        self.assertEqual(exercise.section_id, created['s'])
+        self.assertEqual(exercise.section.phase_id, created['p'])
+        self.assertEqual(exercise.order, trees.ORDER_GAP)
+        self.assertEqual(self.sheet.total_exercises, 7)
+        self.assertEqual(self.sheet.version, 1)
+
+    def test_update_fields(self):
+        exercise = self.exercises[0][0]
+        self.patch(
+            {'op': 'update', 'type': 'exercise', 'id': exercise.id, 'data': {'sets': '5', 'reps': '5'}},
+            {'op': 'update', 'type': 'phase', 'id': self.phases[0].id, 'data': {'is_completed': True}},
+        )
+        exercise.refresh_from_db()
+        self.assertEqual((exercise.sets, exercise.reps), ('5', '5'))
+        phase = Phase.objects.get(pk=self.phases[0].id)
+        self.assertTrue(phase.is_completed)
+        self.assertIsNotNone(phase.completed_at)
+
+    def test_move_without_a_gap_renumbers_the_section(self):
+        first, second, third = self.exercises[0]
+        self.patch({'op': 'move', 'type': 'exercise', 'id': third.id, 'after': first.id})
+        self.assertEqual(self.section_order(self.sections[0]), [first.id, third.id, second.id])
+        self.assertEqual(
+            list(self.sections[0].exercises.order_by('order').values_list('order', flat=True)),
+            [trees.ORDER_GAP, 2 * trees.ORDER_GAP, 3 * trees.ORDER_GAP],
+        )
+
+    def test_move_into_a_gap_writes_one_row(self):
+        first, second, third = self.exercises[0]
+        self.patch({'op': 'move', 'type': 'exercise', 'id': third.id, 'after': first.id})
+        orders = dict(self.sections[0].exercises.values_list('id', 'order'))
+        self.patch({'op': 'move', 'type': 'exercise', 'id': second.id, 'after': first.id})
+        moved = dict(self.sections[0].exercises.values_list('id', 'order'))
+        self.assertEqual(self.section_order(self.sections[0]), [first.id, second.id, third.id])
+        self.assertEqual({pk for pk in moved if moved[pk] != orders[pk]}, {second.id})
+
+    def test_move_exercise_to_another_section(self):
+        moved = self.exercises[0][1]
+        self.patch({'op': 'move', 'type': 'exercise', 'id': moved.id, 'parent': self.sections[1].id, 'after': None})
+        self.assertEqual(self.section_order(self.sections[1])[0], moved.id)
+        self.assertEqual(len(self.section_order(self.sections[0])), 2)
+        totals = dict(Phase.objects.filter(sweat_sheet=self.sheet).values_list('id', 'total_exercises'))
+        self.assertEqual(totals, {self.phases[0].id: 2, self.phases[1].id: 4})
+
+    def test_swap_phase_numbers(self):
+        self.patch(
+            {'op': 'update', 'type': 'phase', 'id': self.phases[0].id, 'data': {'phase_number': 2}},
+            {'op': 'update', 'type': 'phase', 'id': self.phases[1].id, 'data': {'phase_number': 1}},
+        )
+        numbers = dict(Phase.objects.filter(sweat_sheet=self.sheet).values_list('id', 'phase_number'))
+        self.assertEqual(numbers, {self.phases[0].id: 2, self.phases[1].id: 1})
+
+    def test_delete_nodes(self):
+        self.patch(
+            {'op': 'delete', 'type': 'exercise', 'id': self.exercises[0][0].id},
+            {'op': 'delete', 'type': 'phase', 'id': self.phases[1].id},
+        )
+        self.assertEqual(len(tree_shape(self.sheet)), 1)
+        self.assertEqual(self.sheet.total_exercises, 2)
+        self.assertFalse(Exercise.objects.filter(section=self.sections[1]).exists())
+
+    def test_deleting_an_added_node_drops_its_children(self):
+        version, created, _ = self.patch(
+            {'op': 'add', 'type': 'phase', 'ref': 'p', 'data': {'phase_number': 3}},
+            {'op': 'add', 'type': 'section', 'ref': 's', 'parent': 'p',
+             'data': {'section_number': 1, 'date': '2026-01-05'}},
+            {'op': 'delete', 'type': 'phase', 'id': 'p'},
+        )
+        self.assertEqual(created, {})
+        self.assertEqual(self.sheet.phases.count(), 2)
+
+    def test_stale_version_is_refused(self):
+        before = tree_shape(self.sheet)
+        with self.assertRaises(trees.VersionConflict) as conflict:
+            self.patch({'op': 'delete', 'type': 'phase', 'id': self.phases[0].id}, version=5)
+        self.assertEqual(conflict.exception.current_version, 0)
+        self.assertEqual(tree_shape(self.sheet), before)
+
+        client = APIClient()
+        client.force_authenticate(self.coach)
+        response = client.patch(f'/api/sweatsheets/{self.sheet.id}/', {
+            'version': 5, 'operations': [{'op': 'delete', 'type': 'phase', 'id': self.phases[0].id}],
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['version'], 0)
+
+    def test_failed_patches_leave_the_tree_untouched(self):
+        before = tree_shape(self.sheet)
+        workout = self.exercises[0][0].specific_workout
+        for bad in (
+            {'op': 'add', 'type': 'section', 'parent': 'missing', 'data': {'section_number': 2, 'date': '2026-01-05'}},
+            {'op': 'move', 'type': 'exercise', 'id': self.exercises[0][0].id, 'parent': 999999},
+            {'op': 'move', 'type': 'exercise', 'id': self.exercises[0][0].id, 'after': self.exercises[1][0].id},
+            {'op': 'update', 'type': 'exercise', 'id': self.exercises[0][0].id, 'data': {'order': 1}},
+            {'op': 'add', 'type': 'exercise', 'parent': self.sections[0].id,
+             'data': {'workout_category_id': workout.category_id + 100, 'specific_workout_id': workout.id}},
+            {'op': 'update', 'type': 'phase', 'id': self.phases[0].id, 'data': {'phase_number': 2}},
+        ):
+            with self.subTest(operation=bad), self.assertRaises(trees.PatchError):
+                self.patch(
+                    {'op': 'update', 'type': 'exercise', 'id': self.exercises[0][1].id, 'data': {'sets': '9'}},
+                    bad,
+                )
+            self.sheet.refresh_from_db()
+            self.assertEqual(self.sheet.version, 0)
+            self.assertEqual(tree_shape(self.sheet), before)
+
+    def test_structural_edit_of_an_instance_detaches_and_remaps(self):
+        athlete = make_user('athlete')
+        instance, = trees.instantiate(self.sheet, [athlete])
+        target = self.exercises[0][2]
+        kept = self.exercises[0][0]
+        self.sheet = instance
+        version, _, replaced = self.patch(
+            {'op': 'delete', 'type': 'exercise', 'id': target.id},
+            {'op': 'update', 'type': 'exercise', 'id': kept.id, 'data': {'sets': '8'}},
+        )
+        self.assertIsNone(instance.template_id)
+        self.assertEqual(set(replaced), {'phase', 'section', 'exercise'})
+        self.assertFalse(Exercise.objects.filter(pk=replaced['exercise'][target.id]).exists())
+        self.assertEqual(Exercise.objects.get(pk=replaced['exercise'][kept.id]).sets, '8')
+        self.assertEqual(instance.total_exercises, 5)
+        # The template keeps its own tree
+        kept.refresh_from_db()
+        self.assertEqual(kept.sets, '3')
+        self.assertEqual(SweatSheet.objects.get(pk=self.phases[0].sweat_sheet_id).total_exercises, 6)
+
+
+class TemplateInstanceTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach', role='PRO')
+        self.template = make_template(self.coach)
+        self.first, self.second = trees.instantiate(self.template, [make_user('anna'), make_user('ben')])
+        self.exercises = list(Exercise.objects.filter(section__phase__sweat_sheet=self.template).order_by('ordinal'))
+        self.phase = self.template.phases.get(phase_number=1)
+
+    def patch(self, instance, *operations):
+        instance.refresh_from_db()
+        return trees.apply_patch(instance, instance.version, list(operations))
+
+    def merged(self, instance):
+        instance.refresh_from_db()
+        if instance.template_id is None:
+            return trees.tree_data(instance)
+        return trees.tree_data(
+            instance.template,
+            {o.exercise_id: o for o in instance.exercise_overrides.all()},
+            {o.phase_id: o for o in instance.phase_overrides.all()},
+            progress.completion(instance),
+        )
+
+    def exercise_in(self, tree, pk):
+        return next(
+            exercise for phase in tree for section in phase['sections']
+            for exercise in section['exercises'] if exercise['id'] == pk
+        )
+
+    def test_overrides_stay_on_one_instance(self):
+        exercise = self.exercises[0]
+        _, _, replaced = self.patch(
+            self.first,
+            {'op': 'update', 'type': 'exercise', 'id': exercise.id, 'data': {'sets': '5', 'completed': True}},
+            {'op': 'update', 'type': 'phase', 'id': self.phase.id, 'data': {'is_completed': True}},
+        )
+        self.assertEqual(replaced, {})
+        self.assertIsNotNone(self.first.template_id)
+        first = self.exercise_in(self.merged(self.first), exercise.id)
+        self.assertEqual((first['sets'], first['completed']), ('5', True))
+        self.assertTrue(self.first.phase_overrides.get(phase=self.phase).is_completed)
+
+        second = self.exercise_in(self.merged(self.second), exercise.id)
+        self.assertEqual((second['sets'], second['completed']), ('3', False))
+        self.assertFalse(self.second.phase_overrides.exists())
+        self.assertEqual(progress.completed_exercise_ids(self.second), set())
+        exercise.refresh_from_db()
+        self.assertEqual((exercise.sets, exercise.completed), ('3', False))
+
+    def test_template_edits_reach_instances_without_overrides(self):
+        exercise = self.exercises[0]
+        self.patch(self.first, {'op': 'update', 'type': 'exercise', 'id': exercise.id, 'data': {'reps': '12'}})
+        trees.apply_patch(self.template, self.template.version, [
+            {'op': 'update', 'type': 'exercise', 'id': exercise.id, 'data': {'sets': '4', 'reps': '8'}},
+        ])
+        first = self.exercise_in(self.merged(self.first), exercise.id)
+        second = self.exercise_in(self.merged(self.second), exercise.id)
+        self.assertEqual((first['sets'], first['reps']), ('4', '12'))
+        self.assertEqual((second['sets'], second['reps']), ('4', '8'))
+
+    def test_detach_keeps_overrides_and_completion(self):
+        done, overridden, untouched = self.exercises[:3]
+        self.patch(
+            self.first,
+            {'op': 'update', 'type': 'exercise', 'id': done.id, 'data': {'completed': True}},
+            {'op': 'update', 'type': 'exercise', 'id': overridden.id, 'data': {'weight': '40kg'}},
+            {'op': 'update', 'type': 'phase', 'id': self.phase.id, 'data': {'is_completed': True}},
+        )
+        replaced = trees.detach(self.first)
+
+        self.first.refresh_from_db()
+        self.assertIsNone(self.first.template_id)
+        self.assertFalse(self.first.exercise_overrides.exists())
+        self.assertFalse(self.first.phase_overrides.exists())
+        copies = Exercise.objects.in_bulk([replaced['exercise'][e.id] for e in (done, overridden, untouched)])
+        self.assertTrue(all(copy.section.phase.sweat_sheet_id == self.first.id for copy in copies.values()))
+        self.assertTrue(copies[replaced['exercise'][done.id]].completed)
+        self.assertEqual(copies[replaced['exercise'][overridden.id]].weight, '40kg')
+        self.assertFalse(copies[replaced['exercise'][untouched.id]].completed)
+        phase = Phase.objects.get(pk=replaced['phase'][self.phase.id])
+        self.assertTrue(phase.is_completed)
+        self.assertIsNotNone(phase.completed_at)
+        self.assertEqual((self.first.total_exercises, self.first.completed_exercises), (6, 1))
+
+        # The other instance and the template are unaffected
+        self.assertEqual(self.second.template_id, self.template.id)
+        self.assertEqual(progress.completed_exercise_ids(self.second), set())
+        self.assertFalse(Exercise.objects.filter(section__phase__sweat_sheet=self.template, completed=True).exists())
+
+    def test_completion_moves_instance_rollups(self):
+        ids = [exercise.id for exercise in self.exercises[:2]]
+        result, _ = progress.set_instance_exercises_completed(self.first, ids)
+        self.assertEqual(result['updated'], 2)
+        result, _ = progress.set_instance_exercises_completed(self.first, ids)
+        self.assertEqual(result['updated'], 0)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.total_exercises, self.first.completed_exercises), (6, 2))
+        self.assertEqual((self.second.total_exercises, self.second.completed_exercises), (6, 0))
+        self.assertEqual(progress.completed_exercise_ids(self.first), set(ids))
+
+        progress.set_instance_exercises_completed(self.first, ids[:1], completed=False)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.completed_exercises, 1)
+        self.assertEqual(progress.completed_exercise_ids(self.first), set(ids[1:]))
+
+    def test_deleted_template_exercises_leave_instance_rollups(self):
+        done = [exercise.id for exercise in self.exercises[:2]]
+        progress.set_instance_exercises_completed(self.first, done)
+        trees.apply_patch(self.template, self.template.version, [
+            {'op': 'delete', 'type': 'exercise', 'id': done[0]},
+        ])
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.total_exercises, self.first.completed_exercises), (5, 1))
+        self.assertEqual(progress.completed_exercise_ids(self.first), {done[1]})
+
+        # A rebuild from scratch agrees with the incremental rollups
+        SweatSheet.objects.filter(pk=self.first.pk).update(total_exercises=0, completed_exercises=0)
+        progress.refresh_rollups([self.template.id])
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.total_exercises, self.first.completed_exercises), (5, 1))
+
+
+class BitsetTests(SimpleTestCase):
+    def test_update_reports_changed_ordinals(self):
+        bits, changed = bitsets.update(b'', [0, 9, 9])
+        self.assertEqual((bits, changed), (b'\x01\x02', [0, 9]))
+        bits, changed = bitsets.update(bits, [0, 3], True)
+        self.assertEqual((bits, changed), (b'\x09\x02', [3]))
+
+    def test_clearing_drops_trailing_zero_bytes(self):
+        bits = bitsets.from_ordinals([1, 20])
+        self.assertEqual(bitsets.update(bits, [20, 40], False), (b'\x02', [20]))
+        self.assertEqual(bitsets.update(b'\x02', [1], False), (b'', [1]))
+
+    def test_membership_and_counts(self):
+        bits = bitsets.from_ordinals([2, 8, 63, 64])
+        self.assertEqual(bitsets.members(bits), [2, 8, 63, 64])
+        self.assertTrue(bitsets.contains(bits, 63))
+        self.assertFalse(bitsets.contains(bits, 3))
+        self.assertFalse(bitsets.contains(bits, 1000))
+        self.assertEqual(bitsets.count(bits), 4)
+        self.assertEqual(bitsets.count(bits, bitsets.from_ordinals([8, 64, 65])), 2)
+        self.assertEqual(bitsets.count(b''), 0)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkRegisterTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach', role='PRO')
+        self.client = APIClient()
+        self.client.force_authenticate(self.coach)
+
+    def post(self, users):
+        return self.client.post('/api/register/bulk/', {'users': users}, format='json')
+
+    def test_invalid_entries_do_not_stop_the_others(self):
+        response = self.post([
+            {'username': 'anna', 'password': 'correct-horse-42', 'first_name': 'anna'},
+            {'username': 'bad name!'},
+            {'username': 'ben', 'email': 'not an email'},
+            {'username': 'cara', 'role': 'SWEAT_TEAM_MEMBER'},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([user['username'] for user in response.data['created']], ['anna', 'cara'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('email', response.data['errors'][1]['errors'])
+        anna = User.objects.get(username='anna')
+        self.assertEqual(anna.first_name, 'Anna')
+        self.assertTrue(anna.check_password('correct-horse-42'))
+        self.assertFalse(User.objects.get(username='cara').has_usable_password())
+        self.assertEqual(Profile.objects.get(user__username='cara').role, 'SWEAT_TEAM_MEMBER')
+
+    def test_duplicate_usernames(self):
+        make_user('taken')
+        response = self.post([{'username': 'anna'}, {'username': 'anna'}, {'username': 'taken'}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual(
+            [(error['index'], list(error['errors'])) for error in response.data['errors']],
+            [(1, ['username']), (2, ['username'])],
+        )
+
+    def test_sweatpros_cannot_create_sweatpros(self):
+        response = self.post([{'username': 'anna', 'role': 'PRO'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['errors'], {'role': ['You cannot create PRO accounts']})
+        self.assertFalse(User.objects.filter(username='anna').exists())
+
+        self.client.force_authenticate(make_user('admin', is_staff=True))
+        self.assertEqual(self.post([{'username': 'anna', 'role': 'PRO'}]).status_code, 201)
+        self.assertEqual(Profile.objects.get(user__username='anna').role, 'PRO')
+
+    def test_athletes_cannot_register_users(self):
+        self.client.force_authenticate(make_user('athlete'))
+        self.assertEqual(self.post([{'username': 'anna'}]).status_code, 403)
+
+    def test_roster_size_is_capped(self):
+        response = self.post([{'username': f'user{n}'} for n in range(provisioning.MAX_USERS + 1)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='user0').exists())
+
+    def test_username_taken_during_hashing_is_skipped(self):
+        insert = provisioning._insert
+
+        def racing_insert(accounts):
+            # Someone registers 'ben' between the check and the insert
+            User.objects.get_or_create(username='ben')
+            return insert(accounts)
+
+        with mock.patch.object(provisioning, '_insert', side_effect=racing_insert) as patched:
+            users, errors = provisioning.register([{'username': 'anna'}, {'username': 'ben'}], workers=1)
+        self.assertEqual(patched.call_count, 2)
+        self.assertEqual([user.username for user in users], ['anna'])
+        self.assertEqual(errors, [{'index': 1, 'errors': {'username': ['A user with that username already exists.']}}])
+        self.assertTrue(Profile.objects.filter(user__username='anna').exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        # Term statistics are cached across tests otherwise
+        caches['default'].clear()
+        self.coach = make_user('coach', role='PRO')
+        self.athlete = make_user('athlete')
+        self.stranger = make_user('stranger')
+        self.category = WorkoutCategory.objects.create(name='Lower Body')
+
+    def titles(self, user, query, **kwargs):
+        return [result['title'] for result in search.search(user, query, **kwargs)]
+
+    def test_more_matched_terms_rank_first(self):
+        Note.objects.create(author=self.athlete, title='Squat', content='squat squat squat squat')
+        Note.objects.create(author=self.athlete, title='Mobility', content='Squat mobility drills')
+        Note.objects.create(author=self.athlete, title='Rest day', content='Walk and stretch')
+        self.assertEqual(self.titles(self.athlete, 'squat mobility'), ['Mobility', 'Squat'])
+
+    def test_titles_outweigh_bodies(self):
+        Note.objects.create(author=self.athlete, title='Hip hinge', content='Deadlift patterns')
+        Note.objects.create(author=self.athlete, title='Deadlift', content='Heavy pulls')
+        results = search.search(self.athlete, 'deadlift')
+        self.assertEqual([result['title'] for result in results], ['Deadlift', 'Hip hinge'])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_candidates_are_the_heaviest_postings(self):
+        exercises = [
+            WorkoutExercise.objects.create(category=self.category, name=f'Drill {n}', description='lunge ' * n)
+            for n in range(1, 8)
+        ]
+        heaviest = SearchDocument.objects.filter(
+            kind='EXERCISE', object_id__in=[exercise.id for exercise in exercises[-3:]]
+        ).values_list('id', flat=True)
+        self.assertEqual(search._candidates(self.stranger, 'lunge', None, 3), set(heaviest))
+        self.assertEqual(self.titles(self.stranger, 'lunge', limit=1), ['Drill 7'])
+
+    def test_visibility(self):
+        template = SweatSheet.objects.create(name='Strength block', user=self.coach, is_template=True)
+        SweatSheet.objects.create(name='Strength for athlete', user=self.coach, assigned_to=self.athlete)
+        Note.objects.create(author=self.coach, title='Strength notes', content='')
+        WorkoutExercise.objects.create(category=self.category, name='Strength circuit')
+
+        self.assertCountEqual(
+            self.titles(self.coach, 'strength'),
+            ['Strength block', 'Strength for athlete', 'Strength notes', 'Strength circuit'],
+        )
+        self.assertCountEqual(
+            self.titles(self.athlete, 'strength'), ['Strength block', 'Strength for athlete', 'Strength circuit']
+        )
+        self.assertCountEqual(self.titles(self.stranger, 'strength'), ['Strength block', 'Strength circuit'])
+        self.assertEqual(self.titles(self.stranger, 'strength', kinds=['SWEATSHEET']), ['Strength block'])
+
+        # Turning the template into a private sheet hides it again
+        template.is_template = False
+        template.save()
+        self.assertEqual(self.titles(self.stranger, 'strength'), ['Strength circuit'])
+
+
+class RendererTests(SimpleTestCase):
+    data = {
+        'utc': datetime(2026, 3, 1, 12, 30, 5, 123456, tzinfo=dt_timezone.utc),
+        'offset': datetime(2026, 3, 1, 12, 30, tzinfo=dt_timezone(timedelta(hours=-5))),
+        'naive': datetime(2026, 3, 1, 12, 30),
+        'date': date(2026, 3, 1),
+        'time': time(6, 45),
+        'decimal': Decimal('12.50'),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': gettext_lazy('Lower Body'),
+        'text': 'caf\u00e9 \u2028 end',
+        'nested': [{1: None, 'list': [1.5, True]}],
+    }
+
+    def test_matches_drf(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(renderers.dumps(self.data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.dumps(self.data), expected)
+
+    def test_integers_orjson_cannot_encode(self):
+        data = {'big': 2 ** 70}
+        self.assertEqual(renderers.dumps(data), JSONRenderer().render(data))
+
+
+class ExportTests(TestCase):
+    def test_export_holds_only_the_users_records(self):
+        coach = make_user('coach', role='PRO')
+        athlete = make_user('athlete')
+        stranger = make_user('stranger')
+        Note.objects.create(author=athlete, title='Sleep', content='8 hours')
+        Note.objects.create(author=stranger, title='Private', content='Not yours')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(coach, athlete)
+        Message.objects.create(conversation=conversation, sender=coach, content='Hello')
+        Message.objects.create(conversation=conversation, sender=coach, content='Retracted', is_deleted=True)
+        Message.objects.create(conversation=conversation, sender=athlete, content='Oops', is_deleted=True)
+        other = Conversation.objects.create()
+        other.participants.add(coach, stranger)
+        Message.objects.create(conversation=other, sender=stranger, content='Hi coach')
+        template = make_template(coach, phases=1, exercises=2)
+        instance, = trees.instantiate(template, [athlete])
+        progress.set_instance_exercises_completed(
+            instance, [Exercise.objects.filter(section__phase__sweat_sheet=template).order_by('ordinal')[0].id]
+        )
+
+        client = APIClient()
+        client.force_authenticate(athlete)
+        response = client.get('/api/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(lines[0]['type'], 'user')
+        self.assertEqual(lines[0]['data']['username'], 'athlete')
+        self.assertEqual(lines[0]['data']['role'], 'ATHLETE')
+        by_type = {}
+        for line in lines[1:]:
+            by_type.setdefault(line['type'], []).append(line['data'])
+        self.assertEqual([note['title'] for note in by_type['note']], ['Sleep'])
+        self.assertEqual([c['id'] for c in by_type['conversation']], [conversation.id])
+        self.assertEqual([m['content'] for m in by_type['message']], ['Hello', 'Oops'])
+        sheet, = by_type['sweat_sheet']
+        self.assertEqual((sheet['id'], sheet['assigned_to'], sheet['completed_exercises']), (instance.id, 'athlete', 1))
+        exercises = sheet['phases'][0]['sections'][0]['exercises']
+        self.assertEqual([exercise['completed'] for exercise in exercises], [True, False])
+
+
+class CalendarTests(TestCase):
+    def test_created_on_first_access(self):
+        athlete = make_user('athlete')
+        self.assertFalse(Calendar.objects.filter(user=athlete).exists())
+        calendar = Calendar.objects.for_user(athlete)
+        self.assertEqual(calendar.events, {})
+        calendar.events = {'2026-03-01': ['Leg day']}
+        calendar.save()
+
+        with self.assertNumQueries(1):
+            again = Calendar.objects.for_user(athlete)
+        self.assertEqual((again.pk, again.events), (calendar.pk, {'2026-03-01': ['Leg day']}))
+        self.assertEqual(Calendar.objects.filter(user=athlete).count(), 1)
+
+    def test_endpoint_creates_the_calendar(self):
+        athlete = make_user('athlete')
+        client = APIClient()
+        client.force_authenticate(athlete)
+        for _ in range(2):
+            self.assertEqual(client.get('/api/calendar/').status_code, 200)
+        self.assertEqual(Calendar.objects.filter(user=athlete).count(), 1)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['api.hashers.ScryptPasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+    SCRYPT_WORK_FACTOR=2 ** 10,
+)
+class PasswordRehashTests(TestCase):
+    password = 'correct-horse-42'
+
+    def setUp(self):
+        self.user = make_user('athlete')
+        self.user.set_password(self.password)
+        self.user.save()
+
+    def login(self, path='/api/token/'):
+        response = APIClient().post(path, {'username': 'athlete', 'password': self.password}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        return self.user.password
+
+    def test_unchanged_costs_keep_the_hash(self):
+        encoded = self.user.password
+        self.assertEqual(self.login(), encoded)
+
+    def test_new_costs_rehash_on_login(self):
+        self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+        with self.settings(SCRYPT_WORK_FACTOR=2 ** 11):
+            self.assertTrue(self.login().startswith('scrypt$2048$'))
+            self.assertTrue(self.login('/api/token/async/').startswith('scrypt$2048$'))
+        with self.settings(SCRYPT_WORK_FACTOR=2 ** 12):
+            self.assertTrue(self.login('/api/token/async/').startswith('scrypt$4096$'))
+
+    def test_older_algorithms_are_upgraded(self):
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            self.user.set_password(self.password)
+            self.user.save()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(self.login().startswith('scrypt$1024$'))
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_burst_then_retry_after(self):
+        burst, rate = settings.THROTTLE_BUCKETS['profile']
+        client = self.client_for(make_user('athlete'))
+        now = 1_000_000.0
+        with mock.patch('api.throttles.time.time', side_effect=lambda: now):
+            for _ in range(burst):
+                self.assertEqual(client.get('/api/profile/').status_code, 200)
+            response = client.get('/api/profile/')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], str(int(1 / rate)))
+
+            # Other users have their own bucket
+            self.assertEqual(self.client_for(make_user('coach')).get('/api/profile/').status_code, 200)
+
+            now += 1 / rate
+            self.assertEqual(client.get('/api/profile/').status_code, 200)
+            self.assertEqual(client.get('/api/profile/').status_code, 429)
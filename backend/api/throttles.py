@@ -0,0 +1,53 @@
+"""Token-bucket rate limiting for DRF views.
+
+A view opts in with a ``throttle_scope`` listed in ``THROTTLE_BUCKETS`` as
+``(burst, refill per second)``: every user (or client IP when anonymous)
+gets a bucket of ``burst`` requests per scope that refills continuously,
+so short bursts pass while sustained polling is held to the refill rate.
+Buckets live in the cache selected by ``THROTTLE_CACHE_ALIAS``. Reads and
+writes of a bucket are not atomic, so concurrent requests can occasionally
+both take the last token; the limit is approximate by that much.
+
+Rejected requests get DRF's 429 with a ``Retry-After`` header of the time
+until the next token, and count under ``throttle.<scope>.limited`` in
+``api.metrics``.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+KEY_PREFIX = 'throttle:'
+
+
+class TokenBucketThrottle(BaseThrottle):
+    wait_seconds = None
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope not in settings.THROTTLE_BUCKETS:
+            return True
+        burst, rate = settings.THROTTLE_BUCKETS[scope]
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        key = f'{KEY_PREFIX}{scope}:{ident}'
+
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        now = time.time()
+        tokens, updated = cache.get(key) or (burst, now)
+        tokens = min(burst, tokens + max(now - updated, 0) * rate)
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / rate
+            metrics.incr(f'throttle.{scope}.limited')
+            return False
+        # A bucket left alone refills completely, after which it need not be stored
+        cache.set(key, (tokens - 1, now), timeout=int(burst / rate) + 1)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,170 @@
+"""Refresh-token rotation with revocation state kept in the cache.
+
+``POST /api/token/refresh/`` returns a new refresh token next to the access
+token and blacklists the one it was given, so each refresh token works
+once. Instead of simplejwt's ``token_blacklist`` tables, which cost a few
+queries per refresh, the state lives in the cache selected by
+``TOKEN_CACHE_ALIAS``, and a refresh makes a single query, the one that
+checks the user is still active:
+
+- ``tokens:blacklist:<jti>``: a rotated or revoked refresh token, kept
+  until the token expires anyway
+- ``tokens:user:<id>``: every token of the user issued up to this time is
+  revoked; set when an account is deactivated or deleted
+- ``tokens:successor:<digest>``: the pair a refresh token was rotated into,
+  kept for ``TOKEN_REUSE_WINDOW`` seconds. Pages and tabs that refresh the
+  same token at once all get that pair instead of the losers being logged
+  out
+
+Every entry expires with the tokens it concerns, so the footprint is
+bounded by the refresh traffic of one ``REFRESH_TOKEN_LIFETIME``. The
+default ``tokens`` cache is an in-process LRU capped by ``MAX_ENTRIES``,
+which is only right for a single process: a token rotated or revoked in
+one process would still work in the others. ``manage.py check --deploy``
+fails on it and ``manage.py serve`` refuses to start several workers on
+it; point the alias at a shared cache instead.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import serializers, tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+BLACKLIST_KEY = 'tokens:blacklist:'
+USER_KEY = 'tokens:user:'
+SUCCESSOR_KEY = 'tokens:successor:'
+# Cache backends whose entries other processes cannot see
+PROCESS_LOCAL_BACKENDS = frozenset([
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+])
+
+
+def _cache():
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def shared_cache():
+    """Whether the token cache is seen by every process"""
+    return settings.CACHES[settings.TOKEN_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+@checks.register(checks.Tags.security, deploy=True)
+def check_token_cache(app_configs, **kwargs):
+    if shared_cache():
+        return []
+    return [checks.Error(
+        f'TOKEN_CACHE_ALIAS {settings.TOKEN_CACHE_ALIAS!r} is a per-process cache, so a refresh '
+        'token rotated or revoked in one process is still accepted by the others.',
+        hint='Point it at a cache shared by every process, e.g. Redis or Memcached.',
+        id='api.E001',
+    )]
+
+
+class RefreshToken(tokens.RefreshToken):
+    def verify(self):
+        super().verify()
+        self.check_blacklist()
+
+    def check_blacklist(self):
+        blacklist_key = BLACKLIST_KEY + self.payload[api_settings.JTI_CLAIM]
+        user_key = USER_KEY + str(self.payload.get(api_settings.USER_ID_CLAIM))
+        found = _cache().get_many([blacklist_key, user_key])
+        if blacklist_key in found:
+            raise TokenError(_("Token is blacklisted"))
+        if user_key in found and self.payload.get('iat', 0) <= found[user_key]:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        """Blacklist this token. Returns False if it already was, so of two
+        requests rotating the same token only one succeeds."""
+        return _cache().add(
+            BLACKLIST_KEY + self.payload[api_settings.JTI_CLAIM], True, timeout=_remaining(self)
+        )
+
+    def outstand(self):
+        # Issued tokens are not recorded; only revoked ones are
+        return None
+
+
+def _remaining(token):
+    return max(int(token.payload['exp'] - time.time()) + 1, 1)
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    """Always rotates, checking revocation in the cache, and hands the same
+    successor to requests that rotate one token within ``TOKEN_REUSE_WINDOW``"""
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        successor_key = SUCCESSOR_KEY + hashlib.sha256(attrs['refresh'].encode()).hexdigest()
+        try:
+            refresh = self.token_class(attrs['refresh'])
+        except TokenError:
+            # Rotated moments ago by a concurrent request
+            successor = _cache().get(successor_key)
+            if successor is None:
+                raise
+            self.check_user(successor['user_id'])
+            return {'access': successor['access'], 'refresh': successor['refresh']}
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        self.check_user(user_id)
+        blacklist_key = BLACKLIST_KEY + refresh.payload[api_settings.JTI_CLAIM]
+        remaining = _remaining(refresh)
+        data = {'access': str(refresh.access_token)}
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        data['refresh'] = str(refresh)
+        # The first request to store a successor wins; the others return it
+        if not _cache().add(successor_key, {**data, 'user_id': user_id}, timeout=settings.TOKEN_REUSE_WINDOW):
+            successor = _cache().get(successor_key)
+            if successor is None:
+                raise TokenError(_("Token is blacklisted"))
+            return {'access': successor['access'], 'refresh': successor['refresh']}
+        _cache().set(blacklist_key, True, timeout=remaining)
+        return data
+
+    def check_user(self, user_id):
+        """Refuse users that were deactivated or deleted, whether or not
+        ``revoke_user()`` saw it happen"""
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).only(
+            api_settings.USER_ID_FIELD, 'is_active'
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+
+def revoke(refresh):
+    """Blacklist the encoded refresh token ``refresh``; raises ``TokenError``
+    if it is invalid, expired or revoked already"""
+    RefreshToken(refresh).blacklist()
+
+
+def revoke_user(user_id):
+    """Revoke every refresh token issued to the user so far"""
+    _cache().set(
+        USER_KEY + str(user_id), int(time.time()),
+        timeout=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()) + 1,
+    )
+
+
+@receiver(post_save, sender=User)
+def revoke_inactive_user(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw and not instance.is_active:
+        revoke_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user(sender, instance, **kwargs):
+    revoke_user(instance.pk)
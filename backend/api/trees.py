@@ -0,0 +1,737 @@
+"""Bulk persistence of SweatSheet Phase -> Section -> Exercise trees.
+
+A whole tree is written with one ``bulk_create`` per level, and the catalog
+references of every exercise are checked with one ``IN`` query per model,
+so the number of queries stays flat however large the program is.
+
+Small edits go through ``apply_patch()``: the client sends the tree
+``version`` it last saw and a list of add/move/update/delete operations,
+and only the rows those operations touch are loaded and written back.
+Exercise ``order`` values are spaced ``ORDER_GAP`` apart so a move usually
+writes a single row; a section is renumbered only when there is no gap
+left between two neighbours.
+
+Assigning a template does not copy it. ``instantiate()`` creates a
+SweatSheet pointing at the template, and the athlete's changes live in
+``ExerciseOverride``/``PhaseOverride`` rows and a completion bitset over
+the template's ``Exercise.ordinal`` values, merged on read. The first
+structural edit of an instance copies the merged tree into its own rows
+(``detach()``), after which it is an ordinary SweatSheet.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import bitsets, documents, progress
+from .models import (
+    WorkoutCategory, WorkoutExercise, SweatSheet, Phase, Section, Exercise,
+    ExerciseOverride, PhaseOverride
+)
+
+ORDER_GAP = 1024
+MAX_PATCH_OPERATIONS = 500
+
+
+def reference_errors(phases_data):
+    """Check every exercise's category/workout ids; returns a list of error strings"""
+    return _reference_errors([
+        (exercise['workout_category_id'], exercise['specific_workout_id'])
+        for phase in phases_data
+        for section in phase.get('sections', [])
+        for exercise in section.get('exercises', [])
+    ])
+
+
+def _reference_errors(pairs):
+    """``pairs`` are (workout_category_id, specific_workout_id) tuples"""
+    category_ids = {category_id for category_id, _ in pairs}
+    workout_ids = {workout_id for _, workout_id in pairs}
+
+    known_categories = set(
+        WorkoutCategory.objects.filter(id__in=category_ids).values_list('id', flat=True)
+    ) if category_ids else set()
+    workout_categories = dict(
+        WorkoutExercise.objects.filter(id__in=workout_ids).values_list('id', 'category_id')
+    ) if workout_ids else {}
+
+    errors = []
+    for category_id in sorted(category_ids - known_categories):
+        errors.append(f"Workout category {category_id} does not exist")
+    for workout_id in sorted(workout_ids - set(workout_categories)):
+        errors.append(f"Workout exercise {workout_id} does not exist")
+    for category_id, workout_id in pairs:
+        actual = workout_categories.get(workout_id)
+        if actual is not None and actual != category_id:
+            errors.append(f"Workout exercise {workout_id} is not in category {category_id}")
+    return list(dict.fromkeys(errors))
+
+
+def numbering_errors(phases_data):
+    """Duplicate phase/section numbers would violate the unique constraints"""
+    errors = []
+    phase_numbers = [phase['phase_number'] for phase in phases_data]
+    if len(phase_numbers) != len(set(phase_numbers)):
+        errors.append("Phase numbers must be unique within a SweatSheet")
+    for phase in phases_data:
+        section_numbers = [section['section_number'] for section in phase.get('sections', [])]
+        if len(section_numbers) != len(set(section_numbers)):
+            errors.append(f"Section numbers must be unique within phase {phase['phase_number']}")
+    return errors
+
+
+def with_tree(queryset):
+    """Prefetch the whole tree (the template's, for instances) so serializing
+    it costs a fixed number of queries"""
+    return queryset.select_related('user', 'assigned_to').prefetch_related(
+        'phases__sections__exercises__workout_category',
+        'phases__sections__exercises__specific_workout__category',
+        'template__phases__sections__exercises__workout_category',
+        'template__phases__sections__exercises__specific_workout__category',
+        'exercise_overrides',
+        'phase_overrides',
+    )
+
+
+def _new_exercise(section, data, position):
+    return Exercise(
+        section=section,
+        workout_category_id=data['workout_category_id'],
+        specific_workout_id=data['specific_workout_id'],
+        sets=data.get('sets', ''),
+        reps=data.get('reps', ''),
+        weight=data.get('weight', ''),
+        completed=data.get('completed', False),
+        order=data.get('order', position),
+    )
+
+
+def create_tree(sweat_sheet, phases_data):
+    """Insert all phases, sections and exercises of ``sweat_sheet`` in three bulk inserts.
+
+    Also sets the SweatSheet/Phase progress rollups from the inserted rows.
+    Returns the created phases.
+    """
+    return _insert_tree(sweat_sheet, phases_data)[0]
+
+
+def _insert_tree(sweat_sheet, phases_data):
+    """``create_tree()`` returning the created (phases, sections, exercises),
+    each in the order of ``phases_data``"""
+    with transaction.atomic():
+        first_ordinal = SweatSheet.objects.select_for_update().values_list(
+            'exercise_ordinals', flat=True
+        ).get(pk=sweat_sheet.pk)
+        phases = []
+        for phase_data in phases_data:
+            exercises = [
+                exercise
+                for section in phase_data.get('sections', [])
+                for exercise in section.get('exercises', [])
+            ]
+            phases.append(Phase(
+                sweat_sheet=sweat_sheet,
+                phase_number=phase_data['phase_number'],
+                is_completed=phase_data.get('is_completed', False),
+                total_exercises=len(exercises),
+                completed_exercises=sum(1 for exercise in exercises if exercise.get('completed')),
+            ))
+        Phase.objects.bulk_create(phases)
+
+        sections = []
+        section_data = []
+        for phase, phase_data in zip(phases, phases_data):
+            for data in phase_data.get('sections', []):
+                sections.append(Section(phase=phase, section_number=data['section_number'], date=data['date']))
+                section_data.append(data)
+        Section.objects.bulk_create(sections)
+
+        exercises = [
+            _new_exercise(section, exercise_data, position)
+            for section, data in zip(sections, section_data)
+            for position, exercise_data in enumerate(data.get('exercises', []), 1)
+        ]
+        for ordinal, exercise in enumerate(exercises, first_ordinal):
+            exercise.ordinal = ordinal
+        Exercise.objects.bulk_create(exercises, batch_size=500)
+
+        SweatSheet.objects.filter(pk=sweat_sheet.pk).update(
+            total_exercises=sum(phase.total_exercises for phase in phases),
+            completed_exercises=sum(phase.completed_exercises for phase in phases),
+            exercise_ordinals=first_ordinal + len(exercises),
+        )
+        documents.invalidate([sweat_sheet.pk])
+    return phases, sections, exercises
+
+
+def replace_tree(sweat_sheet, phases_data):
+    """Drop the existing tree of ``sweat_sheet`` and bulk insert ``phases_data``"""
+    with transaction.atomic():
+        if sweat_sheet.template_id:
+            _drop_instance_state(sweat_sheet)
+        Exercise.objects.filter(section__phase__sweat_sheet=sweat_sheet).delete()
+        Section.objects.filter(phase__sweat_sheet=sweat_sheet).delete()
+        sweat_sheet.phases.all().delete()
+        phases = create_tree(sweat_sheet, phases_data)
+        if sweat_sheet.instances.exists():
+            progress.refresh_rollups([sweat_sheet.pk])
+    return phases
+
+
+def tree_data(sweat_sheet, exercise_overrides=None, phase_overrides=None, completion=None):
+    """The tree of ``sweat_sheet`` as ``create_tree()`` input, with an instance's
+    overrides and completion bitset applied"""
+    exercise_overrides = exercise_overrides or {}
+    phase_overrides = phase_overrides or {}
+    phases = {
+        phase['id']: dict(phase, sections=[])
+        for phase in sweat_sheet.phases.values('id', 'phase_number', 'is_completed')
+    }
+    sections = {}
+    for section in Section.objects.filter(phase__sweat_sheet=sweat_sheet).values(
+        'id', 'phase_id', 'section_number', 'date'
+    ):
+        sections[section['id']] = dict(section, exercises=[])
+        phases[section['phase_id']]['sections'].append(sections[section['id']])
+    for exercise in Exercise.objects.filter(section__phase__sweat_sheet=sweat_sheet).values(
+        'id', 'section_id', 'workout_category_id', 'specific_workout_id',
+        'sets', 'reps', 'weight', 'completed', 'order', 'ordinal'
+    ):
+        if completion is not None:
+            exercise['completed'] = bitsets.contains(completion, exercise['ordinal'])
+        override = exercise_overrides.get(exercise['id'])
+        if override is not None:
+            for field in OVERRIDE_FIELDS:
+                if getattr(override, field) is not None:
+                    exercise[field] = getattr(override, field)
+        sections[exercise['section_id']]['exercises'].append(exercise)
+    for phase in phases.values():
+        if phase['id'] in phase_overrides:
+            phase['is_completed'] = phase_overrides[phase['id']].is_completed
+    return list(phases.values())
+
+
+def copy_tree(source, sweat_sheet):
+    """Give ``sweat_sheet`` its own copy of the tree of ``source``"""
+    return create_tree(sweat_sheet, tree_data(source))
+
+
+# Template instances
+
+OVERRIDE_FIELDS = ('sets', 'reps', 'weight')
+
+
+def instantiate(template, athletes):
+    """Assign ``template`` to each of ``athletes`` without copying its tree"""
+    template = template.template or template
+    return [
+        SweatSheet.objects.create(
+            name=template.name,
+            user=template.user,
+            assigned_to=athlete,
+            template=template,
+            total_exercises=template.total_exercises,
+        )
+        for athlete in athletes
+    ]
+
+
+def detach(instance):
+    """Copy the merged tree of a template instance into its own rows.
+
+    Returns ``{node_type: {template id: new id}}`` for the copied nodes.
+    """
+    with transaction.atomic():
+        exercise_overrides = {o.exercise_id: o for o in instance.exercise_overrides.all()}
+        phase_overrides = {o.phase_id: o for o in instance.phase_overrides.all()}
+        completion = SweatSheet.objects.values_list('completion', flat=True).get(pk=instance.pk)
+        data = tree_data(instance.template, exercise_overrides, phase_overrides, bytes(completion))
+        _drop_instance_state(instance)
+        phases, sections, exercises = _insert_tree(instance, data)
+        Phase.objects.bulk_update([
+            Phase(pk=phase.pk, completed_at=phase_overrides[source['id']].completed_at)
+            for phase, source in zip(phases, data)
+            if phase.is_completed and source['id'] in phase_overrides
+        ], ['completed_at'])
+        progress.refresh_rollups([instance.pk])
+
+    section_data = [section for phase in data for section in phase['sections']]
+    exercise_data = [exercise for section in section_data for exercise in section['exercises']]
+    return {
+        node_type: {source['id']: node.pk for source, node in zip(sources, nodes)}
+        for node_type, sources, nodes in (
+            ('phase', data, phases),
+            ('section', section_data, sections),
+            ('exercise', exercise_data, exercises),
+        )
+    }
+
+
+def _drop_instance_state(instance):
+    instance.exercise_overrides.all().delete()
+    instance.phase_overrides.all().delete()
+    SweatSheet.objects.filter(pk=instance.pk).update(template=None, completion=b'')
+    documents.invalidate([instance.pk])
+    instance.template_id = None
+    instance.completion = b''
+
+
+class PatchError(Exception):
+    """A tree patch operation is malformed or cannot be applied"""
+
+
+class VersionConflict(Exception):
+    """The SweatSheet changed since the version a patch was based on"""
+
+    def __init__(self, current_version):
+        super().__init__(f"SweatSheet is at version {current_version}")
+        self.current_version = current_version
+
+
+# Fields each operation may set, per node type
+PATCH_FIELDS = {
+    'phase': ('phase_number', 'is_completed'),
+    'section': ('section_number', 'date'),
+    'exercise': ('workout_category_id', 'specific_workout_id', 'sets', 'reps', 'weight', 'completed'),
+}
+PATCH_MODELS = {'phase': Phase, 'section': Section, 'exercise': Exercise}
+PARENT_TYPES = {'section': 'phase', 'exercise': 'section'}
+CHILD_TYPES = {'phase': 'section', 'section': 'exercise'}
+
+
+def apply_patch(sweat_sheet, base_version, operations):
+    """Apply tree ``operations`` to ``sweat_sheet`` if it is still at ``base_version``.
+
+    Operations are dicts with an ``op`` (``add``, ``move``, ``update`` or
+    ``delete``) and a ``type`` (``phase``, ``section`` or ``exercise``).
+    Existing nodes are named by ``id``; added nodes may carry a client
+    ``ref`` that later operations use in place of an id. ``parent`` names
+    the phase of a section or the section of an exercise, and ``after``
+    places an exercise after a sibling (``null`` for first, omitted for
+    last). On a template instance, updates of per-athlete fields are stored
+    as overrides and anything else detaches the instance first.
+
+    Returns ``(new_version, {ref: id}, replaced)`` where ``replaced`` maps
+    template ids to the ids of the detached copies, if the instance was
+    detached. Raises ``VersionConflict`` or ``PatchError`` and leaves the
+    tree untouched on failure.
+    """
+    with transaction.atomic():
+        bumped = SweatSheet.objects.filter(pk=sweat_sheet.pk, version=base_version).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not bumped:
+            raise VersionConflict(
+                SweatSheet.objects.filter(pk=sweat_sheet.pk).values_list('version', flat=True).first()
+            )
+        documents.invalidate([sweat_sheet.pk])
+        replaced = {}
+        if sweat_sheet.template_id:
+            if all(_is_override(operation) for operation in operations):
+                _apply_overrides(sweat_sheet, operations)
+                return base_version + 1, {}, replaced
+            # Copy on write: structural edits give the instance its own tree
+            replaced = detach(sweat_sheet)
+            operations = [_remap(operation, replaced) for operation in operations]
+
+        patch = _TreePatch(sweat_sheet, operations)
+        for index, operation in enumerate(operations):
+            try:
+                patch.apply(operation)
+            except PatchError as error:
+                raise PatchError(f"Operation {index}: {error}") from None
+        created = patch.save()
+    return base_version + 1, created, replaced
+
+
+def _is_override(operation):
+    """Whether ``operation`` only changes per-athlete state of a template instance"""
+    if not isinstance(operation, dict) or operation.get('op') != 'update':
+        return False
+    data = operation.get('data')
+    allowed = {'exercise': set(OVERRIDE_FIELDS) | {'completed'}, 'phase': {'is_completed'}}
+    return isinstance(data, dict) and set(data) <= allowed.get(operation.get('type'), set())
+
+
+def _remap(operation, replaced):
+    """Point the ids in ``operation`` from template nodes to the detached copies"""
+    if not isinstance(operation, dict):
+        return operation
+    operation = dict(operation)
+    node_type = operation.get('type')
+    for key, key_type in (('id', node_type), ('parent', PARENT_TYPES.get(node_type)), ('after', node_type)):
+        value = operation.get(key)
+        if isinstance(value, int) and value in replaced.get(key_type, {}):
+            operation[key] = replaced[key_type][value]
+    return operation
+
+
+def _apply_overrides(instance, operations):
+    """Store exercise/phase updates of a template instance as override rows"""
+    values = defaultdict(dict)
+    for index, operation in enumerate(operations):
+        try:
+            values[operation['type'], operation.get('id')].update(_clean(operation['type'], operation['data']))
+        except PatchError as error:
+            raise PatchError(f"Operation {index}: {error}") from None
+
+    ids = {node_type: {pk for kind, pk in values if kind == node_type} for node_type in ('exercise', 'phase')}
+    known = {
+        'exercise': set(Exercise.objects.filter(
+            section__phase__sweat_sheet=instance.template_id, id__in=ids['exercise']
+        ).values_list('id', flat=True)) if ids['exercise'] else set(),
+        'phase': set(Phase.objects.filter(
+            sweat_sheet=instance.template_id, id__in=ids['phase']
+        ).values_list('id', flat=True)) if ids['phase'] else set(),
+    }
+    for node_type in ids:
+        unknown = ids[node_type] - known[node_type]
+        if unknown:
+            raise PatchError(f"Unknown {node_type} {sorted(unknown, key=str)[0]!r}")
+
+    now = timezone.now()
+    completion = {True: [], False: []}
+    for node_type, model, fields in (
+        ('exercise', ExerciseOverride, OVERRIDE_FIELDS),
+        ('phase', PhaseOverride, ('is_completed', 'completed_at')),
+    ):
+        if node_type == 'exercise':
+            for pk in ids['exercise']:
+                if 'completed' in values['exercise', pk]:
+                    completion[values['exercise', pk].pop('completed')].append(pk)
+        changed = {pk for pk in ids[node_type] if values[node_type, pk]}
+        if not changed:
+            continue
+        existing = {
+            getattr(override, f'{node_type}_id'): override
+            for override in model.objects.select_for_update().filter(
+                sweat_sheet=instance, **{f'{node_type}_id__in': changed}
+            )
+        }
+        new = []
+        for pk in changed:
+            override = existing.get(pk)
+            if override is None:
+                override = model(sweat_sheet=instance, **{f'{node_type}_id': pk})
+                new.append(override)
+            for name, value in values[node_type, pk].items():
+                if name == 'is_completed' and value != override.is_completed:
+                    override.completed_at = now if value else None
+                setattr(override, name, value)
+        model.objects.bulk_create(new)
+        model.objects.bulk_update(list(existing.values()), fields, batch_size=500)
+
+    for completed, exercise_ids in completion.items():
+        if exercise_ids:
+            progress.set_instance_exercises_completed(instance, exercise_ids, completed)
+
+
+def _clean(node_type, data):
+    """Validate the ``data`` of an operation against the model fields"""
+    if not isinstance(data, dict):
+        raise PatchError("'data' must be an object")
+    unknown = set(data) - set(PATCH_FIELDS[node_type])
+    if unknown:
+        raise PatchError(f"Cannot set {', '.join(sorted(unknown))} on a {node_type}")
+    model = PATCH_MODELS[node_type]
+    values = {}
+    for name, value in data.items():
+        field = model._meta.get_field(name.removesuffix('_id'))
+        if name.endswith('_id'):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise PatchError(f"{name} must be an id")
+            values[name] = value
+            continue
+        try:
+            value = field.to_python(value)
+            if value is None:
+                raise ValidationError("This field may not be null.")
+            field.run_validators(value)
+        except ValidationError as error:
+            raise PatchError(f"{name}: {' '.join(error.messages)}") from None
+        values[name] = value
+    return values
+
+
+class _TreePatch:
+    """In-memory view of the nodes a patch touches, written back by ``save()``"""
+
+    def __init__(self, sweat_sheet, operations):
+        self.sweat_sheet = sweat_sheet
+        self.nodes = {node_type: {} for node_type in PATCH_MODELS}
+        self.new = {node_type: [] for node_type in PATCH_MODELS}
+        self.refs = {}
+        self.dirty = defaultdict(set)  # (node_type, field) -> ids of existing rows to update
+        self.deleted = {node_type: set() for node_type in PATCH_MODELS}
+        self.siblings = {}  # id(section node) -> exercises sorted by order
+        self.structural = False
+        self._load(operations)
+
+    def _load(self, operations):
+        """Fetch every existing node the operations name, plus the exercises of
+        sections that get new or moved exercises, in one query per level"""
+        ids = defaultdict(set)
+        ordered_sections = set()  # sections receiving exercises
+        moved_in_place = set()  # exercises reordered within their section
+        for operation in operations:
+            if not isinstance(operation, dict):
+                raise PatchError("Operations must be objects")
+            node_type = operation.get('type')
+            if isinstance(operation.get('id'), int):
+                ids[node_type].add(operation['id'])
+            parent = operation.get('parent')
+            if isinstance(parent, int) and node_type in PARENT_TYPES:
+                ids[PARENT_TYPES[node_type]].add(parent)
+                if node_type == 'exercise':
+                    ordered_sections.add(parent)
+            if node_type == 'exercise' and isinstance(operation.get('after'), int):
+                ids['exercise'].add(operation['after'])
+            if node_type == 'exercise' and operation.get('op') == 'move' and 'parent' not in operation:
+                moved_in_place.add(operation.get('id'))
+
+        sheet = self.sweat_sheet
+        if ids['phase']:
+            phases = sheet.phases.filter(id__in=ids['phase'])
+            for phase in phases.only('id', 'sweat_sheet_id', 'phase_number', 'is_completed'):
+                self.nodes['phase'][phase.id] = phase
+        exercise_filter = Exercise.objects.filter(section__phase__sweat_sheet=sheet)
+        exercises = list(
+            exercise_filter.filter(id__in=ids['exercise']).only(*self._exercise_columns())
+        ) if ids['exercise'] else []
+        ordered_sections |= {exercise.section_id for exercise in exercises if exercise.id in moved_in_place}
+        section_ids = ids['section'] | ordered_sections | {exercise.section_id for exercise in exercises}
+        if section_ids:
+            for section in Section.objects.filter(phase__sweat_sheet=sheet, id__in=section_ids).only(
+                'id', 'phase_id', 'section_number', 'date'
+            ):
+                self.nodes['section'][section.id] = section
+
+        sorted_sections = ordered_sections & set(self.nodes['section'])
+        if sorted_sections:
+            exercises += list(
+                exercise_filter.filter(section_id__in=sorted_sections)
+                .exclude(id__in=[exercise.id for exercise in exercises]).only(*self._exercise_columns())
+            )
+            for section_id in sorted_sections:
+                self.siblings[id(self.nodes['section'][section_id])] = []
+        for exercise in exercises:
+            self.nodes['exercise'][exercise.id] = exercise
+            exercise.section = self.nodes['section'][exercise.section_id]
+            if id(exercise.section) in self.siblings:
+                self.siblings[id(exercise.section)].append(exercise)
+        for siblings in self.siblings.values():
+            siblings.sort(key=lambda exercise: (exercise.order, exercise.id))
+
+    @staticmethod
+    def _exercise_columns():
+        return ('id', 'section_id', 'order') + PATCH_FIELDS['exercise']
+
+    def _node(self, node_type, key):
+        node = self.refs.get((node_type, key)) if isinstance(key, str) else self.nodes[node_type].get(key)
+        if node is None or (node.pk is not None and node.pk in self.deleted[node_type]) \
+                or getattr(node, '_patch_deleted', False):
+            raise PatchError(f"Unknown {node_type} {key!r}")
+        return node
+
+    def apply(self, operation):
+        op, node_type = operation.get('op'), operation.get('type')
+        if node_type not in PATCH_MODELS:
+            raise PatchError(f"Unknown type {node_type!r}")
+        handler = getattr(self, f'_{op}', None) if op in ('add', 'move', 'update', 'delete') else None
+        if handler is None:
+            raise PatchError(f"Unknown op {op!r}")
+        handler(node_type, operation)
+
+    def _mark(self, node_type, node, fields):
+        if node.pk is not None:
+            for field in fields:
+                self.dirty[node_type, field].add(node.pk)
+
+    def _add(self, node_type, operation):
+        values = _clean(node_type, operation.get('data', {}))
+        required = {
+            'phase': ('phase_number',),
+            'section': ('section_number', 'date'),
+            'exercise': ('workout_category_id', 'specific_workout_id'),
+        }[node_type]
+        missing = [name for name in required if name not in values]
+        if missing:
+            raise PatchError(f"Missing {', '.join(missing)}")
+
+        if node_type == 'phase':
+            node = Phase(sweat_sheet=self.sweat_sheet, **values)
+            if node.is_completed:
+                node.completed_at = timezone.now()
+        elif node_type == 'section':
+            node = Section(phase=self._node('phase', operation.get('parent')), **values)
+        else:
+            values.setdefault('sets', '')
+            values.setdefault('reps', '')
+            node = Exercise(**values)
+            self._place(node, self._node('section', operation.get('parent')), operation)
+            self.structural = True
+
+        ref = operation.get('ref')
+        if ref is not None:
+            if not isinstance(ref, str) or (node_type, ref) in self.refs:
+                raise PatchError("'ref' must be a unique string")
+            self.refs[node_type, ref] = node
+        self.new[node_type].append(node)
+
+    def _update(self, node_type, operation):
+        node = self._node(node_type, operation.get('id'))
+        values = _clean(node_type, operation.get('data', {}))
+        if values.get('is_completed') is not None and values['is_completed'] != node.is_completed:
+            node.completed_at = timezone.now() if values['is_completed'] else None
+            self._mark(node_type, node, ['completed_at'])
+        if 'completed' in values:
+            self.structural = True
+        for name, value in values.items():
+            setattr(node, name, value)
+        self._mark(node_type, node, values)
+
+    def _move(self, node_type, operation):
+        if node_type == 'phase':
+            raise PatchError("Phases are reordered by updating phase_number")
+        node = self._node(node_type, operation.get('id'))
+        if node_type == 'section':
+            if 'section_number' in operation:
+                values = _clean('section', {'section_number': operation['section_number']})
+                node.section_number = values['section_number']
+                self._mark('section', node, ['section_number'])
+            if 'parent' in operation:
+                node.phase = self._node('phase', operation['parent'])
+                self._mark('section', node, ['phase_id'])
+                self.structural = True
+        else:
+            parent = node.section
+            if 'parent' in operation:
+                parent = self._node('section', operation['parent'])
+            old_siblings = self.siblings.get(id(node.section))
+            if old_siblings is not None and node in old_siblings:
+                old_siblings.remove(node)
+            if parent is not node.section:
+                self.structural = True
+            self._place(node, parent, operation)
+            self._mark('exercise', node, ['section_id', 'order'])
+
+    def _place(self, exercise, section, operation):
+        """Put ``exercise`` into ``section`` after ``operation['after']``, renumbering
+        the section only if there is no room between the two neighbours"""
+        exercise.section = section
+        siblings = self.siblings.setdefault(id(section), [])
+        if 'after' not in operation:
+            index = len(siblings)
+        elif operation['after'] is None:
+            index = 0
+        else:
+            after = self._node('exercise', operation['after'])
+            if after not in siblings:
+                raise PatchError(f"Exercise {operation['after']!r} is not in that section")
+            index = siblings.index(after) + 1
+
+        before = siblings[index - 1].order if index > 0 else None
+        following = siblings[index].order if index < len(siblings) else None
+        if before is None and following is None:
+            order = ORDER_GAP
+        elif following is None:
+            order = before + ORDER_GAP
+        elif before is None:
+            order = following - ORDER_GAP
+        elif following - before > 1:
+            order = (before + following) // 2
+        else:
+            order = None
+        siblings.insert(index, exercise)
+
+        if order is None:
+            for position, sibling in enumerate(siblings, 1):
+                sibling.order = position * ORDER_GAP
+                self._mark('exercise', sibling, ['order'])
+        else:
+            exercise.order = order
+
+    def _delete(self, node_type, operation):
+        node = self._node(node_type, operation.get('id'))
+        if node.pk is None:
+            self._discard(node_type, node)
+        else:
+            self.deleted[node_type].add(node.pk)
+        if node_type == 'exercise':
+            siblings = self.siblings.get(id(node.section))
+            if siblings is not None and node in siblings:
+                siblings.remove(node)
+        self.structural = True
+
+    def _discard(self, node_type, node):
+        """Forget a node added earlier in the patch, with the nodes added under it"""
+        self.new[node_type].remove(node)
+        node._patch_deleted = True
+        child_type = CHILD_TYPES.get(node_type)
+        if child_type:
+            for child in [c for c in self.new[child_type] if getattr(c, PARENT_TYPES[child_type]) is node]:
+                self._discard(child_type, child)
+
+    def save(self):
+        """Write the patch with one statement per model and field: inserts,
+        then updates, then deletes, so deleting a node also removes whatever
+        was moved into it. Returns ``{ref: id}`` for the inserted nodes."""
+        self._check_references()
+        try:
+            with transaction.atomic():
+                # Park renumbered, re-parented and doomed rows on unique negative
+                # numbers so swaps and reuse cannot trip the unique constraints
+                for node_type, field in (('phase', 'phase_number'), ('section', 'section_number')):
+                    parked = (
+                        self.dirty[node_type, field] | self.dirty[node_type, 'phase_id']
+                        | self.deleted[node_type]
+                    )
+                    if parked:
+                        PATCH_MODELS[node_type].objects.filter(id__in=parked).update(**{field: F('id') * -1})
+                        self.dirty[node_type, field] |= self.dirty[node_type, 'phase_id']
+
+                if self.new['exercise']:
+                    self._assign_ordinals()
+                for node_type in ('phase', 'section', 'exercise'):
+                    if self.new[node_type]:
+                        PATCH_MODELS[node_type].objects.bulk_create(self.new[node_type], batch_size=500)
+
+                for (node_type, field), ids in self.dirty.items():
+                    ids = ids - self.deleted[node_type]
+                    if ids:
+                        nodes = [self.nodes[node_type][pk] for pk in ids]
+                        PATCH_MODELS[node_type].objects.bulk_update(
+                            nodes, [field.removesuffix('_id')], batch_size=500
+                        )
+
+                for node_type in ('exercise', 'section', 'phase'):
+                    if self.deleted[node_type]:
+                        PATCH_MODELS[node_type].objects.filter(id__in=self.deleted[node_type]).delete()
+        except IntegrityError:
+            raise PatchError("Phase and section numbers must be unique") from None
+
+        if self.structural or self.new['phase'] or self.deleted['phase']:
+            progress.refresh_rollups([self.sweat_sheet.pk])
+        return {ref: node.pk for (node_type, ref), node in self.refs.items() if node.pk is not None}
+
+    def _assign_ordinals(self):
+        # The version bump at the start of the patch already locked the sheet
+        sheet = SweatSheet.objects.filter(pk=self.sweat_sheet.pk)
+        first = sheet.values_list('exercise_ordinals', flat=True).get()
+        for ordinal, exercise in enumerate(self.new['exercise'], first):
+            exercise.ordinal = ordinal
+        sheet.update(exercise_ordinals=first + len(self.new['exercise']))
+
+    def _check_references(self):
+        touched = set().union(*(
+            ids for (node_type, field), ids in self.dirty.items()
+            if node_type == 'exercise' and field in ('workout_category_id', 'specific_workout_id')
+        ))
+        exercises = [self.nodes['exercise'][pk] for pk in touched] + self.new['exercise']
+        errors = _reference_errors(list({
+            (exercise.workout_category_id, exercise.specific_workout_id) for exercise in exercises
+        }))
+        if errors:
+            raise PatchError('; '.join(errors))
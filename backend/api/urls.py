@@ -1,10 +1,12 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('notes/', views.NoteListCreate.as_view(), name='note-list'),
     path('notes/delete/<int:pk>/', views.NoteDelete.as_view(), name='delete-note'),
     path('register/', views.UserCreateView.as_view(), name='register'),
+    path('register/bulk/', views.BulkRegisterView.as_view(), name='register-bulk'),
+    path('token/revoke/', views.revoke_token, name='token-revoke'),
     path('calendar/', views.CalendarView.as_view(), name='calendar'),
     path('profile/', views.ProfileView.as_view(), name='profile'),
     
@@ -29,4 +31,20 @@ urlpatterns = [
     path('sections/<int:section_id>/exercises/', views.ExerciseListView.as_view(), name='exercise-list'),
     path('phases/<int:phase_id>/complete/', views.complete_phase, name='complete-phase'),
     path('exercises/<int:exercise_id>/complete/', views.complete_exercise, name='complete-exercise'),
+    path('exercises/complete/', views.complete_exercises, name='complete-exercises'),
+    path('dashboard/athletes/', views.AthleteDashboardView.as_view(), name='athlete-dashboard'),
+    path('export/', views.export_data, name='export-data'),
+    path('imports/', views.ImportListView.as_view(), name='import-list'),
+    path('imports/<int:pk>/', views.ImportDetailView.as_view(), name='import-detail'),
+
+    # Search
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+
+    # Async variants of the hot reads, for ASGI deployments
+    path('async/conversations/', async_views.inbox, name='conversation-list-async'),
+    path('async/conversations/<int:conversation_id>/messages/', async_views.message_list, name='message-list-async'),
+    path('async/profile/', async_views.profile, name='profile-async'),
+    path('async/calendar/', async_views.calendar, name='calendar-async'),
+    path('async/sweatsheets/<int:pk>/', async_views.sweat_sheet_detail, name='sweatsheet-detail-async'),
 ]
\ No newline at end of file
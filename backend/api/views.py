@@ -3,25 +3,37 @@ from django.contrib.auth.models import User
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from django.db.models import Q, Max
+from django.db.models import Q, Max, Sum, Count
 from .serializers import (
     UserSerializer, NoteSerializer, CalendarSerializer, ProfileSerializer, ProfileUpdateSerializer, TeamUserSerializer,
     WorkoutCategorySerializer, WorkoutExerciseSerializer, SweatSheetSerializer,
     PhaseSerializer, SectionSerializer, ExerciseSerializer,
     # Messaging serializers
-    MessageSerializer, ConversationListSerializer, ConversationDetailSerializer, ConversationCreateSerializer
+    MessageSerializer, ConversationListSerializer, ConversationDetailSerializer, ConversationCreateSerializer,
+    ImportJobSerializer, CompleteExerciseSerializer, CompleteExercisesSerializer
 )
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .models import (
     Note, Calendar, Profile, WorkoutCategory, WorkoutExercise, SweatSheet, Phase, Section, Exercise,
     # Messaging models
-    Conversation, Message, MessageRead
+    Conversation, Message, MessageRead,
+    ImportJob
 )
-from django.db import models
+from django.db import models, transaction
 from rest_framework import serializers
 from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from . import search, jobs, metrics, progress, trees, documents, renderers, export, imports, provisioning, tokens, coalesce, profiles, async_views
+from .throttles import TokenBucketThrottle
+import os
+import uuid
 
 def has_sweatpro_permissions(user):
     """Check if user has SweatPro permissions (PRO or SWEAT_TEAM_MEMBER)"""
@@ -61,6 +73,41 @@ class UserCreateView(generics.CreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
 
+class BulkRegisterView(APIView):
+    """Register a whole roster at once: ``{"users": [{"username": ..., "password": ...,
+    "role": ...}, ...]}``. SweatPros can add athletes and team members, staff
+    any role. Invalid entries are returned by index and do not stop the others."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if not (request.user.is_staff or has_sweatpro_permissions(request.user)):
+            return Response({"error": "Only SweatPros can register team members"}, status=403)
+        entries = request.data.get('users') if isinstance(request.data, dict) else request.data
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "users must be a non-empty list"}, status=400)
+        if len(entries) > provisioning.MAX_USERS:
+            return Response(
+                {"error": f"At most {provisioning.MAX_USERS} users can be registered per request"}, status=400
+            )
+
+        allowed_roles = None if request.user.is_staff else ('ATHLETE', 'SWEAT_TEAM_MEMBER')
+        # Hashed here rather than in a process pool forked from the server worker
+        users, errors = provisioning.register(entries, allowed_roles=allowed_roles, workers=1)
+        return Response(
+            {'created': UserSerializer(users, many=True).data, 'errors': errors},
+            status=201 if users else 400,
+        )
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def revoke_token(request):
+    """Log out: blacklist the given refresh token so it cannot be refreshed again"""
+    try:
+        tokens.revoke(str(request.data.get('refresh', '')))
+    except TokenError as error:
+        return Response({"error": str(error)}, status=400)
+    return Response(status=204)
+
 class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -71,49 +118,67 @@ class CalendarView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user.calendar
+        return Calendar.objects.for_user(self.request.user)
+
+# Polling tabs ask for the same profile at the same moment; they share one read
+profile_reads = coalesce.SingleFlight('profile')
 
 class ProfileView(generics.RetrieveUpdateAPIView):
+    # The user id comes from the access token, so a cached snapshot is
+    # served without loading the user; its active flag is re-read from the
+    # database every PROFILE_AUTH_SECONDS
+    authentication_classes = [JWTStatelessUserAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'profile'
 
     def get(self, request):
-        user = request.user
         try:
-            profile_data = {
-                'id': user.id,
-                'username': user.username,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'email': user.email,
-                'profile': {
-                    'role': user.profile.role,
-                    'phone_number': user.profile.phone_number,
-                }
-            }
-            return JsonResponse(profile_data)
+            snapshot = profile_reads.do(request.user.pk, lambda: profiles.get(request.user.pk))
+        except User.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
+        if not snapshot.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return self.profile_response(request, snapshot)
+
+    def profile_response(self, request, snapshot):
+        """The snapshot with its ETag, answering 304 when the client has it,
+        and letting the browser reuse it for PROFILE_MAX_AGE seconds"""
+        response = get_conditional_response(request, etag=snapshot.etag)
+        if response is None:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+        response.headers['ETag'] = snapshot.etag
+        patch_cache_control(response, private=True, max_age=settings.PROFILE_MAX_AGE)
+        patch_vary_headers(response, ('Authorization',))
+        return response
 
     def patch(self, request):
-        user = request.user
         data = request.data
         
         try:
-            # Update user fields
-            if 'first_name' in data:
-                user.first_name = data['first_name']
-            if 'last_name' in data:
-                user.last_name = data['last_name']
-            if 'email' in data:
-                user.email = data['email']
-            user.save()
-            
-            # Update profile fields
-            if 'phone_number' in data:
-                user.profile.phone_number = data['phone_number']
-                user.profile.save()
+            user = User.objects.select_related('profile').filter(pk=request.user.pk, is_active=True).first()
+            if user is None:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            with transaction.atomic():
+                # Update user fields
+                user_fields = [field for field in ('first_name', 'last_name', 'email') if field in data]
+                for field in user_fields:
+                    setattr(user, field, data[field])
+                if user_fields:
+                    user.save(update_fields=user_fields)
                 
-            return self.get(request)  # Return updated data
+                # Update profile fields
+                if 'phone_number' in data:
+                    user.profile.phone_number = data['phone_number']
+                    user.profile.save(update_fields=['phone_number'])
+                
+                # Written through on commit, and answered without re-reading
+                snapshot = profiles.write(user, user.profile)
+            return self.profile_response(request, snapshot)
+        except AuthenticationFailed:
+            raise
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
@@ -204,14 +269,23 @@ class MessageListCreateView(generics.ListCreateAPIView):
         if not conversation:
             raise serializers.ValidationError("Conversation not found or access denied")
         
-        message = serializer.save(
-            conversation=conversation,
-            sender=self.request.user
-        )
-        
-        # Update conversation timestamp
-        conversation.updated_at = timezone.now()
-        conversation.save()
+        # The notification job is committed together with the message
+        with transaction.atomic():
+            message = serializer.save(
+                conversation=conversation,
+                sender=self.request.user
+            )
+            
+            # Update conversation timestamp
+            conversation.updated_at = timezone.now()
+            conversation.save()
+
+            jobs.enqueue(
+                'notifications.new_message',
+                {'message_id': message.id},
+                dedupe_key=f'message:{message.id}'
+            )
+            transaction.on_commit(lambda: async_views.conversation_changed(conversation.id, message.id))
 
 class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Get, update, or delete a specific message"""
@@ -346,14 +420,14 @@ class SweatSheetListView(generics.ListCreateAPIView):
         
         if has_sweatpro_permissions(user):
             # SweatPros and SweatTeamMembers see their created SweatSheets and templates
-            return SweatSheet.objects.filter(
+            return trees.with_tree(SweatSheet.objects.filter(
                 models.Q(user=user) | models.Q(is_template=True)
-            )
+            ))
         else:
             # Athletes see their assigned SweatSheets and templates
-            return SweatSheet.objects.filter(
+            return trees.with_tree(SweatSheet.objects.filter(
                 models.Q(assigned_to=user) | models.Q(is_template=True)
-            )
+            ))
     
     def perform_create(self, serializer):
         # Only SweatPros can create SweatSheets
@@ -365,12 +439,65 @@ class SweatSheetDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = SweatSheetSerializer
     permission_classes = [IsAuthenticated]
     
-    def get_queryset(self):
+    def visible_sweat_sheets(self):
         user = self.request.user
         if has_sweatpro_permissions(user):
             return SweatSheet.objects.filter(user=user)
-        else:
-            return SweatSheet.objects.filter(assigned_to=user)
+        return SweatSheet.objects.filter(assigned_to=user)
+
+    def get_queryset(self):
+        queryset = self.visible_sweat_sheets()
+        # Writes refetch the tree themselves; tree patches only read what they touch
+        if self.request.method != 'GET':
+            return queryset
+        return trees.with_tree(queryset)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Serve the rendered document from ``api.documents``; the tree is
+        only loaded and serialized when there is no current one"""
+        sweat_sheet = get_object_or_404(
+            self.visible_sweat_sheets().values('id', 'template_id'), pk=kwargs['pk']
+        )
+
+        def render_document():
+            return renderers.dumps(self.get_serializer(self.get_object()).data)
+
+        document = documents.get_or_render(sweat_sheet['id'], sweat_sheet['template_id'], render_document)
+        return HttpResponse(document, content_type='application/json')
+
+    def destroy(self, request, *args, **kwargs):
+        if self.get_object().instances.exists():
+            return Response({"error": "SweatSheet is still assigned to athletes as a template"}, status=409)
+        return super().destroy(request, *args, **kwargs)
+
+    def patch(self, request, *args, **kwargs):
+        """Partial update, or a versioned tree patch when ``operations`` is sent"""
+        if 'operations' not in request.data:
+            return super().patch(request, *args, **kwargs)
+
+        version = request.data.get('version')
+        operations = request.data['operations']
+        if not isinstance(version, int) or isinstance(version, bool):
+            return Response({"error": "version is required"}, status=400)
+        if not isinstance(operations, list) or not operations:
+            return Response({"error": "operations must be a non-empty list"}, status=400)
+        if len(operations) > trees.MAX_PATCH_OPERATIONS:
+            return Response(
+                {"error": f"At most {trees.MAX_PATCH_OPERATIONS} operations per request"},
+                status=400
+            )
+
+        sweat_sheet = self.get_object()
+        try:
+            version, created, replaced = trees.apply_patch(sweat_sheet, version, operations)
+        except trees.VersionConflict as conflict:
+            return Response(
+                {"error": "SweatSheet was changed by someone else", "version": conflict.current_version},
+                status=409
+            )
+        except trees.PatchError as error:
+            return Response({"error": str(error)}, status=400)
+        return Response({"id": sweat_sheet.id, "version": version, "created": created, "replaced": replaced})
 
 class SweatSheetAssignmentView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
@@ -384,16 +511,32 @@ class SweatSheetAssignmentView(generics.UpdateAPIView):
             sweatsheet = SweatSheet.objects.get(pk=pk, user=request.user)
             athlete_ids = request.data.get('athletes', [])
             
-            for athlete_id in athlete_ids:
-                athlete = User.objects.get(pk=athlete_id, profile__role='ATHLETE')
-                # Create a copy for assignment
-                assigned_sheet = SweatSheet.objects.create(
-                    name=sweatsheet.name,
-                    user=sweatsheet.user,
-                    assigned_to=athlete,
-                    is_template=False
-                )
-                # TODO: Copy phases, sections, and exercises
+            athletes = list(User.objects.filter(pk__in=athlete_ids, profile__role='ATHLETE'))
+            if len(athletes) != len(set(athlete_ids)):
+                return Response({"error": "Athlete not found"}, status=404)
+
+            with transaction.atomic():
+                if sweatsheet.is_template or sweatsheet.template_id:
+                    # Instances share the template's tree instead of copying it
+                    assigned_sheets = trees.instantiate(sweatsheet, athletes)
+                else:
+                    assigned_sheets = []
+                    for athlete in athletes:
+                        assigned_sheet = SweatSheet.objects.create(
+                            name=sweatsheet.name,
+                            user=sweatsheet.user,
+                            assigned_to=athlete,
+                            is_template=False
+                        )
+                        trees.copy_tree(sweatsheet, assigned_sheet)
+                        assigned_sheets.append(assigned_sheet)
+
+                for assigned_sheet in assigned_sheets:
+                    jobs.enqueue(
+                        'notifications.sweatsheet_assigned',
+                        {'sweat_sheet_id': assigned_sheet.id},
+                        dedupe_key=f'sweatsheet-assigned:{assigned_sheet.id}'
+                    )
             
             return Response({"message": "SweatSheet assigned successfully"})
         except SweatSheet.DoesNotExist:
@@ -444,10 +587,18 @@ class ExerciseListView(generics.ListAPIView):
 @permission_classes([IsAuthenticated])
 def complete_phase(request, phase_id):
     try:
-        phase = Phase.objects.get(pk=phase_id)
+        instance = progress.instance_for(request.user, phase_id=phase_id)
+        if instance is not None:
+            # A phase of the template the user's instance is based on
+            progress.complete_instance_phase(instance, Phase.objects.get(pk=phase_id))
+            return Response({"message": "Phase completed"})
+        phase = Phase.objects.get(
+            pk=phase_id, sweat_sheet__in=progress.trackable_sweatsheets(request.user)
+        )
         phase.is_completed = True
         phase.completed_at = timezone.now()
         phase.save()
+        progress.touch(phase)
         return Response({"message": "Phase completed"})
     except Phase.DoesNotExist:
         return Response({"error": "Phase not found"}, status=404)
@@ -455,10 +606,199 @@ def complete_phase(request, phase_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def complete_exercise(request, exercise_id):
-    try:
-        exercise = Exercise.objects.get(pk=exercise_id)
-        exercise.completed = True
-        exercise.save()
-        return Response({"message": "Exercise completed"})
-    except Exercise.DoesNotExist:
-        return Response({"error": "Exercise not found"}, status=404)
\ No newline at end of file
+    serializer = CompleteExerciseSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    instance = progress.instance_for(request.user, [exercise_id], serializer.validated_data['sweat_sheet_id'])
+    if instance is not None:
+        _, found = progress.set_instance_exercises_completed(instance, [exercise_id])
+    else:
+        _, found = progress.set_exercises_completed(Exercise.objects.filter(
+            pk=exercise_id,
+            section__phase__sweat_sheet__in=progress.trackable_sweatsheets(request.user)
+        ))
+    if not found:
+        return Response({"error": "Exercise not found"}, status=404)
+    return Response({"message": "Exercise completed"})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_exercises(request):
+    """Mark many exercises completed (or not) at once and return updated progress.
+
+    Exercises of an assigned template are completed on the athlete's
+    instance; pass ``sweat_sheet_id`` to pick the instance explicitly.
+    """
+    serializer = CompleteExercisesSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    exercise_ids = serializer.validated_data['exercise_ids']
+    completed = serializer.validated_data['completed']
+    auto_complete_phases = serializer.validated_data['auto_complete_phases']
+    instance = progress.instance_for(request.user, exercise_ids, serializer.validated_data['sweat_sheet_id'])
+    if instance is not None:
+        result, found = progress.set_instance_exercises_completed(
+            instance, exercise_ids, completed=completed, auto_complete_phases=auto_complete_phases
+        )
+    else:
+        result, found = progress.set_exercises_completed(
+            Exercise.objects.filter(
+                id__in=exercise_ids,
+                section__phase__sweat_sheet__in=progress.trackable_sweatsheets(request.user)
+            ),
+            completed=completed,
+            auto_complete_phases=auto_complete_phases,
+        )
+    if not found:
+        return Response({"error": "Exercises not found"}, status=404)
+
+    not_found = sorted(set(exercise_ids) - set(found))
+    result['not_found'] = not_found
+    return Response(result)
+
+class SearchView(APIView):
+    """Ranked full-text search across SweatSheets, notes and the exercise catalog"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        kinds = []
+        for name in request.query_params.get('type', '').split(','):
+            name = name.strip().lower()
+            if not name:
+                continue
+            if name not in search.KIND_NAMES:
+                return Response(
+                    {'error': f'Unknown type: {name}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            kinds.append(search.KIND_NAMES[name])
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = search.search(request.user, query, kinds=kinds, limit=limit)
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_data(request):
+    """Everything stored about the requesting user, streamed as NDJSON"""
+    response = StreamingHttpResponse(export.ndjson(request.user), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="sweatsheet-export-{request.user.username}.ndjson"'
+    return response
+
+
+class ImportListView(APIView):
+    """Queue a bulk import of the exercise catalog (staff) or of program
+    templates (SweatPros) from an uploaded CSV or JSON Lines file"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        import_jobs = ImportJob.objects.filter(owner=request.user).order_by('-id')[:50]
+        return Response(ImportJobSerializer(import_jobs, many=True).data)
+
+    def post(self, request):
+        kind = str(request.data.get('kind', '')).upper()
+        upload = request.FILES.get('file')
+        if kind not in dict(ImportJob.KIND_CHOICES):
+            return Response({"error": "kind must be catalog or programs"}, status=400)
+        if upload is None:
+            return Response({"error": "file is required"}, status=400)
+        if kind == 'CATALOG' and not request.user.is_staff:
+            return Response({"error": "Only staff can import the exercise catalog"}, status=403)
+        if kind == 'PROGRAMS' and not has_sweatpro_permissions(request.user):
+            return Response({"error": "Only SweatPros can import programs"}, status=403)
+
+        try:
+            file_format = imports.detect_format(upload.name)
+        except imports.InvalidImport as error:
+            return Response({"error": str(error)}, status=400)
+        os.makedirs(settings.IMPORT_UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(settings.IMPORT_UPLOAD_DIR, f"{uuid.uuid4().hex}.{file_format}")
+        with open(path, 'wb') as destination:
+            for chunk in upload.chunks():
+                destination.write(chunk)
+
+        try:
+            with transaction.atomic():
+                import_job = imports.start(kind, path, request.user, file_format=file_format)
+                jobs.enqueue('imports.run', {'import_job_id': import_job.id}, dedupe_key=f'import:{import_job.id}')
+        except imports.InvalidImport as error:
+            os.remove(path)
+            return Response({"error": str(error)}, status=400)
+        return Response(ImportJobSerializer(import_job).data, status=202)
+
+
+class ImportDetailView(generics.RetrieveAPIView):
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(owner=self.request.user)
+
+
+class MetricsView(APIView):
+    """Snapshot of the api.metrics counters, for staff"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot(request.query_params.get('prefix', '')))
+
+
+class AthleteDashboardView(APIView):
+    """Progress of every athlete across the SweatSheets the requesting SweatPro assigned.
+
+    Reads only the SweatSheet progress rollups, never the exercise tree.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not has_sweatpro_permissions(request.user):
+            return Response({"error": "Only SweatPros can view the athlete dashboard"}, status=403)
+
+        sweatsheets = SweatSheet.objects.filter(
+            user=request.user,
+            assigned_to__isnull=False,
+            is_active=True
+        )
+
+        athletes = {}
+        for row in sweatsheets.values(
+            'assigned_to', 'assigned_to__username', 'assigned_to__first_name', 'assigned_to__last_name'
+        ).annotate(
+            sheet_count=Count('id'),
+            total=Sum('total_exercises'),
+            completed=Sum('completed_exercises'),
+            last_activity_at=Max('last_activity_at'),
+        ).order_by('assigned_to__last_name', 'assigned_to__first_name', 'assigned_to__username'):
+            name = f"{row['assigned_to__first_name']} {row['assigned_to__last_name']}".strip()
+            athletes[row['assigned_to']] = {
+                'id': row['assigned_to'],
+                'username': row['assigned_to__username'],
+                'name': name or row['assigned_to__username'],
+                'sweat_sheet_count': row['sheet_count'],
+                'total_exercises': row['total'] or 0,
+                'completed_exercises': row['completed'] or 0,
+                'percent': progress.percent(row['completed'] or 0, row['total'] or 0),
+                'last_activity_at': row['last_activity_at'],
+                'sweat_sheets': [],
+            }
+
+        for sheet in sweatsheets.values(
+            'id', 'name', 'assigned_to', 'total_exercises', 'completed_exercises', 'last_activity_at'
+        ).order_by('-last_activity_at', 'id'):
+            athletes[sheet['assigned_to']]['sweat_sheets'].append({
+                'id': sheet['id'],
+                'name': sheet['name'],
+                'total_exercises': sheet['total_exercises'],
+                'completed_exercises': sheet['completed_exercises'],
+                'percent': progress.percent(sheet['completed_exercises'], sheet['total_exercises']),
+                'last_activity_at': sheet['last_activity_at'],
+            })
+
+        return Response({'athletes': list(athletes.values())})
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from datetime import timedelta
+from importlib.util import find_spec
 from dotenv import load_dotenv
 import os
 
@@ -40,12 +41,129 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson-backed when installed, see api/renderers.py
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    # Every refresh returns a new refresh token and blacklists the old one (api/tokens.py)
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'api.tokens.TokenRefreshSerializer',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Blacklisted refresh tokens (api/tokens.py): an LRU of at most MAX_ENTRIES whose
+    # entries expire with the tokens. Use a shared cache when running several processes;
+    # `manage.py check --deploy` fails on this one.
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+TOKEN_CACHE_ALIAS = 'tokens'
+# Seconds during which refreshing an already rotated token returns the same successor
+TOKEN_REUSE_WINDOW = 10
+
+# Token-bucket rate limits (api/throttles.py): throttle_scope -> (burst, refill per second)
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_BUCKETS = {
+    'profile': (20, 1.0),
 }
+# Seconds a browser may reuse a GET /api/profile/ response without asking again
+PROFILE_MAX_AGE = 5
+
+# Rendered profile snapshots (api/profiles.py), written through on save;
+# share this cache in production
+PROFILE_CACHE_ALIAS = 'default'
+PROFILE_CACHE_SECONDS = 3600
+# Snapshots are only trusted for the active flag and role this long (seconds)
+PROFILE_AUTH_SECONDS = 5
+
+# Long-polling message list (api/async_views.py): longest wait a client may
+# ask for, how often a waiting request looks at its conversation's marker in
+# LONG_POLL_CACHE_ALIAS, and how often it queries for new messages anyway.
+# Share this cache in production so a message posted in one process wakes
+# the requests waiting in the others at once.
+LONG_POLL_CACHE_ALIAS = 'default'
+LONG_POLL_MAX_WAIT = 30
+LONG_POLL_INTERVAL = 0.5
+LONG_POLL_RECHECK = 5
+
+# Production server (api/server.py, run with `manage.py serve`); 0 workers
+# picks a default from the CPU count
+SERVER_BIND = os.getenv('SERVER_BIND', '0.0.0.0:8000')
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '0'))
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', '1'))
+SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', '1000'))
+SERVER_MAX_REQUESTS_JITTER = 100
+SERVER_TIMEOUT = 30
+SERVER_GRACEFUL_TIMEOUT = 30
+SERVER_KEEPALIVE = 5
+
+# Background jobs (api/jobs.py, run with `manage.py run_workers`)
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '1'))
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', '4'))
+JOB_BATCH_SIZE = 50
+JOB_POLL_INTERVAL = 1.0  # seconds
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 30  # seconds, doubled on every attempt
+JOB_LOCK_TIMEOUT = 300  # seconds before a running job is considered abandoned
+JOB_RETENTION_DAYS = 7
+
+# api.notifications.LocMemTransport keeps notifications in memory for tests
+NOTIFICATION_TRANSPORT = os.getenv('NOTIFICATION_TRANSPORT', 'api.notifications.ConsoleTransport')
+# Messages arriving within this many seconds are sent as one digest per conversation
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv('NOTIFICATION_DIGEST_WINDOW', '60'))
+
+# Cache alias holding api.metrics counters; point it at a shared cache in production
+METRICS_CACHE_ALIAS = 'default'
+
+# Rendered SweatSheet detail documents (api/documents.py); share this cache
+# between processes in production so invalidations reach all of them
+DOCUMENT_CACHE_ALIAS = 'default'
+DOCUMENT_CACHE_SECONDS = 3600
+
+# Response compression (api/middleware.py); brotli and zstd are used when installed
+COMPRESSION_MIN_SIZE = 1024  # bytes
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_ZSTD_LEVEL = 3
+
+# Password hashing (api/hashers.py). New passwords use the first hasher:
+# Argon2id when argon2-cffi is installed, scrypt otherwise. The others only
+# verify existing hashes, which are rehashed with the first on the next login.
+PASSWORD_HASHERS = [
+    'api.hashers.Argon2PasswordHasher',
+    'api.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if find_spec('argon2') is None:
+    PASSWORD_HASHERS.remove('api.hashers.Argon2PasswordHasher')
+# Costs; the defaults are OWASP's minimums (Argon2id 19 MiB x 2, scrypt N=2^14 r=8 p=5)
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))  # KiB
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '1'))
+SCRYPT_WORK_FACTOR = int(os.getenv('SCRYPT_WORK_FACTOR', str(2 ** 14)))
+SCRYPT_BLOCK_SIZE = int(os.getenv('SCRYPT_BLOCK_SIZE', '8'))
+SCRYPT_PARALLELISM = int(os.getenv('SCRYPT_PARALLELISM', '5'))
+# Threads hashing passwords for the async token endpoint
+PASSWORD_HASH_THREADS = int(os.getenv('PASSWORD_HASH_THREADS', str(os.cpu_count() or 1)))
 
 # Application definition
 
@@ -63,6 +181,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -99,6 +218,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections across requests; `manage.py serve` opens them before traffic
+        # arrives, except under --asgi, which closes them after every request
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -148,4 +271,8 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Files uploaded to POST /api/imports/ (api/imports.py), kept until their import
+# is done. Outside MEDIA_ROOT, which is served publicly.
+IMPORT_UPLOAD_DIR = os.getenv('IMPORT_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploads', 'imports'))
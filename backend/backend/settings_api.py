@@ -0,0 +1,45 @@
+"""
+Settings for processes that only serve the JSON API.
+
+Everything in backend.settings minus what only the browser-facing parts
+use: the admin, sessions, flash messages, static files, templates, the
+CSRF/session/auth middleware and DRF's browsable API. The API
+authenticates every request from its JWT, so none of it is needed, and a
+process starts and answers its first request sooner without loading it.
+
+Select it with DJANGO_SETTINGS_MODULE=backend.settings_api, e.g. in front
+of `manage.py serve`. Run migrations and the admin with backend.settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in (
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+    )
+]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware not in (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    )
+]
+
+ROOT_URLCONF = 'backend.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ('api.renderers.FastJSONRenderer',),
+}
@@ -4,10 +4,16 @@ from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.conf import settings
 from django.conf.urls.static import static
+from api import async_views, health
 
 urlpatterns = [
+    # Liveness and readiness probes
+    path('healthz', health.healthz, name='healthz'),
+    path('readyz', health.readyz, name='readyz'),
     path('admin/', admin.site.urls),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    # Same contract, password checked off the event loop; for ASGI deployments
+    path('api/token/async/', async_views.obtain_token_pair, name='token_obtain_pair_async'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api-auth/', include('rest_framework.urls')),
     path('api/', include('api.urls')),
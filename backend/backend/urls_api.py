@@ -0,0 +1,16 @@
+"""URLconf of backend.settings_api: backend.urls without the admin, the
+browsable API login and media files."""
+from django.urls import path, include
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from api import async_views, health
+
+urlpatterns = [
+    # Liveness and readiness probes
+    path('healthz', health.healthz, name='healthz'),
+    path('readyz', health.readyz, name='readyz'),
+    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    # Same contract, password checked off the event loop; for ASGI deployments
+    path('api/token/async/', async_views.obtain_token_pair, name='token_obtain_pair_async'),
+    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/', include('api.urls')),
+]
@@ -34,10 +34,13 @@ export const sweatSheetApi = {
     createSweatSheet: (data: any) => api.post('/api/sweatsheets/', data),
     getSweatSheet: (id: number) => api.get(`/api/sweatsheets/${id}/`),
     updateSweatSheet: (id: number, data: any) => api.put(`/api/sweatsheets/${id}/`, data),
+    // Apply add/move/update/delete operations to the tree; 409 if `version` is stale
+    patchSweatSheet: (id: number, version: number, operations: any[]) =>
+        api.patch(`/api/sweatsheets/${id}/`, { version, operations }),
     deleteSweatSheet: (id: number) => api.delete(`/api/sweatsheets/${id}/`),
     
     // Assignment
-    assignSweatSheet: (id: number, athleteId: number) => api.put(`/api/sweatsheets/${id}/assign/`, { assigned_to: athleteId }),
+    assignSweatSheet: (id: number, athleteId: number) => api.patch(`/api/sweatsheets/${id}/assign/`, { athletes: [athleteId] }),
     getAthletes: () => api.get('/api/users/athletes/'),
     
     // Phase CRUD
@@ -55,6 +58,12 @@ export const sweatSheetApi = {
     // Completion actions
     completePhase: (phaseId: number) => api.post(`/api/phases/${phaseId}/complete/`),
     completeExercise: (exerciseId: number) => api.post(`/api/exercises/${exerciseId}/complete/`),
+    completeExercises: (exerciseIds: number[], completed: boolean = true, autoCompletePhases: boolean = false) =>
+        api.post('/api/exercises/complete/', {
+            exercise_ids: exerciseIds,
+            completed,
+            auto_complete_phases: autoCompletePhases,
+        }),
 };
 
 export default api;
\ No newline at end of file
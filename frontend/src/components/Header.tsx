@@ -31,6 +31,10 @@ function Header() {
                         setProfile(profileData);
                     })
                     .catch(err => {
+                        // Rate limited: keep the profile shown and try again on a later tick
+                        if (err.response?.status === 429) {
+                            return;
+                        }
                         console.error('Header profile fetch error:', err);
                         // If profile fetch fails, user might not be properly logged in
                         setIsLoggedIn(false);
@@ -243,9 +247,14 @@ const SideDrawer: React.FC = () => {
             Settings <Settings className="w-5 h-5" /> 
           </a>
           <button className="font-ethnocentric text-left hover:outline hover:outline-neutral-300 dark:hover:outline-neutral-800 block w-full hover:bg-red-100 dark:hover:bg-red-300 px-4 py-2 rounded transition text-red-600 dark:text-red-600 text-shadow" 
-          onClick={() => {
+          onClick={async () => {
+            const refresh = localStorage.getItem(REFRESH_TOKEN);
             localStorage.removeItem(ACCESS_TOKEN);
             localStorage.removeItem(REFRESH_TOKEN);
+            if (refresh) {
+              // Revoke the refresh token server-side; logging out locally does not depend on it
+              await api.post('/api/token/revoke/', { refresh }).catch(() => {});
+            }
             window.location.reload();
           }}>
             Logout
@@ -13,6 +13,44 @@ interface CustomJwtPayload extends JwtPayload {
     exp: number;
 }
 
+// The refresh in flight, shared by every route that needs one: refresh tokens are
+// single use, so parallel refreshes of one token would race each other
+let pendingRefresh: Promise<boolean> | null = null;
+
+const refreshTokens = async (): Promise<boolean> => {
+    const refreshTokenValue: string | null = localStorage.getItem(REFRESH_TOKEN);
+    if (!refreshTokenValue) {
+        return false;
+    }
+
+    try {
+        const res = await api.post('/api/token/refresh/', {
+            refresh: refreshTokenValue,
+        });
+        if (res.status !== 200) {
+            return false;
+        }
+        localStorage.setItem(ACCESS_TOKEN, res.data.access);
+        // Refresh tokens are single use: the server rotates them on every refresh
+        if (res.data.refresh) {
+            localStorage.setItem(REFRESH_TOKEN, res.data.refresh);
+        }
+        return true;
+    } catch (error) {
+        console.error('Token refresh error:', error);
+        return false;
+    }
+};
+
+const sharedRefresh = (): Promise<boolean> => {
+    if (!pendingRefresh) {
+        pendingRefresh = refreshTokens().finally(() => {
+            pendingRefresh = null;
+        });
+    }
+    return pendingRefresh;
+};
+
 const ProtectedRoute: React.FC<ProtectedRouteProps> = ({ children }) => {
     const [isAuthorized, setIsAuthorized] = useState<boolean | null>(null);
 
@@ -21,26 +59,7 @@ const ProtectedRoute: React.FC<ProtectedRouteProps> = ({ children }) => {
     }, []);
 
     const refreshToken = async (): Promise<void> => {
-        const refreshTokenValue: string | null = localStorage.getItem(REFRESH_TOKEN);
-        if (!refreshTokenValue) {
-            setIsAuthorized(false);
-            return;
-        }
-        
-        try { 
-            const res = await api.post('/api/token/refresh/', {
-                refresh: refreshTokenValue,
-            });
-            if (res.status === 200) {
-                localStorage.setItem(ACCESS_TOKEN, res.data.access);
-                setIsAuthorized(true);
-            } else {
-                setIsAuthorized(false);
-            }
-        } catch (error) {
-            console.error('Token refresh error:', error);
-            setIsAuthorized(false);
-        }
+        setIsAuthorized(await sharedRefresh());
     };
 
     const auth = async (): Promise<void> => {
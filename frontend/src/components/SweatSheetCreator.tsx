@@ -485,28 +485,17 @@ const SweatSheetCreator: React.FC = () => {
     try {
       console.log('Creating new SweatSheet for:', athlete.first_name);
 
-      // Create new SweatSheet
+      // Create the SweatSheet with its first phase (8 sections, 6 exercises each) in one request
       const newSweatSheetData = {
         name: `${athlete.first_name}'s Training Program`,
-        assigned_to: athlete.id
+        assigned_to: athlete.id,
+        phases: buildInitialPhases()
       };
 
       const response = await sweatSheetApi.createSweatSheet(newSweatSheetData);
       console.log('Created SweatSheet:', response.data);
-      const newSweatSheet = response.data;
-
-      // Initialize the first phase with 8 sections and 6 exercises each
-      await initializeSweatSheet(newSweatSheet.id);
-
-      // Wait a moment for the backend to process
-      await new Promise(resolve => setTimeout(resolve, 1000));
-
-      // Reload the SweatSheet to get the full structure
-      console.log('Reloading SweatSheet after creation...');
-      const reloadResponse = await sweatSheetApi.getSweatSheet(newSweatSheet.id);
-      console.log('Reloaded SweatSheet data:', reloadResponse.data);
       
-      setSweatSheet(reloadResponse.data);
+      setSweatSheet(response.data);
       setCurrentPhase(1);
       setCurrentSection(0);
     } catch (error) {
@@ -514,53 +503,25 @@ const SweatSheetCreator: React.FC = () => {
     }
   };
 
-  const initializeSweatSheet = async (sweatSheetId: number) => {
-    try {
-      console.log('Initializing SweatSheet with ID:', sweatSheetId);
-      
-      // Create Phase 1
-      const phaseData = {
-        phase_number: 1,
-        is_completed: false
-      };
-      
-      const phaseResponse = await sweatSheetApi.createPhase(sweatSheetId, phaseData);
-      const phaseId = phaseResponse.data.id;
-      console.log('Created phase with ID:', phaseId);
-
-      // Create 8 sections for Phase 1
-      for (let sectionNum = 1; sectionNum <= 8; sectionNum++) {
-        const sectionData = {
-          section_number: sectionNum,
-          date: new Date(Date.now() + (sectionNum - 1) * 24 * 60 * 60 * 1000).toISOString().split('T')[0]
-        };
-        
-        const sectionResponse = await sweatSheetApi.createSection(phaseId, sectionData);
-        const sectionId = sectionResponse.data.id;
-        console.log(`Created section ${sectionNum} with ID:`, sectionId);
-
-        // Create 6 exercises for each section
-        for (let exerciseNum = 1; exerciseNum <= 6; exerciseNum++) {
-          const exerciseData = {
-            workout_category_id: 1, // Default to first category
-            specific_workout_id: 1, // Default to first exercise
-            sets: '',
-            reps: '',
-            weight: '',
-            completed: false,
-            order: exerciseNum
-          };
-          
-          const exerciseResponse = await sweatSheetApi.createExercise(sectionId, exerciseData);
-          console.log(`Created exercise ${exerciseNum} with ID:`, exerciseResponse.data.id);
-        }
-      }
-      
-      console.log('SweatSheet initialization complete');
-    } catch (error) {
-      console.error('Error initializing SweatSheet:', error);
+  const buildInitialPhases = () => [
+    {
+      phase_number: 1,
+      is_completed: false,
+      sections: Array.from({ length: 8 }, (_, sectionIndex) => ({
+        section_number: sectionIndex + 1,
+        date: new Date(Date.now() + sectionIndex * 24 * 60 * 60 * 1000).toISOString().split('T')[0],
+        exercises: Array.from({ length: 6 }, (_, exerciseIndex) => ({
+          workout_category_id: 1, // Default to first category
+          specific_workout_id: 1, // Default to first exercise
+          sets: '',
+          reps: '',
+          weight: '',
+          completed: false,
+          order: exerciseIndex + 1
+        }))
+      }))
     }
-  };
+  ];
 
   if (loading) {
     return (
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { User, Users, CheckCircle, Calendar, ArrowLeft, ArrowRight, Plus, Trash2 } from 'lucide-react';
 import { sweatSheetApi } from '../api';
 
@@ -52,6 +52,7 @@ interface SweatSheet {
   phases: Phase[];
   creator_name: string;
   assigned_to_name: string;
+  version: number;
 }
 
 
@@ -67,11 +68,17 @@ const SweatSheetManager: React.FC = () => {
   const [currentPhase, setCurrentPhase] = useState(1);
   const [currentSection, setCurrentSection] = useState(0);
   const [loading, setLoading] = useState(true);
+  const sweatSheetVersion = useRef(0);
+  const patchQueue = useRef<Promise<unknown>>(Promise.resolve());
 
   useEffect(() => {
     loadInitialData();
   }, []);
 
+  useEffect(() => {
+    sweatSheetVersion.current = sweatSheet?.version ?? 0;
+  }, [sweatSheet?.id, sweatSheet?.version]);
+
   const loadInitialData = async () => {
     try {
       console.log('Loading initial data...');
@@ -127,28 +134,17 @@ const SweatSheetManager: React.FC = () => {
 
       console.log('Creating new SweatSheet for:', athlete.first_name);
 
-      // Create new SweatSheet
+      // Create the SweatSheet with its first phase (8 sections, 6 exercises each) in one request
       const newSweatSheetData = {
         name: `${athlete.first_name}'s Training Program`,
-        assigned_to: athleteId
+        assigned_to: athleteId,
+        phases: buildInitialPhases()
       };
 
       const response = await sweatSheetApi.createSweatSheet(newSweatSheetData);
       console.log('Created SweatSheet:', response.data);
-      const newSweatSheet = response.data;
-
-      // Initialize the first phase with 8 sections and 6 exercises each
-      await initializeSweatSheet(newSweatSheet.id);
-
-      // Wait a moment for the backend to process
-      await new Promise(resolve => setTimeout(resolve, 1000));
-
-      // Reload the SweatSheet to get the full structure
-      console.log('Reloading SweatSheet after creation...');
-      const reloadResponse = await sweatSheetApi.getSweatSheet(newSweatSheet.id);
-      console.log('Reloaded SweatSheet data:', reloadResponse.data);
       
-      setSweatSheet(reloadResponse.data);
+      setSweatSheet(response.data);
       setCurrentPhase(1);
       setCurrentSection(0);
     } catch (error) {
@@ -156,53 +152,25 @@ const SweatSheetManager: React.FC = () => {
     }
   };
 
-  const initializeSweatSheet = async (sweatSheetId: number) => {
-    try {
-      console.log('Initializing SweatSheet with ID:', sweatSheetId);
-      
-      // Create Phase 1
-      const phaseData = {
-        phase_number: 1,
-        is_completed: false
-      };
-      
-      const phaseResponse = await sweatSheetApi.createPhase(sweatSheetId, phaseData);
-      const phaseId = phaseResponse.data.id;
-      console.log('Created phase with ID:', phaseId);
-
-      // Create 8 sections for Phase 1
-      for (let sectionNum = 1; sectionNum <= 8; sectionNum++) {
-        const sectionData = {
-          section_number: sectionNum,
-          date: new Date(Date.now() + (sectionNum - 1) * 24 * 60 * 60 * 1000).toISOString().split('T')[0]
-        };
-        
-        const sectionResponse = await sweatSheetApi.createSection(phaseId, sectionData);
-        const sectionId = sectionResponse.data.id;
-        console.log(`Created section ${sectionNum} with ID:`, sectionId);
-
-        // Create 6 exercises for each section
-        for (let exerciseNum = 1; exerciseNum <= 6; exerciseNum++) {
-          const exerciseData = {
-            workout_category_id: 1, // Default to first category
-            specific_workout_id: 1, // Default to first exercise
-            sets: '',
-            reps: '',
-            weight: '',
-            completed: false,
-            order: exerciseNum
-          };
-          
-          const exerciseResponse = await sweatSheetApi.createExercise(sectionId, exerciseData);
-          console.log(`Created exercise ${exerciseNum} with ID:`, exerciseResponse.data.id);
-        }
-      }
-      
-      console.log('SweatSheet initialization complete');
-    } catch (error) {
-      console.error('Error initializing SweatSheet:', error);
+  const buildInitialPhases = () => [
+    {
+      phase_number: 1,
+      is_completed: false,
+      sections: Array.from({ length: 8 }, (_, sectionIndex) => ({
+        section_number: sectionIndex + 1,
+        date: new Date(Date.now() + sectionIndex * 24 * 60 * 60 * 1000).toISOString().split('T')[0],
+        exercises: Array.from({ length: 6 }, (_, exerciseIndex) => ({
+          workout_category_id: 1, // Default to first category
+          specific_workout_id: 1, // Default to first exercise
+          sets: '',
+          reps: '',
+          weight: '',
+          completed: false,
+          order: exerciseIndex + 1
+        }))
+      }))
     }
-  };
+  ];
 
   const handleAthleteSelect = async (athlete: User) => {
     setSelectedAthlete(athlete);
@@ -256,14 +224,75 @@ const SweatSheetManager: React.FC = () => {
     return exercises;
   };
 
+  // Tree patches are sent one at a time so each names the version the previous one produced
+  const patchSweatSheet = (operations: any[]) => {
+    const sweatSheetId = sweatSheet?.id;
+    if (!sweatSheetId) return Promise.resolve(null);
+
+    const request = patchQueue.current.then(async () => {
+      try {
+        const response = await sweatSheetApi.patchSweatSheet(sweatSheetId, sweatSheetVersion.current, operations);
+        sweatSheetVersion.current = response.data.version;
+        if (Object.keys(response.data.replaced).length && selectedAthlete) {
+          // The athlete's copy of a template got its own tree, so ids changed
+          await loadAthleteSweatSheet(selectedAthlete.id);
+        }
+        return response.data;
+      } catch (error: any) {
+        if (error.response?.status === 409 && selectedAthlete) {
+          // Someone else changed the SweatSheet, start again from the latest copy
+          await loadAthleteSweatSheet(selectedAthlete.id);
+        }
+        throw error;
+      }
+    });
+    patchQueue.current = request.catch(() => undefined);
+    return request;
+  };
+
+  const updateLocalExercises = (update: (exercises: Exercise[]) => Exercise[]) => {
+    setSweatSheet(prev => prev && {
+      ...prev,
+      phases: prev.phases.map(phase => ({
+        ...phase,
+        sections: phase.sections.map(section => ({ ...section, exercises: update(section.exercises) }))
+      }))
+    });
+  };
+
   const updateExercise = async (exerciseId: number, field: string, value: string | boolean) => {
     try {
-      // This would need a proper update API endpoint
       console.log('Updating exercise:', exerciseId, field, value);
-      // For now, we'll just reload the SweatSheet
-      if (selectedAthlete) {
-        await loadAthleteSweatSheet(selectedAthlete.id);
+      if (field === 'workout_category') {
+        // Saved once a workout from the new category is picked
+        const category = workoutCategories.find(cat => cat.name === value);
+        updateLocalExercises(exercises => exercises.map(exercise =>
+          exercise.id === exerciseId
+            ? { ...exercise, workout_category: category, specific_workout: undefined as any }
+            : exercise
+        ));
+        return;
       }
+
+      if (field === 'specific_workout') {
+        const workout = workoutExercises.find(w => w.name === value);
+        if (!workout) return;
+        updateLocalExercises(exercises => exercises.map(exercise =>
+          exercise.id === exerciseId ? { ...exercise, specific_workout: workout } : exercise
+        ));
+        await patchSweatSheet([{
+          op: 'update',
+          type: 'exercise',
+          id: exerciseId,
+          data: { workout_category_id: workout.category.id, specific_workout_id: workout.id }
+        }]);
+        return;
+      }
+
+      updateLocalExercises(exercises => exercises.map(exercise =>
+        exercise.id === exerciseId ? { ...exercise, [field]: value } : exercise
+      ));
+      await patchSweatSheet([{ op: 'update', type: 'exercise', id: exerciseId, data: { [field]: value } }]);
     } catch (error) {
       console.error('Error updating exercise:', error);
     }
@@ -271,17 +300,19 @@ const SweatSheetManager: React.FC = () => {
 
   const addExercise = async (sectionId: number) => {
     try {
-      const exerciseData = {
-        workout_category_id: 1,
-        specific_workout_id: 1,
-        sets: '',
-        reps: '',
-        weight: '',
-        completed: false,
-        order: 1
-      };
-      
-      await sweatSheetApi.createExercise(sectionId, exerciseData);
+      await patchSweatSheet([{
+        op: 'add',
+        type: 'exercise',
+        parent: sectionId,
+        data: {
+          workout_category_id: 1,
+          specific_workout_id: 1,
+          sets: '',
+          reps: '',
+          weight: '',
+          completed: false
+        }
+      }]);
       
       // Reload the SweatSheet
       if (selectedAthlete) {
@@ -294,12 +325,9 @@ const SweatSheetManager: React.FC = () => {
 
   const removeExercise = async (exerciseId: number) => {
     try {
-      // This would need a proper delete API endpoint
       console.log('Removing exercise:', exerciseId);
-      // For now, we'll just reload the SweatSheet
-      if (selectedAthlete) {
-        await loadAthleteSweatSheet(selectedAthlete.id);
-      }
+      await patchSweatSheet([{ op: 'delete', type: 'exercise', id: exerciseId }]);
+      updateLocalExercises(exercises => exercises.filter(exercise => exercise.id !== exerciseId));
     } catch (error) {
       console.error('Error removing exercise:', error);
     }